@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+from threading import Lock
+
+# Seconds GitHub or GitLab are asked to wait before sending a hook again
+DEFAULT_RETRY_AFTER = 30
+
+EVENTS = 'events'
+QUEUED = 'queued'
+ACTIONS = 'actions'
+
+
+class AdmissionControl(object):
+    """
+    Limits on the work the listener takes, so a burst of hooks can't start
+    more than the host can run.
+
+    The limits are on the events being run (`max_events`), the events
+    accepted and waiting to run (`max_queued`) and the actions and hooks
+    submitted to the pools and not finished (`max_actions`). A limit set to
+    None is not checked. The current `usage` of each one is given by a
+    callable.
+
+    Admitting an event with `check` also reserves room for it until
+    `release`, once it's counted by the usage (queued) or done (run by the
+    listener, which the usage doesn't count), so concurrent requests can't
+    all take the last room.
+    """
+    def __init__(self, usage, max_events=None, max_queued=None,
+                 max_actions=None, retry_after=DEFAULT_RETRY_AFTER):
+        """
+        :param usage: Returns the events running, the events queued and the
+            actions in flight, as a dictionary
+            :type: Callable
+        :param retry_after: Seconds to wait before sending again a rejected
+            hook
+        """
+        self.usage = usage
+        self.limits = {
+            EVENTS: max_events,
+            QUEUED: max_queued,
+            ACTIONS: max_actions
+        }
+        self.retry_after = int(retry_after)
+        self.rejected = 0
+        self.spilled = 0
+        self._lock = Lock()
+        # Events admitted but not counted by the usage yet
+        self._reserved = {EVENTS: 0, QUEUED: 0}
+
+    def current(self):
+        """
+        :return: Usage of each limit
+        :rtype: Dict
+        """
+        with self._lock:
+            return self._current()
+
+    def _current(self):
+        usage = dict(self.usage())
+        for name, reserved in self._reserved.items():
+            usage[name] = usage.get(name, 0) + reserved
+        return usage
+
+    def pressure(self, usage=None):
+        """
+        :return: Usage of the most used limit, as a ratio (1.0 is full)
+        :rtype: Float
+        """
+        usage = usage or self.current()
+        ratios = [
+            float(usage.get(name, 0)) / limit
+            for name, limit in self.limits.items() if limit
+        ]
+        return max(ratios) if ratios else 0.0
+
+    def reached(self, usage=None):
+        """
+        :return: Name of the first limit reached, or None if there's room
+            for another event
+        :rtype: String
+        """
+        usage = usage or self.current()
+        for name in (EVENTS, QUEUED, ACTIONS):
+            limit = self.limits[name]
+            if limit and usage.get(name, 0) >= limit:
+                return name
+        return None
+
+    def check(self, reserve=EVENTS):
+        """
+        Check the limits and, if there's room, reserve it for the event
+        :param reserve: Usage the event counts on once accepted: EVENTS if
+            run by the listener, QUEUED if queued on the dispatcher
+        :return: Name of the first limit reached, or None if the event is
+            admitted (then it must be released)
+        :rtype: String
+        """
+        with self._lock:
+            full = self.reached(self._current())
+            if full is None:
+                self._reserved[reserve] += 1
+        return full
+
+    def release(self, reserve=EVENTS):
+        """
+        Free the room reserved by check, once the event is counted by the
+        usage or not accepted after all
+        """
+        with self._lock:
+            self._reserved[reserve] -= 1
+
+    def reject(self, spilled=False):
+        with self._lock:
+            if spilled:
+                self.spilled += 1
+            else:
+                self.rejected += 1
+
+    def stats(self):
+        usage = self.current()
+        return {
+            'limits': dict(self.limits),
+            'usage': usage,
+            'pressure': self.pressure(usage),
+            'rejected': self.rejected,
+            'spilled': self.spilled,
+            'retry_after': self.retry_after
+        }
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+from osconf import config_from_environment
+from urlparse import urlparse
+from threading import Lock
+from time import time
+import requests
+import logging
+import atexit
+import os
+
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_TIMEOUT = 10
+DEFAULT_POOL_SIZE = 10
+
+
+class ApiClient(object):
+    """
+    HTTP client for the GitHub and GitLab APIs.
+
+    Requests go through a single session, which keeps a pool of keep-alive
+    connections for each host. Failed connections and 5XX responses are
+    retried with an exponential backoff (only connection errors for methods
+    that are not idempotent, like POST), and every request gets a timeout.
+    The latency of the requests is kept per method and host, shown on
+    `GET /stats` for the client of the listener and logged when the process
+    of any other client exits.
+    """
+    def __init__(self, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF,
+                 timeout=DEFAULT_TIMEOUT, pool_size=DEFAULT_POOL_SIZE):
+        """
+        :param retries: Times a failed request is retried
+        :param backoff: Backoff factor between retries, in seconds
+        :param timeout: Timeout for the requests without one, in seconds
+        :param pool_size: Connections kept alive for each host
+        """
+        self.timeout = float(timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=int(pool_size),
+            pool_maxsize=int(pool_size),
+            max_retries=Retry(
+                total=int(retries),
+                backoff_factor=float(backoff),
+                status_forcelist=(500, 502, 503, 504),
+                raise_on_status=False
+            )
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._lock = Lock()
+        self._metrics = {}
+
+    def request(self, method, url, **kwargs):
+        """
+        Same as requests.request, through the pooled session
+        :rtype: requests.Response
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        start = time()
+        failed = True
+        try:
+            response = self.session.request(method, url, **kwargs)
+            failed = False
+            return response
+        finally:
+            self._record(method, urlparse(url).netloc, time() - start, failed)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def _record(self, method, host, latency, failed):
+        key = '{} {}'.format(method, host)
+        with self._lock:
+            metric = self._metrics.setdefault(key, {
+                'requests': 0, 'errors': 0, 'total_time': 0.0, 'max_time': 0.0
+            })
+            metric['requests'] += 1
+            metric['errors'] += int(failed)
+            metric['total_time'] += latency
+            metric['max_time'] = max(metric['max_time'], latency)
+
+    def metrics(self):
+        """
+        :return: Requests, errors and latency (total and max, in seconds)
+            for each method and host
+        :rtype: Dict
+        """
+        with self._lock:
+            return dict(
+                (key, dict(metric)) for key, metric in self._metrics.items()
+            )
+
+
+_clients = {}
+_clients_lock = Lock()
+
+
+def get_client():
+    """
+    :return: The API client of this process, configured with
+        $HOOKSHUB_HTTP_RETRIES, $HOOKSHUB_HTTP_BACKOFF, $HOOKSHUB_HTTP_TIMEOUT
+        and $HOOKSHUB_HTTP_POOL_SIZE. Connections can't be shared with forked
+        processes, so each process gets its own client.
+    :rtype: ApiClient
+    """
+    pid = os.getpid()
+    with _clients_lock:
+        if pid not in _clients:
+            conf = config_from_environment(
+                'HOOKSHUB',
+                http_retries=DEFAULT_RETRIES,
+                http_backoff=DEFAULT_BACKOFF,
+                http_timeout=DEFAULT_TIMEOUT,
+                http_pool_size=DEFAULT_POOL_SIZE
+            )
+            _clients.clear()
+            _clients[pid] = ApiClient(
+                retries=conf['http_retries'],
+                backoff=conf['http_backoff'],
+                timeout=conf['http_timeout'],
+                pool_size=conf['http_pool_size']
+            )
+        return _clients[pid]
+
+
+def client_metrics():
+    """
+    :return: The metrics of the API client of this process, empty if it has
+        not made any request
+    :rtype: Dict
+    """
+    client = _clients.get(os.getpid())
+    return client.metrics() if client else {}
+
+
+def log_metrics():
+    """
+    Log the metrics of the API client of this process, if it made any request.
+    Installed to run at exit, as most requests are made from the actions.
+    """
+    logger = logging.getLogger(__name__)
+    for key, metric in sorted(client_metrics().items()):
+        logger.info(
+            '{}: {} requests, {} errors, {:.3f}s average, {:.3f}s max'.format(
+                key, metric['requests'], metric['errors'],
+                metric['total_time'] / metric['requests'], metric['max_time']
+            )
+        )
+
+
+atexit.register(log_metrics)
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+from collections import Mapping
+from copy import deepcopy
+from threading import Thread, Event, Lock
+from os.path import getmtime
+from json import loads
+from osconf import config_from_environment, RequiredException
+import logging
+
+# Seconds between checks of the config file for changes, 0 to not check it
+DEFAULT_WATCH_INTERVAL = 5
+
+# Values taken from $HOOKSHUB_<NAME> too, and required by actions and hooks
+ENVIRONMENT = [
+    'github_token', 'gitlab_token', 'vhost_path', 'nginx_port',
+    'action_timeout'
+]
+ACTIONS_DEFAULTS = {'nginx_port': '80', 'action_timeout': '30'}
+HOOKS_DEFAULTS = {'nginx_port': '80', 'action_timeout': '10'}
+
+
+def from_environment(values, defaults):
+    """
+    :return: The values, with the defaults they miss and the ones set on
+        the environment, and the error if a required one is not set
+    :rtype: Tuple<Dict,RequiredException>
+    """
+    conf = dict(defaults)
+    conf.update(values)
+    try:
+        return config_from_environment('HOOKSHUB', ENVIRONMENT, **conf), None
+    except RequiredException as err:
+        return conf, err
+
+
+class Config(Mapping):
+    """
+    Read-only snapshot of the config of the listener.
+
+    Everything a request needs is resolved when the snapshot is made: the
+    values for the actions and the hooks (with their defaults and the
+    environment) and the config of each repository, with the overrides set
+    for it on `repositories`. So serving a request doesn't read the file or
+    the environment, and all of it sees the same config even if reloaded
+    meanwhile.
+    """
+    def __init__(self, values, repositories=True):
+        """
+        :param values: Config as read from the file
+        :param repositories: Resolve the overrides of the repositories
+        """
+        self._values = deepcopy(dict(values))
+        self._actions = from_environment(self._values, ACTIONS_DEFAULTS)
+        self._hooks = from_environment(self._values, HOOKS_DEFAULTS)
+        self._repositories = {}
+        if repositories:
+            for name, overrides in self._values.get(
+                    'repositories', {}).items():
+                merged = dict(self._values)
+                merged.update(overrides)
+                self._repositories[name] = Config(merged, False)
+
+    @staticmethod
+    def of(conf):
+        """
+        :return: The config as a snapshot, the same one if it already is
+        :rtype: Config
+        """
+        return conf if isinstance(conf, Config) else Config(conf)
+
+    def __getitem__(self, key):
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    @staticmethod
+    def _resolved(resolved):
+        conf, err = resolved
+        if err is not None:
+            raise err
+        return dict(conf)
+
+    @property
+    def actions(self):
+        """
+        :return: Config for the actions
+        :rtype: Dict
+        :raises RequiredException: If a required value is not set
+        """
+        return self._resolved(self._actions)
+
+    @property
+    def hooks(self):
+        """
+        :return: Config for the hooks
+        :rtype: Dict
+        :raises RequiredException: If a required value is not set
+        """
+        return self._resolved(self._hooks)
+
+    def repository(self, name):
+        """
+        :param name: Name of the repository of the event
+        :return: The config with the overrides of the repository, this one
+            if there are none
+        :rtype: Config
+        """
+        return self._repositories.get(name, self)
+
+
+class ConfigFile(object):
+    """
+    The config file of the listener, as a snapshot swapped as a whole when
+    the file is loaded again: on `reload` (the SIGHUP handler of the
+    listener) or when `watch` sees the file changed.
+
+    A file that can't be read or decoded is logged and the snapshot in use
+    is kept. Only the values read while serving the requests are taken
+    again, the pools, journal and servers use the config they started with.
+    """
+    def __init__(self, path, defaults=None):
+        """
+        :param path: Path of the JSON config file. With no file, the config
+            has only the defaults.
+        :param defaults: Values used when the file has none for them
+            :type: Dict
+        """
+        self.path = path
+        self.defaults = dict(defaults or {})
+        self.logger = logging.getLogger(__name__)
+        self.reloads = 0
+        self._lock = Lock()
+        self._current = None
+        self._mtime = None
+        self._stop = Event()
+        self._watcher = None
+
+    @property
+    def current(self):
+        """
+        :return: The snapshot in use, loaded the first time it's needed
+        :rtype: Config
+        """
+        current = self._current
+        if current is None:
+            current = self.load()
+        return current
+
+    def _mtime_of(self):
+        try:
+            return getmtime(self.path)
+        except OSError:
+            return None
+
+    def _read(self):
+        mtime = self._mtime_of()
+        if mtime is None:
+            values = {}
+        else:
+            with open(self.path, 'r') as cfg:
+                values = loads(cfg.read())
+        for key, value in self.defaults.items():
+            if not values.get(key):
+                values[key] = value
+        return Config(values), mtime
+
+    def load(self):
+        """
+        Read the file and use it from now on
+        :return: The snapshot in use
+        :rtype: Config
+        """
+        with self._lock:
+            try:
+                snapshot, self._mtime = self._read()
+            except (IOError, ValueError) as err:
+                if self._current is None:
+                    raise
+                self.logger.error('Could not load the config {}: {}'.format(
+                    self.path, err
+                ))
+                return self._current
+            if self._current is not None:
+                self.reloads += 1
+            self._current = snapshot
+            return snapshot
+
+    def reload(self, signum=None, frame=None):
+        """
+        Load the file again. Installed as the SIGHUP handler of the listener.
+        """
+        self.logger.info('Reloading the config {}'.format(self.path))
+        self.load()
+
+    def changed(self):
+        """
+        :return: If the file changed since it was loaded
+        :rtype: Bool
+        """
+        return self._mtime_of() != self._mtime
+
+    def watch(self, interval=DEFAULT_WATCH_INTERVAL):
+        """
+        Load the file again when it changes, checking it every `interval`
+        seconds on a background thread
+        """
+        if not interval or self._watcher is not None:
+            return
+        self._stop.clear()
+
+        def check():
+            while not self._stop.wait(interval):
+                if self.changed():
+                    self.reload()
+        self._watcher = Thread(target=check, name='hookshub-config')
+        self._watcher.daemon = True
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+from threading import Timer, Lock
+import tempfile
+import signal
+import errno
+import os
+
+# Times the action_timeout an action runs before being asked to stop
+DEADLINE_FACTOR = 120
+# Seconds a stopped action has to exit before being killed (SIGKILL)
+KILL_GRACE = 60
+# Seconds an action runs before being asked to stop (SIGTERM), without an
+# action_timeout
+DEFAULT_SOFT_DEADLINE = 3600
+# Seconds an action runs before being killed (SIGKILL), without an
+# action_timeout
+DEFAULT_HARD_DEADLINE = DEFAULT_SOFT_DEADLINE + KILL_GRACE
+
+# How an action ended
+EXITED = 'exited'
+TERMINATED = 'terminated'
+KILLED = 'killed'
+
+
+def deadlines(conf):
+    """
+    :param conf: Config of the actions
+    :return: Soft and hard deadlines of the actions: the ones configured
+        or, by default, DEADLINE_FACTOR times the `action_timeout` (3600
+        seconds for its default of 30) and KILL_GRACE seconds more
+    :rtype: Tuple<Float,Float>
+    """
+    timeout = float(conf.get('action_timeout') or 0)
+    default = timeout * DEADLINE_FACTOR if timeout else DEFAULT_SOFT_DEADLINE
+    soft = float(conf.get('action_soft_deadline', default) or 0)
+    hard = conf.get('action_hard_deadline', (soft or default) + KILL_GRACE)
+    return soft, float(hard or 0)
+
+
+def signal_group(pgid, signum):
+    """
+    Signal a process group, if it's still there
+    """
+    try:
+        os.killpg(pgid, signum)
+    except OSError as err:
+        if err.errno != errno.ESRCH:
+            raise
+
+
+class Deadline(object):
+    """
+    Soft and hard deadlines of an action running on its own process group
+    (its leader being the action).
+
+    At the soft deadline the whole group gets SIGTERM, to let the action
+    clean up, and at the hard deadline SIGKILL, so neither the action nor
+    anything it started keeps running (and its worker is free again). The
+    `state` tells how it ended. A deadline of 0 or None is not enforced.
+    """
+    def __init__(self, pgid, soft=DEFAULT_SOFT_DEADLINE,
+                 hard=DEFAULT_HARD_DEADLINE):
+        """
+        :param pgid: Process group of the action
+        :param soft: Seconds before sending SIGTERM
+        :param hard: Seconds before sending SIGKILL
+        """
+        self.pgid = pgid
+        self.soft = float(soft or 0)
+        self.hard = float(hard or 0)
+        self.state = EXITED
+        self._lock = Lock()
+        self._done = False
+        self._timers = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.cancel()
+
+    def start(self):
+        for seconds, signum, state in (
+                (self.soft, signal.SIGTERM, TERMINATED),
+                (self.hard, signal.SIGKILL, KILLED)):
+            if seconds > 0:
+                timer = Timer(seconds, self.expire, args=(signum, state))
+                timer.daemon = True
+                timer.start()
+                self._timers.append(timer)
+        return self
+
+    def expire(self, signum, state):
+        """
+        Signal the process group of the action, once past a deadline
+        """
+        with self._lock:
+            if self._done:
+                return
+            self.state = state
+            signal_group(self.pgid, signum)
+
+    def cancel(self):
+        """
+        Stop enforcing the deadlines, the action is done
+        """
+        with self._lock:
+            self._done = True
+        for timer in self._timers:
+            timer.cancel()
+        self._timers = []
+
+    @property
+    def expired(self):
+        return self.state != EXITED
+
+    def describe(self):
+        """
+        :return: How the action was stopped, for its log
+        :rtype: String
+        """
+        if self.state == TERMINATED:
+            return 'Terminated (SIGTERM) at its soft deadline of {}s'.format(
+                self.soft
+            )
+        if self.state == KILLED:
+            return 'Killed (SIGKILL) at its hard deadline of {}s'.format(
+                self.hard
+            )
+        return 'Exited'
+
+
+class ProcessGroups(object):
+    """
+    Process groups of the actions of an event, written to a file by the pool
+    workers as they start and end them, so the listener can stop the ones
+    still running (when a newer delivery supersedes the event).
+
+    Once stopped, the actions not started yet don't start, and the ones
+    starting stop right away.
+    """
+    def __init__(self, path):
+        """
+        :param path: File of the process groups
+        """
+        self.path = path
+
+    @staticmethod
+    def create(directory=None):
+        """
+        :param directory: Directory for the file
+        :rtype: ProcessGroups
+        """
+        fd, path = tempfile.mkstemp(
+            prefix='hookshub-', suffix='.groups', dir=directory
+        )
+        os.close(fd)
+        return ProcessGroups(path)
+
+    def _write(self, line):
+        # Lines appended at once, so workers can't mix them
+        with open(self.path, 'a') as groups:
+            groups.write('{}\n'.format(line))
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as groups:
+                return groups.read().splitlines()
+        except IOError:
+            return []
+
+    def started(self, pgid):
+        """
+        Record an action running on the process group
+        :return: If the actions of the event were stopped meanwhile
+        :rtype: Bool
+        """
+        self._write('+{}'.format(pgid))
+        return self.stopped
+
+    def ended(self, pgid):
+        self._write('-{}'.format(pgid))
+
+    @property
+    def stopped(self):
+        return 'stop' in self._read()
+
+    def running(self):
+        """
+        :return: Process groups of the actions still running
+        :rtype: List<Int>
+        """
+        running = []
+        for line in self._read():
+            if line.startswith('+'):
+                running.append(int(line[1:]))
+            elif line.startswith('-') and int(line[1:]) in running:
+                running.remove(int(line[1:]))
+        return running
+
+    def stop(self, grace=KILL_GRACE):
+        """
+        Stop the actions: SIGTERM to the process groups still running, and
+        SIGKILL to the ones still running after `grace` seconds
+        :return: Process groups signalled
+        :rtype: List<Int>
+        """
+        self._write('stop')
+        running = self.running()
+        for pgid in running:
+            signal_group(pgid, signal.SIGTERM)
+        if running and grace:
+            timer = Timer(grace, self.kill)
+            timer.daemon = True
+            timer.start()
+        return running
+
+    def kill(self):
+        for pgid in self.running():
+            signal_group(pgid, signal.SIGKILL)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import Lock
+from hashlib import sha1
+from time import time
+import fcntl
+import os
+
+# Seconds a delivery is remembered
+DEFAULT_TTL = 3600
+# Deliveries remembered at most
+DEFAULT_SIZE = 10000
+# Lines of the file not remembered anymore before it's written again
+COMPACT_THRESHOLD = 1000
+
+
+def delivery_key(headers, data):
+    """
+    :param headers: Headers of the request that delivered the hook
+    :param data: Raw payload of the request
+    :return: The delivery id sent by GitHub or GitLab, or a hash of the
+        payload if there's none
+    :rtype: String
+    """
+    return (
+        headers.get('X-GitHub-Delivery') or
+        headers.get('X-Gitlab-Event-UUID') or
+        'sha1:{}'.format(sha1(data or '').hexdigest())
+    )
+
+
+class DeliveryCache(object):
+    """
+    Deliveries received lately, to skip the ones GitHub or GitLab send again
+    (they do when the listener takes too long to answer).
+
+    A delivery is remembered for `ttl` seconds, and only the `size` most
+    recent ones are kept. With a `path`, the deliveries are also appended to
+    that file, and read back (without the expired ones) when created, so
+    they are remembered across restarts. The file is written again with only
+    the deliveries remembered once it has `compact` lines more than them.
+
+    The file can be shared by several processes (the workers of the
+    listener): it's locked (with flock, on a `.lock` file next to it) while
+    claiming or releasing a delivery, after reading what the others appended
+    meanwhile, and written again to a new file renamed over it, which the
+    others read again.
+    """
+    def __init__(self, ttl=DEFAULT_TTL, size=DEFAULT_SIZE, path=None,
+                 compact=COMPACT_THRESHOLD):
+        self.ttl = float(ttl)
+        self.size = int(size)
+        self.path = path
+        self.compact = int(compact)
+        self._lock = Lock()
+        self._seen = OrderedDict()
+        self._file = None
+        # Lines of the file, remembered or not
+        self._lines = 0
+        # Bytes of the file already read
+        self._offset = 0
+        if self.path:
+            with self._locked():
+                self._open()
+                # Written again with only the ones still remembered, so it
+                # doesn't grow forever
+                self._save()
+
+    @contextmanager
+    def _locked(self):
+        """
+        Lock the file for this process, if there's one
+        """
+        if not self.path:
+            yield
+            return
+        with open('{}.lock'.format(self.path), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _open(self):
+        """
+        Read the deliveries of the file from the start. Must be called
+        while holding the locks.
+        """
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self.path, 'a+')
+        self._seen.clear()
+        self._lines = 0
+        self._offset = 0
+        self._read()
+
+    def _read(self):
+        """
+        Read the deliveries appended to the file by other processes since
+        the last time, or the whole file if it was written again. Must be
+        called while holding the locks.
+        """
+        if self._file is None:
+            return
+        try:
+            replaced = os.stat(self.path).st_ino != \
+                os.fstat(self._file.fileno()).st_ino
+        except OSError:
+            replaced = True
+        if replaced:
+            return self._open()
+        now = time()
+        self._file.seek(self._offset)
+        for line in self._file.readlines():
+            self._lines += 1
+            try:
+                key, received = line.rsplit(' ', 1)
+                received = float(received)
+            except ValueError:
+                continue
+            self._seen.pop(key, None)
+            if now - received < self.ttl:
+                self._seen[key] = received
+        self._offset = self._file.tell()
+        self._trim()
+
+    def _save(self):
+        """
+        Write the file again with the deliveries remembered, to a new file
+        renamed over it, so the other processes reading it notice. Must be
+        called while holding the locks.
+        """
+        new_path = '{}.new'.format(self.path)
+        with open(new_path, 'w') as saved:
+            for key, received in self._seen.items():
+                saved.write('{} {}\n'.format(key, received))
+        os.rename(new_path, self.path)
+        self._file.close()
+        self._file = open(self.path, 'a+')
+        self._file.seek(0, os.SEEK_END)
+        self._offset = self._file.tell()
+        self._lines = len(self._seen)
+
+    def _trim(self):
+        while len(self._seen) > self.size:
+            self._seen.popitem(last=False)
+
+    def _append(self, key, received):
+        """
+        Write a reception to the file, and write the file again without the
+        deliveries not remembered once there are too many of them. Must be
+        called while holding the locks.
+        """
+        if self._file is None:
+            return
+        self._file.seek(0, os.SEEK_END)
+        self._file.write('{} {}\n'.format(key, received))
+        self._file.flush()
+        self._offset = self._file.tell()
+        self._lines += 1
+        if self._lines - len(self._seen) > self.compact:
+            now = time()
+            for key, received in self._seen.items():
+                if now - received >= self.ttl:
+                    del self._seen[key]
+            self._save()
+
+    def claim(self, key):
+        """
+        Remember a delivery unless it was already received
+        :param key: Id of the delivery (see delivery_key)
+        :return: True if the delivery is new, False if it's a duplicate
+        :rtype: Bool
+        """
+        now = time()
+        with self._lock, self._locked():
+            self._read()
+            received = self._seen.pop(key, None)
+            if received is not None and now - received < self.ttl:
+                # Keep the first reception, but as the most recently used
+                self._seen[key] = received
+                return False
+            self._seen[key] = now
+            self._trim()
+            self._append(key, now)
+        return True
+
+    def release(self, key):
+        """
+        Forget a delivery, so it's run again if received again (for the
+        deliveries that could not be processed)
+        """
+        with self._lock, self._locked():
+            self._read()
+            self._seen.pop(key, None)
+            # An expired reception, so it's ignored when loaded
+            self._append(key, 0)
+
+    def __contains__(self, key):
+        with self._lock:
+            received = self._seen.get(key)
+        return received is not None and time() - received < self.ttl
+
+    def __len__(self):
+        return len(self._seen)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,565 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict, deque
+from threading import Thread, Lock, Event, Timer, Condition
+from Queue import Queue
+from time import time
+from uuid import uuid4
+import logging
+
+DEFAULT_WORKERS = 2
+DEFAULT_HISTORY = 1000
+# Seconds a push waits before running, in case a newer one supersedes it
+DEFAULT_DEBOUNCE = 0
+# Priority class of the events not in any other class
+DEFAULT_CLASS = 'default'
+# Seconds between checks for room to queue the spilled deliveries
+DEFAULT_DRAIN_INTERVAL = 1
+# Seconds a stop waits for the deliveries running and waiting on their lanes
+DEFAULT_STOP_TIMEOUT = 10
+
+QUEUED = 'queued'
+RUNNING = 'running'
+# Answered, but with actions still running
+PENDING = 'pending'
+DONE = 'done'
+SUPERSEDED = 'superseded'
+CANCELLED = 'cancelled'
+SPILLED = 'spilled'
+
+
+def new_delivery_id(headers=None):
+    """
+    :param headers: Headers of the request that delivered the hook
+    :return: The delivery id sent by GitHub or GitLab, or a new one
+    :rtype: String
+    """
+    headers = headers or {}
+    return (
+        headers.get('X-GitHub-Delivery') or
+        headers.get('X-Gitlab-Event-UUID') or
+        uuid4().hex
+    )
+
+
+class Delivery(object):
+    """
+    A hook accepted by the listener, waiting to be (or being) processed
+    """
+    def __init__(self, delivery_id, event, payload, kind=None, ref=None,
+                 lane=None, key=None):
+        """
+        :param delivery_id: Id used to query the delivery afterwards
+        :param event: Event as received in the request headers
+        :param payload: Decoded payload of the hook
+        :param kind: Event decoded from the payload
+        :param ref: Repository and branch of a push, superseded by the next
+            push to the same ones
+        :param lane: Repository and branch of the delivery, run in the same
+            order they are received
+        :param key: Key of the delivery on the redelivery cache
+        """
+        self.id = delivery_id
+        self.event = event
+        self.payload = payload
+        self.kind = kind
+        self.ref = tuple(ref) if ref else None
+        self.lane = tuple(lane) if lane else None
+        self.key = key
+        self.priority = DEFAULT_CLASS
+        self.state = QUEUED
+        self.code = None
+        self.output = None
+        self.received = time()
+        self.started = None
+        self.finished = None
+        # Offset in the journal, if the dispatcher has one
+        self.offset = None
+        self.superseded_by = None
+        # Set to stop waiting for a running delivery
+        self.cancel = Event()
+        # Tasks still running once answered (see hookshub.parser.PendingTasks)
+        self.pending = []
+
+    def as_dict(self):
+        return {
+            'delivery': self.id,
+            'event': self.event,
+            'kind': self.kind,
+            'state': self.state,
+            'priority': self.priority,
+            'superseded_by': self.superseded_by,
+            'code': self.code,
+            'output': self.output,
+            'received': self.received,
+            'started': self.started,
+            'finished': self.finished
+        }
+
+
+class Dispatcher(object):
+    """
+    Runs the deliveries in background threads so the listener can answer as
+    soon as the hook is validated.
+
+    The `handler` does the actual work: it gets the event and the payload
+    of a delivery and returns a code and a log, like the listener does
+    on its synchronous path. The last `history` deliveries are kept to be
+    queried once they are done.
+
+    With a `journal`, every delivery is written to it before being queued and
+    acknowledged once run. Deliveries left in the journal by a previous run
+    are queued again when the dispatcher starts.
+
+    With `follow_pending`, the handler also gets a `pending` list, where it
+    adds the tasks still running when it returns (see PendingTasks on
+    hookshub.parser). The delivery is then `pending` until they are done,
+    and their result is added to its own.
+
+    Deliveries with a `ref` (pushes) are superseded by the next one with the
+    same ref: a superseded delivery still queued is skipped, and a running
+    or pending one is cancelled if `cancel_superseded` (the handler then gets
+    the `cancel` event of the delivery, and its pending tasks are stopped).
+    Pushes wait `debounce` seconds before being queued, so a burst of pushes
+    only runs the last one.
+
+    Deliveries with the same `lane` (repository and branch) run one at a
+    time, in the order they were queued, while deliveries of different lanes
+    run in parallel on the worker threads. A pending delivery keeps its
+    lane until its tasks are done.
+
+    Each priority class of `classes` (name: {'events': [...], 'workers': N})
+    gets its own queue and `workers` threads, so the events of a class never
+    wait behind the ones of another class. Events in no class use the
+    default class, with `workers` threads. With classes, the handler also
+    gets the `priority` class of the delivery.
+
+    When the listener is too busy, deliveries can be spilled to the journal
+    instead of queued: only their offset is kept in memory, and they are
+    queued while `capacity` tells there's room for them, checked when other
+    deliveries finish and every `drain_interval` seconds (so they also run
+    on an idle dispatcher).
+
+    The deliveries that fail (with an error or a non-zero code) are handed
+    to `failed`, for instance to run them again if they are redelivered.
+    """
+    def __init__(self, handler, workers=DEFAULT_WORKERS,
+                 history=DEFAULT_HISTORY, journal=None,
+                 debounce=DEFAULT_DEBOUNCE, cancel_superseded=False,
+                 classes=None, failed=None, capacity=None,
+                 drain_interval=DEFAULT_DRAIN_INTERVAL, follow_pending=False):
+        self.handler = handler
+        self.follow_pending = follow_pending
+        self.failed = failed
+        self.capacity = capacity
+        self.drain_interval = float(drain_interval)
+        self.workers = int(workers)
+        self.history = int(history)
+        self.journal = journal
+        self.debounce = float(debounce)
+        self.cancel_superseded = cancel_superseded
+        self.classes = dict(classes or {})
+        self.logger = logging.getLogger(__name__)
+        self.queue = Queue()
+        self._queues = {DEFAULT_CLASS: self.queue}
+        self._class_workers = {DEFAULT_CLASS: self.workers}
+        self._class_of = {}
+        for name, priority in self.classes.items():
+            if name != DEFAULT_CLASS:
+                self._queues[name] = Queue()
+            self._class_workers[name] = int(
+                priority.get('workers', DEFAULT_WORKERS))
+            for event in priority.get('events', []):
+                self._class_of[event] = name
+        self._lock = Lock()
+        # Notified when no lane has deliveries left
+        self._lanes_empty = Condition(self._lock)
+        self._deliveries = OrderedDict()
+        self._threads = []
+        # Last delivery of each ref, still queued or running
+        self._latest = {}
+        self._timers = set()
+        # Deliveries waiting for the one running on their lane
+        self._lanes = {}
+        # Deliveries only kept in the journal until there's room for them
+        self._spilled = deque()
+        self._drainer = None
+        self._stopped = Event()
+        # Set once stopping, to leave the queued deliveries to the journal
+        self._stopping = False
+
+    def start(self):
+        if self._threads:
+            return self
+        self._stopping = False
+        if self.journal is not None:
+            self.recover()
+        for name, queue in sorted(self._queues.items()):
+            for num in range(self._class_workers[name]):
+                thread = Thread(
+                    target=self._work, args=(queue, ),
+                    name='hookshub-dispatch-{}-{}'.format(name, num)
+                )
+                thread.daemon = True
+                thread.start()
+                self._threads.append((thread, queue))
+        if self.journal is not None and self.drain_interval > 0:
+            self._stopped.clear()
+            self._drainer = Thread(
+                target=self._drain, name='hookshub-dispatch-drain'
+            )
+            self._drainer.daemon = True
+            self._drainer.start()
+        return self
+
+    def stop(self, timeout=DEFAULT_STOP_TIMEOUT):
+        """
+        Stop the workers, waiting up to `timeout` seconds for the deliveries
+        they run. With a journal, the queued deliveries are left on it, to
+        run once started again. Without one, they are run first (also the
+        ones waiting on their lanes, as long as the timeout allows).
+        """
+        deadline = time() + float(timeout)
+        if self._drainer is not None:
+            self._stopped.set()
+            self._drainer.join()
+            self._drainer = None
+        with self._lock:
+            timers, self._timers = self._timers, set()
+        for timer in timers:
+            timer.cancel()
+        with self._lock:
+            self._stopping = self.journal is not None
+            # Deliveries waiting on their lane are not in the queue yet
+            while self._lanes and self._threads and not self._stopping:
+                left = deadline - time()
+                if left <= 0:
+                    break
+                self._lanes_empty.wait(left)
+        for thread, queue in self._threads:
+            queue.put(None)
+        for thread, queue in self._threads:
+            # Left running (as daemons) past the timeout
+            thread.join(max(deadline - time(), 0))
+        self._threads = []
+
+    def recover(self):
+        """
+        Queue the deliveries of the journal that were not run yet
+        :return: Number of deliveries queued
+        :rtype: Int
+        """
+        recovered = 0
+        for offset, record in self.journal.pending():
+            delivery = Delivery(
+                record['id'], record['event'], record['payload'],
+                record.get('kind'), record.get('ref'), record.get('lane'),
+                record.get('key')
+            )
+            delivery.offset = offset
+            self._queue(delivery)
+            recovered += 1
+        if recovered:
+            self.logger.info(
+                'Recovered {} deliveries from the journal'.format(recovered)
+            )
+        return recovered
+
+    def submit(self, delivery_id, event, payload, kind=None, ref=None,
+               lane=None, key=None):
+        """
+        Queue a delivery to be run by the dispatcher workers, after the
+        deliveries of its lane still spilled
+        :rtype: Delivery
+        """
+        if lane is not None:
+            while self._spilled and self._refill(lane) is not None:
+                pass
+        delivery = Delivery(delivery_id, event, payload, kind, ref, lane, key)
+        if self.journal is not None:
+            delivery.offset = self.journal.append({
+                'id': delivery_id, 'event': event, 'payload': payload,
+                'kind': kind, 'ref': ref, 'lane': lane, 'key': key
+            })
+        return self._queue(delivery)
+
+    def priority_of(self, delivery):
+        """
+        :return: Priority class of the delivery, from its decoded event or
+            the one in the headers
+        :rtype: String
+        """
+        return self._class_of.get(
+            delivery.kind, self._class_of.get(delivery.event, DEFAULT_CLASS)
+        )
+
+    def spill(self, delivery_id, event, payload, kind=None, ref=None,
+              lane=None, key=None):
+        """
+        Keep a delivery in the journal, to be queued once others finish.
+        Needs a journal.
+        :rtype: Delivery
+        """
+        delivery = Delivery(delivery_id, event, None, kind, ref, lane, key)
+        delivery.state = SPILLED
+        delivery.offset = self.journal.append({
+            'id': delivery_id, 'event': event, 'payload': payload,
+            'kind': kind, 'ref': ref, 'lane': lane, 'key': key
+        })
+        with self._lock:
+            self._remember(delivery)
+            self._spilled.append(delivery)
+        return delivery
+
+    def _refill(self, lane=None):
+        """
+        Queue the oldest spilled delivery (of the lane, if given), reading
+        its payload back from the journal
+        """
+        with self._lock:
+            for delivery in self._spilled:
+                if lane is None or delivery.lane == lane:
+                    break
+            else:
+                return None
+            self._spilled.remove(delivery)
+        delivery.payload = self.journal.get(delivery.offset)['payload']
+        delivery.state = QUEUED
+        return self._queue(delivery)
+
+    def drain(self):
+        """
+        Queue the spilled deliveries while there's room for them
+        :return: Number of deliveries queued
+        :rtype: Int
+        """
+        drained = 0
+        while self._spilled and (self.capacity is None or self.capacity()):
+            if self._refill() is None:
+                break
+            drained += 1
+        return drained
+
+    def _drain(self):
+        while not self._stopped.wait(self.drain_interval):
+            try:
+                self.drain()
+            except Exception:
+                self.logger.exception(
+                    'Could not queue the spilled deliveries'
+                )
+
+    def _remember(self, delivery):
+        """
+        Keep the delivery in the history. Must be called while holding the
+        lock.
+        """
+        self._deliveries[delivery.id] = delivery
+        while len(self._deliveries) > self.history:
+            self._deliveries.popitem(last=False)
+
+    def _queue(self, delivery):
+        delivery.priority = self.priority_of(delivery)
+        with self._lock:
+            self._remember(delivery)
+            if delivery.ref is not None:
+                previous = self._latest.get(delivery.ref)
+                if previous is not None:
+                    self._supersede(previous, delivery)
+                self._latest[delivery.ref] = delivery
+        if delivery.ref is not None and self.debounce > 0:
+            timer = Timer(self.debounce, self._release, (delivery, ))
+            timer.daemon = True
+            with self._lock:
+                self._timers.add(timer)
+            timer.start()
+        else:
+            self._schedule(delivery)
+        return delivery
+
+    def _release(self, delivery):
+        """
+        Queue a delivery once its debounce window is over
+        """
+        with self._lock:
+            self._timers = set(t for t in self._timers if t.is_alive())
+        self._schedule(delivery)
+
+    def _schedule(self, delivery):
+        """
+        Hand a delivery to the workers, or keep it on its lane while another
+        delivery of the lane is queued or running
+        """
+        if delivery.lane is not None:
+            with self._lock:
+                waiting = self._lanes.get(delivery.lane)
+                if waiting is not None:
+                    waiting.append(delivery)
+                    return
+                self._lanes[delivery.lane] = deque()
+        self._queues[delivery.priority].put(delivery)
+
+    def _next_on_lane(self, delivery):
+        """
+        Hand the next delivery of the lane to the workers, once the given
+        one is done
+        """
+        if delivery.lane is None:
+            return
+        with self._lock:
+            waiting = self._lanes.get(delivery.lane)
+            if waiting is None:
+                return
+            if not waiting:
+                del self._lanes[delivery.lane]
+                if not self._lanes:
+                    self._lanes_empty.notify_all()
+                return
+            following = waiting.popleft()
+        self._queues[following.priority].put(following)
+
+    def _supersede(self, previous, delivery):
+        """
+        Mark a delivery as superseded by a newer one. Must be called while
+        holding the lock.
+        """
+        previous.superseded_by = delivery.id
+        if previous.state in (RUNNING, PENDING) and self.cancel_superseded:
+            self.logger.info('[{}]: Cancelled, superseded by {}'.format(
+                previous.id, delivery.id
+            ))
+            previous.cancel.set()
+            for pending in previous.pending:
+                pending.terminate()
+
+    def get(self, delivery_id):
+        """
+        :return: The delivery with the given id if it's still in the history
+        :rtype: Delivery
+        """
+        with self._lock:
+            return self._deliveries.get(delivery_id)
+
+    def stats(self):
+        with self._lock:
+            states = [d.state for d in self._deliveries.values()]
+        return {
+            'workers': len(self._threads),
+            'queued': states.count(QUEUED),
+            'running': states.count(RUNNING),
+            'pending': states.count(PENDING),
+            'done': states.count(DONE),
+            'superseded': states.count(SUPERSEDED),
+            'cancelled': states.count(CANCELLED),
+            'spilled': len(self._spilled),
+            'lanes': len(self._lanes),
+            'classes': dict(
+                (name, {
+                    'workers': self._class_workers[name],
+                    'queued': queue.qsize()
+                }) for name, queue in self._queues.items()
+            ),
+            'journal': self.journal.stats() if self.journal else None
+        }
+
+    def run(self, delivery):
+        with self._lock:
+            superseded = delivery.superseded_by is not None
+            if not superseded:
+                delivery.state = RUNNING
+                delivery.started = time()
+        if superseded:
+            return self.skip(delivery)
+        kwargs = {}
+        if self.cancel_superseded:
+            kwargs['cancel'] = delivery.cancel
+        if self.classes:
+            kwargs['priority'] = delivery.priority
+        if self.follow_pending:
+            kwargs['pending'] = delivery.pending
+        try:
+            delivery.code, delivery.output = self.handler(
+                delivery.event, delivery.payload, **kwargs
+            )
+        except Exception as err:
+            self.logger.exception(
+                'Delivery {} failed to run'.format(delivery.id)
+            )
+            delivery.code = -1
+            delivery.output = 'Internal Server Error\n{}'.format(err)
+        if not all(pending.ready() for pending in delivery.pending):
+            with self._lock:
+                delivery.state = PENDING
+            # Superseded while answering, after the handler stopped waiting
+            if delivery.cancel.is_set():
+                for pending in delivery.pending:
+                    pending.terminate()
+            # Its lane is kept until the tasks are done
+            thread = Thread(
+                target=self.finish, args=(delivery, ),
+                name='hookshub-dispatch-pending-{}'.format(delivery.id)
+            )
+            thread.daemon = True
+            thread.start()
+            return delivery
+        return self.finish(delivery)
+
+    def finish(self, delivery):
+        """
+        Complete a delivery once the tasks it left running are done, with
+        their result
+        """
+        for pending in delivery.pending:
+            code, output = pending.result()
+            if code:
+                delivery.code = code
+            if output:
+                delivery.output = '{}\nDone after answering:\n{}'.format(
+                    delivery.output, output
+                )
+        delivery.pending = []
+        delivery.finished = time()
+        delivery.state = CANCELLED if delivery.cancel.is_set() else DONE
+        self._done(delivery)
+        if delivery.code and delivery.state == DONE and self.failed:
+            self.failed(delivery)
+        self.logger.info('[{}]: {} with {} on {} ({:.3f}s)'.format(
+            delivery.id, 'Fail' if delivery.code else 'Success',
+            delivery.code, delivery.event,
+            delivery.finished - delivery.started
+        ))
+        return delivery
+
+    def skip(self, delivery):
+        """
+        Finish a superseded delivery without running it
+        """
+        delivery.finished = time()
+        delivery.state = SUPERSEDED
+        delivery.code = 0
+        delivery.output = 'Superseded by {}'.format(delivery.superseded_by)
+        self._done(delivery)
+        self.logger.info('[{}]: Superseded by {} on {}'.format(
+            delivery.id, delivery.superseded_by, delivery.event
+        ))
+        return delivery
+
+    def _done(self, delivery):
+        if self.journal is not None and delivery.offset is not None:
+            self.journal.ack(delivery.offset)
+        with self._lock:
+            if self._latest.get(delivery.ref) is delivery:
+                del self._latest[delivery.ref]
+        # Only the result is kept in the history
+        delivery.payload = None
+        self._next_on_lane(delivery)
+        self.drain()
+
+    def _work(self, queue):
+        while True:
+            delivery = queue.get()
+            if delivery is None:
+                break
+            if self._stopping:
+                # Still on the journal
+                continue
+            self.run(delivery)
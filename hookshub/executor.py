@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+from multiprocessing import Pool
+from multiprocessing.pool import RUN
+from threading import Lock
+import logging
+
+DEFAULT_MAX_TASKS = 50
+
+
+class Executor(object):
+    """
+    Long-lived pool of worker processes shared by all the deliveries served by
+    the listener.
+
+    The pool is started once and every HookParser submits its actions and
+    hooks to it instead of forking a new Pool per request. Workers are
+    recycled after running `max_tasks` tasks, so a leaking action or hook
+    can't keep growing a worker forever.
+    """
+    def __init__(self, processes, max_tasks=DEFAULT_MAX_TASKS):
+        """
+        :param processes: Number of worker processes of the pool
+            :type: Int
+        :param max_tasks: Tasks a worker runs before being replaced by a
+            fresh one. With 0 or None workers live as long as the pool.
+            :type: Int
+        """
+        self.processes = int(processes)
+        self.max_tasks = int(max_tasks or 0) or None
+        self.logger = logging.getLogger(__name__)
+        self._lock = Lock()
+        self._pool = None
+        self._pending = []
+        self._submitted = 0
+        self._restarts = 0
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = Pool(
+                    processes=self.processes, maxtasksperchild=self.max_tasks
+                )
+        return self
+
+    def stop(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+            self._pending = []
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    @property
+    def started(self):
+        return self._pool is not None
+
+    @property
+    def workers(self):
+        """
+        :return: Worker processes of the pool that are still alive
+        :rtype: List<Process>
+        """
+        if self._pool is None:
+            return []
+        return [proc for proc in self._pool._pool if proc.is_alive()]
+
+    def is_healthy(self):
+        """
+        The pool is healthy while it accepts tasks and its handler threads
+        are alive. Dead workers are replaced by the pool itself.
+        :rtype: Bool
+        """
+        pool = self._pool
+        if pool is None or pool._state != RUN:
+            return False
+        return all([
+            pool._worker_handler.is_alive(),
+            pool._task_handler.is_alive(),
+            pool._result_handler.is_alive()
+        ])
+
+    def check_health(self):
+        """
+        Restart the pool when it is not healthy anymore. Tasks submitted to
+        the broken pool are lost, as nothing would ever collect them.
+        :return: True if the pool was healthy, False if it was restarted
+        :rtype: Bool
+        """
+        if self.is_healthy():
+            return True
+        self.logger.error('Executor pool is not healthy, restarting it')
+        with self._lock:
+            pool, self._pool = self._pool, None
+            self._pending = []
+            self._restarts += 1
+        if pool is not None:
+            pool.terminate()
+        self.start()
+        return False
+
+    def apply_async(self, func, args=(), kwds=None, callback=None):
+        """
+        Submit a task to the shared pool, same interface as Pool.apply_async
+        :rtype: AsyncResult
+        """
+        self.check_health()
+        result = self._pool.apply_async(
+            func, args=args, kwds=kwds or {}, callback=callback
+        )
+        with self._lock:
+            self._pending = [r for r in self._pending if not r.ready()]
+            self._pending.append(result)
+            self._submitted += 1
+        return result
+
+    def close(self):
+        """
+        HookParser closes the pools it uses when it's done with them, but the
+        shared pool must outlive every request.
+        """
+        pass
+
+    def in_flight(self):
+        """
+        :return: Tasks submitted and not finished yet, running or queued
+        :rtype: Int
+        """
+        with self._lock:
+            self._pending = [r for r in self._pending if not r.ready()]
+            return len(self._pending)
+
+    def stats(self):
+        """
+        :return: Pool size, queue depth and utilization of the executor
+        :rtype: Dict
+        """
+        pending = self.in_flight()
+        running = min(pending, self.processes)
+        return {
+            'processes': self.processes,
+            'workers': len(self.workers),
+            'max_tasks_per_worker': self.max_tasks,
+            'healthy': self.is_healthy(),
+            'restarts': self._restarts,
+            'submitted': self._submitted,
+            'running': running,
+            'queued': pending - running,
+            'utilization': (
+                float(running) / self.processes if self.processes else 0.0
+            )
+        }
@@ -1,3 +1,4 @@
+from threading import Lock
 import logging
 
 
@@ -89,7 +90,8 @@ class Hook(object):
 # Using Hooks Manager (hookshub.plugins) a hook may be disabled or enabled
 #
 # With "reload_hooks()" the hooks are reloaded with no need to
-# restart the service
+# restart the service. It only scans the entry points again when the
+# installed distributions change, "reload_hooks(force=True)" always does.
 #
 # "get_hooks()" must return all hooks loaded
 #
@@ -97,29 +99,55 @@ class Hook(object):
 
 def get_hooks(event=False, repository=False, branch=False):
     from hookshub.plugins import plugins
-    results = []
-    hooks = plugins.get_hooks()
-    for hook in hooks:
-        if event and hook.event:
-            ev = hook.event == event
-        else:
-            ev = True
-        if repository and hook.repository:
-            repo = hook.repository == repository
-        else:
-            repo = True
-        if branch and hook.branch:
-            br = hook.branch == branch
-        else:
-            br = True
-        if ev and repo and br:
-            results.append((hook.name, hook.hook))
-    return results
+    return [
+        (hook.name, hook.hook)
+        for hook in plugins.get_hooks(event, repository, branch)
+    ]
+
+
+def plugins_fingerprint():
+    """
+    Fingerprint of the installed distributions. Installing, upgrading or
+    removing a distribution changes the mtime of the sys.path entry that
+    holds its dist-info (or egg-info), so the plugins only need to be
+    scanned again when some of those mtimes (or sys.path) change.
+    :rtype: Int
+    """
+    from os.path import getmtime
+    import sys
+    entries = []
+    for entry in sys.path:
+        try:
+            entries.append((entry, getmtime(entry or '.')))
+        except OSError:
+            entries.append((entry, None))
+    return hash(tuple(entries))
+
+
+_catalog = {'fingerprint': None}
+_catalog_lock = Lock()
+
+
+def reload_hooks(force=False):
+    """
+    Register the hooks installed as 'hookshub.plugins' entry points, only
+    when the installed distributions changed since the last scan.
+    :param force: Scan the entry points even if nothing changed
+    :return: True if the entry points were scanned
+    :rtype: Bool
+    """
+    with _catalog_lock:
+        fingerprint = plugins_fingerprint()
+        if not force and fingerprint == _catalog['fingerprint']:
+            return False
+        scan_plugins()
+        _catalog['fingerprint'] = fingerprint
+        return True
 
 
-# Reload Hooks cannot be tested truthfully without working environment, se we
+# Scan Plugins cannot be tested truthfully without working environment, se we
 #   don't test it.
-def reload_hooks():
+def scan_plugins():
     # Update working set before using it
     import imp
     import pkg_resources
@@ -2,7 +2,9 @@
 from json import dumps, loads
 from os.path import join, isfile, isdir
 from subprocess import Popen, PIPE
-from hookshub.hooks.webhook import webhook
+from hookshub.mirrors import MirrorCache
+from hookshub.client import get_client
+from hookshub.hooks.webhook import webhook, memoized_property
 
 import requests
 import os
@@ -13,16 +15,21 @@ import os
 
 class GitHubWebhook(webhook):
 
-    def __init__(self, data):
+    def __init__(self, data, event=None):
         """
         :param data: Data loaded from the JSON of the hook's
             payload served by GitHub
             :type: Dictionary
+        :param event: Event sent by GitHub on the X-GitHub-Event header. If
+            it's not a known event, it's decoded from the payload.
+            :type: String
         """
         super(GitHubWebhook, self).__init__(data)
         self.origin = 'github'
+        if event in GitHubUtil.known_events:
+            self._memo_event = event
 
-    @property
+    @memoized_property
     def ssh_url(self):
         """
         :return: Repository's ssh url
@@ -30,7 +37,7 @@ class GitHubWebhook(webhook):
         """
         return self.json['repository']['ssh_url']
 
-    @property
+    @memoized_property
     def http_url(self):
         """
         :return: Repository's http url
@@ -38,7 +45,7 @@ class GitHubWebhook(webhook):
         """
         return self.json['repository']['clone_url']
 
-    @property
+    @memoized_property
     def repo_name(self):
         """
         :return: Repository's name
@@ -46,7 +53,7 @@ class GitHubWebhook(webhook):
         """
         return self.json['repository']['name']
 
-    @property
+    @memoized_property
     def branch_name(self):
         """
         :return: Branch name used on the hook's event, it can be None
@@ -84,7 +91,7 @@ class GitHubWebhook(webhook):
             pass
         return branch
 
-    @property
+    @memoized_property
     def target_branch_name(self):
         """
         :return: TARGET branch name from a PR's hook
@@ -96,7 +103,7 @@ class GitHubWebhook(webhook):
             return self.json['pull_request']['base']['ref']
         return 'None'
 
-    @property
+    @memoized_property
     def status(self):
         """
         :return: State from the hook of an status event
@@ -106,7 +113,7 @@ class GitHubWebhook(webhook):
             return self.json['state']
         return 'None'
 
-    @property
+    @memoized_property
     def action(self):
         """
         :return: Action from the hook of a PR event
@@ -116,7 +123,7 @@ class GitHubWebhook(webhook):
             return self.json['action']
         return 'None'
 
-    @property
+    @memoized_property
     def number(self):
         """
         :return: Number (id) of the PR/Issue
@@ -135,7 +142,7 @@ class GitHubWebhook(webhook):
         else:
             return 'None'
 
-    @property
+    @memoized_property
     def repo_id(self):
         """
         :return: ID of the repository
@@ -143,7 +150,7 @@ class GitHubWebhook(webhook):
         """
         return self.json['repository']['id']
 
-    @property
+    @memoized_property
     def repo_full_name(self):
         """
         :return: Full name of the repository. It have the onwer name within it.
@@ -151,7 +158,7 @@ class GitHubWebhook(webhook):
         """
         return self.json['repository']['full_name']
 
-    @property
+    @memoized_property
     def merged(self):
         """
         From: https://developer.github.com/v3/activity/events/types/#pullrequestevent
@@ -164,7 +171,7 @@ class GitHubWebhook(webhook):
             return self.json['pull_request']['merged'] == True
         return False
 
-    @property
+    @memoized_property
     def closed(self):
         """
         From: https://developer.github.com/v3/activity/events/types/#pullrequestevent
@@ -182,84 +189,13 @@ class GitHubWebhook(webhook):
                 return not self.merged
         return False
 
-    @property
+    @memoized_property
     def event(self):
         """
         :return: The GitHub event type decoded from the JSON payload (data attr)
         :rtype: String
         """
-        if 'commits' in self.json.keys():
-            return GitHubUtil.events['EVENT_PUSH']
-
-        elif 'master_branch' in self.json.keys():
-            return GitHubUtil.events['EVENT_CREATE']
-
-        elif 'ref_type' in self.json.keys():
-            # This case must be under 'create'
-            #   as it also has the 'ref_type' field on the payload
-            return GitHubUtil.events['EVENT_DELETE']
-
-        elif 'deployment_status' in self.json.keys():
-            return GitHubUtil.events['EVENT_DEPLOYMENT_STATUS']
-
-        elif 'deployment' in self.json.keys():
-            # This case must be under 'deployment_status'
-            #   as it also has the 'deployment' field on the payload
-            return GitHubUtil.events['EVENT_DEPLOYMENT']
-
-        elif 'forkee' in self.json.keys():
-            return GitHubUtil.events['EVENT_FORK']
-
-        elif 'pages' in self.json.keys():
-            return GitHubUtil.events['EVENT_WIKI']
-
-        elif 'issue' in self.json.keys():
-            return (GitHubUtil.events['EVENT_ISSUE_COMMENT']
-                    if self.json['action'] == GitHubUtil.actions['ACT_CREATED']
-                    else GitHubUtil.events['EVENT_ISSUE'])
-
-        elif 'scope' in self.json.keys():
-            return GitHubUtil.events['EVENT_MEMBERSHIP']
-
-        elif 'build' in self.json.keys():
-            return GitHubUtil.events['EVENT_PAGE_BUILD']
-
-        elif 'member' in self.json.keys():
-            return GitHubUtil.events['EVENT_MEMBER']
-
-        elif 'comment' in self.json.keys():
-            return (GitHubUtil.events['EVENT_REVIEW_PR_COMMENT']
-                    if 'pull_request' in self.json.keys()
-                    else GitHubUtil.events['EVENT_COMMIT_COMMENT']
-                    )
-
-        elif 'pull_request' in self.json.keys():
-            if 'review' in self.json.keys():
-                return GitHubUtil.events['EVENT_PULL_REQUEST_REVIEW']
-            return GitHubUtil.events['EVENT_PULL_REQUEST']
-
-        elif 'release' in self.json.keys():
-            return GitHubUtil.events['EVENT_RELEASE']
-
-        elif 'state' in self.json.keys():
-            return GitHubUtil.events['EVENT_STATUS']
-
-        elif 'team' in self.json.keys():
-            # membership also uses 'team' in payload,
-            # so this case may be under that case
-            return GitHubUtil.events['EVENT_TEAM_ADD']
-
-        elif 'organization' in self.json.keys():
-            return GitHubUtil.events['EVENT_REPOSITORY']
-
-        elif 'action' in self.json.keys():
-            # Some other events use 'action' on its payload, so this case
-            #   must be almost at the end where it's the last one to use it
-            return GitHubUtil.events['EVENT_WATCH']
-
-        else:
-            # As it has no specific payload, this one may be the last one
-            return GitHubUtil.events['EVENT_PUBLIC_EVENT']
+        return GitHubUtil.decode_event(self.json)
 
 
 class GitHubUtil:
@@ -304,6 +240,75 @@ class GitHubUtil:
         'EVENT_WATCH': 'watch'
     }
 
+    known_events = frozenset(events.values())
+
+    # Payload keys that tell the event, from the most specific to the least.
+    # Several events share keys (e.g. 'create' and 'delete' both have
+    #   'ref_type'), so the first key of this list found in a payload is the
+    #   one that decides its event. Callables decide between events with
+    #   the same key.
+    event_signatures = (
+        ('commits', 'EVENT_PUSH'),
+        ('master_branch', 'EVENT_CREATE'),
+        ('ref_type', 'EVENT_DELETE'),
+        ('deployment_status', 'EVENT_DEPLOYMENT_STATUS'),
+        ('deployment', 'EVENT_DEPLOYMENT'),
+        ('forkee', 'EVENT_FORK'),
+        ('pages', 'EVENT_WIKI'),
+        ('issue', lambda json: (
+            'EVENT_ISSUE_COMMENT'
+            if json['action'] == GitHubUtil.actions['ACT_CREATED']
+            else 'EVENT_ISSUE'
+        )),
+        ('scope', 'EVENT_MEMBERSHIP'),
+        ('build', 'EVENT_PAGE_BUILD'),
+        ('member', 'EVENT_MEMBER'),
+        ('comment', lambda json: (
+            'EVENT_REVIEW_PR_COMMENT'
+            if 'pull_request' in json
+            else 'EVENT_COMMIT_COMMENT'
+        )),
+        ('pull_request', lambda json: (
+            'EVENT_PULL_REQUEST_REVIEW'
+            if 'review' in json
+            else 'EVENT_PULL_REQUEST'
+        )),
+        ('release', 'EVENT_RELEASE'),
+        ('state', 'EVENT_STATUS'),
+        # membership also uses 'team' in payload
+        ('team', 'EVENT_TEAM_ADD'),
+        ('organization', 'EVENT_REPOSITORY'),
+        # Some other events use 'action' on its payload, so this one
+        #   must be the last one to use it
+        ('action', 'EVENT_WATCH'),
+    )
+
+    # Position of each key on the signatures, to find the first one of a
+    #   payload without walking all the signatures
+    event_keys = dict(
+        (key, (pos, event)) for pos, (key, event) in enumerate(event_signatures)
+    )
+
+    @staticmethod
+    def decode_event(json):
+        """
+        :param json: Payload of the hook
+            :type: Dictionary
+        :return: The event of the payload, decoded with its keys
+        :rtype: String
+        """
+        found = [
+            GitHubUtil.event_keys[key] for key in json
+            if key in GitHubUtil.event_keys
+        ]
+        if not found:
+            # As it has no specific payload, this one may be the last one
+            return GitHubUtil.events['EVENT_PUBLIC_EVENT']
+        pos, event = min(found)
+        if callable(event):
+            event = event(json)
+        return GitHubUtil.events[event]
+
     @staticmethod
     def clone_on_dir(dir, repository, url, branch=None):
         """
@@ -321,6 +326,10 @@ class GitHubUtil:
             clone error log.
             :rtype: Tuple<String,Int,String>
         """
+        mirrors = MirrorCache.from_environment()
+        if mirrors is not None:
+            # Clone from the local mirror of the repository
+            return mirrors.clone_on_dir(dir, repository, url, branch)
         output = "Clonant el repositori '{}'".format(repository)
         command = 'git clone {}'.format(url)
         if branch and branch != 'None':
@@ -362,7 +371,7 @@ class GitHubUtil:
         )
         code = -1
         try:
-            pulls = requests.get(req_url, headers=head)
+            pulls = get_client().get(req_url, headers=head)
             if pulls.status_code != 200:
                 output += 'OMITTING |'
                 raise Exception('Could Not Get PULLS')
@@ -416,7 +425,7 @@ class GitHubUtil:
         payload = {'body': message}
         code = 0
         try:
-            post = requests.post(req_url, headers=head, json=payload)
+            post = get_client().post(req_url, headers=head, json=payload)
             code = post.status_code
             text = post.text
             if code != 201:
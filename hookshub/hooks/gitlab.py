@@ -2,6 +2,8 @@
 from hookshub.hooks.webhook import webhook
 from json import dumps
 from subprocess import Popen, PIPE
+from hookshub.mirrors import MirrorCache
+from hookshub.client import get_client
 
 import requests
 # GitLab events
@@ -155,6 +157,10 @@ class GitLabUtil:
             clone error log.
             :rtype: Tuple<String,Int,String>
         """
+        mirrors = MirrorCache.from_environment()
+        if mirrors is not None:
+            # Clone from the local mirror of the repository
+            return mirrors.clone_on_dir(dir, repository, url, branch)
         output = "Clonant el repositori '{}'".format(repository)
         command = 'git clone {}'.format(url)
         if branch and branch != 'None':
@@ -198,7 +204,7 @@ class GitLabUtil:
         payload = {'body': message}
         code = 0
         try:
-            post = requests.post(req_url, headers=head, json=payload)
+            post = get_client().post(req_url, headers=head, json=payload)
             code = post.status_code
             text = post.text
             if code != 201:
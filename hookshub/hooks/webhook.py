@@ -1,9 +1,130 @@
 # -*- coding: utf-8 -*-
 from os.path import abspath, normpath, dirname, join, isfile, isdir
-from os import listdir
+from os import listdir, stat
+from bisect import bisect_left
+from functools import wraps
+from threading import Lock
 from json import dumps
 
 
+def memoized_property(method):
+    """
+    Property computed only once per webhook, as the payload of a hook
+    doesn't change once it's received.
+    """
+    attr = '_memo_{}'.format(method.__name__)
+
+    @wraps(method)
+    def getter(self):
+        try:
+            return self.__dict__[attr]
+        except KeyError:
+            value = self.__dict__[attr] = method(self)
+            return value
+    return property(getter)
+
+
+class ActionIndex(object):
+    """
+    Index of the scripts in an actions directory.
+
+    The directory is only listed again when its mtime changes, so scripts
+    dropped in while the listener is running are still found. The actions of
+    an (event, repository, branch) are searched once among the scripts that
+    start with the event name and then kept as event -> repository -> branch
+    until the directory changes.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = Lock()
+        self._mtime = None
+        self._actions = []
+        self._sorted = []
+        self._order = {}
+        self._matches = {}
+
+    def refresh(self):
+        """
+        List the directory again if it changed since the last time
+        :return: The actions in the directory
+        :rtype: List<String>
+        """
+        try:
+            mtime = stat(self.path).st_mtime
+        except OSError:
+            mtime = None
+        with self._lock:
+            if mtime != self._mtime:
+                actions = [] if mtime is None else [
+                    action
+                    for action in listdir(self.path)
+                    if isfile(join(self.path, action))
+                ]
+                self._actions = actions
+                self._sorted = sorted(actions)
+                self._order = dict(
+                    (action, pos) for pos, action in enumerate(actions)
+                )
+                self._matches = {}
+                self._mtime = mtime
+            return self._actions
+
+    @property
+    def actions(self):
+        return list(self.refresh())
+
+    def _starting_with(self, prefix):
+        names = self._sorted
+        for pos in range(bisect_left(names, prefix), len(names)):
+            if not names[pos].startswith(prefix):
+                break
+            yield names[pos]
+
+    def match(self, event, repository, branch):
+        """
+        :return: The actions named after the event, repository and branch,
+            as documented on webhook.event_actions
+        :rtype: List<String>
+        """
+        self.refresh()
+        with self._lock:
+            branches = self._matches.setdefault(
+                event, {}).setdefault(repository, {})
+            if branch not in branches:
+                branches[branch] = sorted([
+                    action
+                    for action in self._starting_with(event)
+                    # If they start with {event}-{repository}-{branch}
+                    if action.startswith('{0}-{1}-{2}'.format(
+                        event, repository, branch
+                    )) or
+                    # If they start with {event}-{repository}_{name}
+                    action.startswith('{0}-{1}_'.format(event, repository)) or
+                    # If they are named after {event}-{repository}
+                    action == '{0}-{1}.py'.format(event, repository) or
+                    # If they start with {event}_{name}
+                    action.startswith('{0}_'.format(event)) or
+                    # If they are named after {event}
+                    action == '{0}.py'.format(event)
+                ], key=self._order.get)
+            return list(branches[branch])
+
+
+_indexes = {}
+_indexes_lock = Lock()
+
+
+def get_action_index(path):
+    """
+    :return: The (only) index for the actions directory in path
+    :rtype: ActionIndex
+    """
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = ActionIndex(path)
+        return _indexes[path]
+
+
 class webhook(object):
     def __init__(self, data):
         self.json = data
@@ -30,12 +151,9 @@ class webhook(object):
 
     @property
     def actions(self):
-        return [] if not isdir(self.actions_path) else [
-            action
-            for action in listdir(self.actions_path)
-            if(
-                isfile(join(self.actions_path, action))
-            )]
+        return [] if not isdir(self.actions_path) else get_action_index(
+            self.actions_path
+        ).actions
 
     @property
     def event_actions(self):
@@ -51,32 +169,16 @@ class webhook(object):
         :return: All the scripts that match with the event decoded
         :rtype: List<String>
         """
-        events = [] if not isdir(self.actions_path) else [
-            action
-            for action in listdir(self.actions_path)
-            if (
-                action.startswith(self.event) and
-                isfile(join(self.actions_path, action))
-            )
-        ]
-        events = [
-            event
-            for event in events
-            # If they start with {event}-{repository}-{branch}
-            if event.startswith('{0}-{1}-{2}'.format(
-                self.event, self.repo_name, self.branch_name
-            )) or
-            # If they start with {event}-{repository}_{name}
-            event.startswith('{0}-{1}_'.format(self.event, self.repo_name)) or
-            # If they are named after {event}-{repository}
-            event == '{0}-{1}.py'.format(self.event, self.repo_name) or
-            # If they start with {event}_{name}
-            event.startswith('{0}_'.format(self.event)) or
-            # If they are named after {event}
-            event == '{0}.py'.format(self.event)
-        ]
-        return events
-
-    def get_exe_action(self, action, conf):
+        return [] if not isdir(self.actions_path) else get_action_index(
+            self.actions_path
+        ).match(self.event, self.repo_name, self.branch_name)
+
+    def get_exe_action(self, action, conf, payload_path=None):
+        """
+        :param payload_path: File with the payload, given to the action
+            instead of the payload itself
+        :return: Executable of the action and its arguments
+        :rtype: List<String>
+        """
         exe_path = join(self.actions_path, action)
-        return [exe_path, dumps(self.json), self.event]
+        return [exe_path, payload_path or dumps(self.json), self.event]
@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+from os.path import join, isdir, isfile
+from os import listdir, makedirs, remove, rename, fsync
+from threading import Lock, Timer
+from binascii import crc32
+from json import dumps, loads
+from time import time
+import struct
+import logging
+
+# Bytes of a segment before starting a new one
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024
+# Appends and seconds between fsyncs of the journal
+DEFAULT_SYNC_EVERY = 32
+DEFAULT_SYNC_INTERVAL = 0.1
+
+# Length and CRC of each record
+HEADER = struct.Struct('>II')
+# Position of each record in its segment
+INDEX_ENTRY = struct.Struct('>Q')
+
+
+class Segment(object):
+    """
+    A file of the journal with the records from `base` on, and its index
+    with the position of each record in the file.
+    """
+    def __init__(self, path, base):
+        self.base = base
+        self.log_path = join(path, '{:020d}.log'.format(base))
+        self.index_path = join(path, '{:020d}.index'.format(base))
+        self.positions = []
+        self.size = 0
+        self._log = None
+        self._index = None
+
+    @property
+    def next_offset(self):
+        return self.base + len(self.positions)
+
+    def recover(self):
+        """
+        Read the whole segment to find its records, and drop anything after
+        the last complete one (a record being written when the process died).
+        """
+        positions = []
+        position = 0
+        if isfile(self.log_path):
+            with open(self.log_path, 'rb') as log:
+                data = log.read()
+            while position + HEADER.size <= len(data):
+                length, crc = HEADER.unpack_from(data, position)
+                start = position + HEADER.size
+                record = data[start:start + length]
+                if len(record) < length or crc32(record) & 0xffffffff != crc:
+                    break
+                positions.append(position)
+                position = start + length
+            if position < len(data):
+                with open(self.log_path, 'r+b') as log:
+                    log.truncate(position)
+        with open(self.index_path, 'wb') as index:
+            index.write(''.join(INDEX_ENTRY.pack(pos) for pos in positions))
+        self.positions = positions
+        self.size = position
+        return self
+
+    def open(self):
+        self._log = open(self.log_path, 'ab')
+        self._index = open(self.index_path, 'ab')
+        return self
+
+    def close(self):
+        for handle in (self._log, self._index):
+            if handle is not None:
+                handle.close()
+        self._log = self._index = None
+
+    def append(self, data):
+        """
+        :return: Offset of the record
+        :rtype: Int
+        """
+        offset = self.next_offset
+        self._log.write(
+            HEADER.pack(len(data), crc32(data) & 0xffffffff) + data
+        )
+        self._index.write(INDEX_ENTRY.pack(self.size))
+        self._log.flush()
+        self._index.flush()
+        self.positions.append(self.size)
+        self.size += HEADER.size + len(data)
+        return offset
+
+    def sync(self):
+        if self._log is not None:
+            fsync(self._log.fileno())
+            fsync(self._index.fileno())
+
+    def read(self, start):
+        """
+        :return: Offset and data of the records from offset `start`
+        :rtype: Generator<Tuple<Int,String>>
+        """
+        first = max(start - self.base, 0)
+        if first >= len(self.positions):
+            return
+        with open(self.log_path, 'rb') as log:
+            log.seek(self.positions[first])
+            for pos in range(first, len(self.positions)):
+                length, crc = HEADER.unpack(log.read(HEADER.size))
+                yield self.base + pos, log.read(length)
+
+    def delete(self):
+        self.close()
+        for path in (self.log_path, self.index_path):
+            if isfile(path):
+                remove(path)
+
+
+class Journal(object):
+    """
+    Durable, append-only journal of the deliveries accepted by the listener.
+
+    Records are JSON documents appended to segment files named after the
+    offset of their first record. Every segment has an index with the
+    position of its records, so reading from an offset doesn't need to scan
+    the segment. Appends are flushed right away but only fsync-ed every
+    `sync_every` records or `sync_interval` seconds (also when no other
+    record is appended after them), and when closed.
+
+    Consumers acknowledge the offsets they are done with. The journal
+    commits the highest offset below which every record was acknowledged,
+    so after a restart the records from the committed offset on are read
+    again: a record may be processed twice, but never lost. Segments with
+    only committed records are removed.
+    """
+    def __init__(self, path, segment_size=DEFAULT_SEGMENT_SIZE,
+                 sync_every=DEFAULT_SYNC_EVERY,
+                 sync_interval=DEFAULT_SYNC_INTERVAL):
+        self.path = path
+        self.segment_size = int(segment_size)
+        self.sync_every = int(sync_every)
+        self.sync_interval = float(sync_interval)
+        self.logger = logging.getLogger(__name__)
+        self._lock = Lock()
+        self._unsynced = 0
+        self._synced_at = time()
+        # Syncs the records left unsynced once the interval passes
+        self._timer = None
+        self._acked = set()
+        if not isdir(self.path):
+            makedirs(self.path)
+        self._committed = self._read_committed()
+        bases = sorted(
+            int(name[:-len('.log')]) for name in listdir(self.path)
+            if name.endswith('.log')
+        )
+        self.segments = [Segment(self.path, base) for base in bases]
+        for segment in self.segments[:-1]:
+            segment.positions = self._read_index(segment)
+        if not self.segments:
+            self.segments = [Segment(self.path, self._committed + 1)]
+        self.segments[-1].recover().open()
+
+    @property
+    def commit_path(self):
+        return join(self.path, 'committed')
+
+    @property
+    def committed(self):
+        """
+        :return: Offset up to which all the records were processed, or -1
+        :rtype: Int
+        """
+        return self._committed
+
+    @property
+    def next_offset(self):
+        return self.segments[-1].next_offset
+
+    def _read_committed(self):
+        if not isfile(self.commit_path):
+            return -1
+        with open(self.commit_path, 'r') as committed:
+            return int(committed.read().strip() or -1)
+
+    @staticmethod
+    def _read_index(segment):
+        with open(segment.index_path, 'rb') as index:
+            data = index.read()
+        return [
+            INDEX_ENTRY.unpack_from(data, pos)[0]
+            for pos in range(0, len(data), INDEX_ENTRY.size)
+        ]
+
+    def append(self, record):
+        """
+        :param record: Document to keep in the journal
+            :type: Dictionary
+        :return: Offset of the record
+        :rtype: Int
+        """
+        data = dumps(record)
+        with self._lock:
+            segment = self.segments[-1]
+            if segment.size and segment.size + len(data) > self.segment_size:
+                segment.sync()
+                segment.close()
+                segment = Segment(self.path, segment.next_offset).recover()
+                self.segments.append(segment.open())
+            offset = segment.append(data)
+            self._unsynced += 1
+            if (self._unsynced >= self.sync_every or
+                    time() - self._synced_at >= self.sync_interval):
+                self._sync()
+            elif self._timer is None:
+                self._timer = Timer(self.sync_interval, self._sync_late)
+                self._timer.daemon = True
+                self._timer.start()
+        return offset
+
+    def _sync_late(self):
+        with self._lock:
+            self._timer = None
+            if self._unsynced:
+                self._sync()
+
+    def _sync(self):
+        self.segments[-1].sync()
+        self._unsynced = 0
+        self._synced_at = time()
+
+    def sync(self):
+        with self._lock:
+            self._sync()
+
+    def read(self, start=0):
+        """
+        :return: Offset and record of everything in the journal from the
+            offset `start` on
+        :rtype: Generator<Tuple<Int,Dictionary>>
+        """
+        for segment in list(self.segments):
+            if segment.next_offset <= start:
+                continue
+            for offset, data in segment.read(start):
+                yield offset, loads(data)
+
+    def get(self, offset):
+        """
+        :return: The record at the offset
+        :rtype: Dictionary
+        """
+        for found, record in self.read(offset):
+            if found == offset:
+                return record
+            break
+        raise KeyError(offset)
+
+    def pending(self):
+        """
+        :return: The records that were not committed yet
+        :rtype: Generator<Tuple<Int,Dictionary>>
+        """
+        return self.read(self._committed + 1)
+
+    def ack(self, offset):
+        """
+        Mark a record as processed, and commit all the records up to the
+        first one still being processed.
+        :return: The committed offset
+        :rtype: Int
+        """
+        with self._lock:
+            self._acked.add(offset)
+            committed = self._committed
+            while committed + 1 in self._acked:
+                committed += 1
+                self._acked.remove(committed)
+            if committed != self._committed:
+                self._commit(committed)
+            return self._committed
+
+    def _commit(self, offset):
+        tmp_path = '{}.tmp'.format(self.commit_path)
+        with open(tmp_path, 'w') as committed:
+            committed.write(str(offset))
+            committed.flush()
+            fsync(committed.fileno())
+        rename(tmp_path, self.commit_path)
+        self._committed = offset
+        # Segments with only committed records are not needed anymore
+        while (len(self.segments) > 1 and
+               self.segments[0].next_offset <= offset + 1):
+            self.segments.pop(0).delete()
+
+    def stats(self):
+        return {
+            'segments': len(self.segments),
+            'next_offset': self.next_offset,
+            'committed': self._committed,
+            'pending': self.next_offset - self._committed - 1
+        }
+
+    def close(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._sync()
+            self.segments[-1].close()
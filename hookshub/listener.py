@@ -3,15 +3,37 @@ from copy_reg import pickle
 from types import MethodType
 import logging
 import signal
+import socket
+import os
 
 from json import loads, dumps
-from tempfile import mkstemp
 from sys import argv
-from os import fdopen
 from os.path import abspath, normpath, dirname, join
 
 from flask import Flask, request, abort, jsonify
-from hookshub.parser import HookParser
+from hookshub.parser import HookParser, stop_actions
+from hookshub.config import ConfigFile, DEFAULT_WATCH_INTERVAL
+from hookshub.executor import Executor, DEFAULT_MAX_TASKS
+from hookshub.dispatcher import Dispatcher, new_delivery_id
+from hookshub.dispatcher import DEFAULT_WORKERS, DEFAULT_HISTORY
+from hookshub.dispatcher import DEFAULT_DEBOUNCE
+from hookshub.hooks.github import GitHubUtil
+from hookshub.hooks.gitlab import GitLabUtil
+from hookshub.journal import Journal
+from hookshub.journal import DEFAULT_SYNC_EVERY, DEFAULT_SYNC_INTERVAL
+from hookshub.journal import DEFAULT_SEGMENT_SIZE
+from hookshub.dedup import DeliveryCache, delivery_key
+from hookshub.dedup import DEFAULT_TTL, DEFAULT_SIZE
+from hookshub.admission import AdmissionControl, DEFAULT_RETRY_AFTER
+from hookshub.admission import EVENTS, QUEUED, ACTIONS
+from hookshub.server import AsyncServer, bind_tcp, bind_unix
+from hookshub.server import DEFAULT_THREADS, DEFAULT_MAX_BODY
+from hookshub.server import DEFAULT_BACKLOG
+from hookshub.prefork import Supervisor
+from hookshub.usage import UsageStats
+from hookshub.client import client_metrics
+from werkzeug.serving import make_server
+from functools import partial
 from raven.contrib.flask import Sentry
 
 
@@ -26,6 +48,34 @@ pickle(MethodType, _pickle_method)
 DEFAULT_IP = '0.0.0.0'
 DEFAULT_PORT = 5000
 DEFAULT_PROCS = 4
+# Seconds the deliveries running get when the listener stops, and then
+# their actions before SIGKILL, both within the stop_timeout of the
+# supervisor
+STOP_TIMEOUT = 4
+# Options applied by each worker on its own deliveries, with several workers
+PER_WORKER_OPTIONS = (
+    'fast_ack', 'journal_path', 'coalesce_pushes',
+    'max_events', 'max_queued', 'max_actions'
+)
+
+# Config of the listener, as snapshots swapped when it's loaded again
+settings = ConfigFile(
+    join(normpath(abspath(dirname(__file__))), 'config.json')
+)
+# Shared pool of workers, started once by start_listening
+executor = None
+# Pools of the priority classes with their own processes
+executors = {}
+# Background runner of the deliveries, only used on fast-ack mode
+dispatcher = None
+# On-disk journal of the deliveries accepted on fast-ack mode
+journal = None
+# Deliveries received lately, to skip the ones sent again
+deliveries = None
+# Limits on the events and actions in flight
+admission = None
+# Resources used by the actions, by repository and action
+action_usage = UsageStats()
 
 
 class AbortException(Exception):
@@ -61,12 +111,25 @@ def get_args():
                 host_port = int(arg[7::])
             elif arg.startswith('--procs='):
                 proc_num = int(arg[8::])
+            elif arg.startswith((
+                    '--workers=', '--socket=', '--socket-mode=',
+                    '--backlog=')):
+                # Parsed by get_options
+                pass
             elif arg.startswith('--help'):
                 out = 'Usage:\npython listener.py [options]'
                 out += '\n\t[--ip=<ip_address>]\t\t\t- sets listening address'
                 out += '\n\t[--port=<port_number>]\t\t- sets listening port'
                 out += '\n\t[--procs=<process_number>]\t- sets the number of' \
                        ' processes to start running actions'
+                out += '\n\t[--workers=<worker_number>]\t- sets the number' \
+                       ' of listener processes to fork'
+                out += '\n\t[--socket=<path>]\t\t- listens on a unix socket' \
+                       ' instead of the ip and port'
+                out += '\n\t[--socket-mode=<mode>]\t\t- sets the permissions' \
+                       ' of the unix socket (octal)'
+                out += '\n\t[--backlog=<connections>]\t- sets the pending' \
+                       ' connections kept by the socket'
                 log.error(
                     out
                 )
@@ -79,6 +142,30 @@ def get_args():
     return host_ip, host_port, proc_num
 
 
+def get_options():
+    '''
+    Parse the options of the listener from sys.argv, other than the ones of
+    get_args:
+    --workers=<worker_num>  -   Listener processes to fork, sharing the port
+    --socket=<path>         -   Unix socket to listen on instead of ip:port
+    --socket-mode=<mode>    -   Permissions of the unix socket, in octal
+    --backlog=<connections> -   Pending connections kept by the socket
+    :return: Options as keyword arguments for start_listening
+    :rtype: Dict
+    '''
+    options = {}
+    for arg in argv:
+        if arg.startswith('--workers='):
+            options['workers'] = int(arg[10::])
+        elif arg.startswith('--socket='):
+            options['socket_path'] = arg[9::]
+        elif arg.startswith('--socket-mode='):
+            options['socket_mode'] = int(arg[14::], 8)
+        elif arg.startswith('--backlog='):
+            options['backlog'] = int(arg[10::])
+    return options
+
+
 application = Flask(__name__)
 
 
@@ -100,13 +187,8 @@ def index():
     """
     Main WSGI application entry.
     """
-    path = normpath(abspath(dirname(__file__)))
-
-    # Load config
-    global config
-    if 'config' not in globals():
-        with open(join(path, 'config.json'), 'r') as cfg:
-            config = loads(cfg.read())
+    # The same config for the whole request, even if reloaded meanwhile
+    config = settings.current
 
     # Get Event // Implement ping
     event = request.headers.get(
@@ -117,66 +199,514 @@ def index():
     if event == 'ping':
         return dumps({'msg': 'pong'})
 
+    # Answer busy right away, or keep the hook only in the journal
+    reserve = QUEUED if dispatcher is not None else EVENTS
+    full = admission.check(reserve) if admission is not None else None
+    spill = bool(full) and config.get('spill_to_journal', False) and \
+        dispatcher is not None and journal is not None
+    if full and not spill:
+        admission.reject()
+        return dumps({'msg': 'Busy', 'limit': full}), 503, {
+            'Retry-After': str(admission.retry_after)
+        }
+    try:
+        return accept(config, event, spill)
+    finally:
+        # Once queued or run, the usage counts the event
+        if admission is not None and not full:
+            admission.release(reserve)
+
+
+def accept(config, event, spill=False):
+    '''
+    Run the hook of the request, or queue it on fast-ack mode
+    :param config: Config of the request
+    :param event: Event as received in the request headers
+    :param spill: Keep the hook only in the journal, the listener is busy
+    :return: Response to the request
+    '''
+    # Skip redeliveries before doing anything with them
+    key = None
+    if deliveries is not None:
+        key = delivery_key(request.headers, request.data)
+        if not deliveries.claim(key):
+            return dumps({'msg': 'Duplicate', 'delivery': key})
+    try:
+        return handle(config, event, spill, key)
+    except Exception:
+        # Not handled, so it runs if sent again
+        forget_delivery(key)
+        raise
+
+
+def handle(config, event, spill=False, key=None):
+    '''
+    Run the hook of the request, or queue it on fast-ack mode, once it's
+    known not to be a redelivery
+    :param key: Key of the delivery, None when not skipping redeliveries
+    :return: Response to the request
+    '''
     # Gather data
     try:
         payload = loads(request.data)
     except:
         abort(400)
 
-    # Save payload to temporal file
-    osfd, tmpfile = mkstemp()
-    with fdopen(osfd, 'w') as pf:
-        pf.write(dumps(payload))
+    # Fast-ack: the hook must be known before accepting it
+    if dispatcher is not None:
+        try:
+            hook = HookParser.instancer(payload, event)
+            kind = hook.event
+            ref = push_ref(hook) if config.get('coalesce_pushes') else None
+            lane = None
+            if config.get('order_by_repository', True):
+                lane = hook.repo_name, hook.branch_name
+        except Exception:
+            abort(400)
+
+    # Fast-ack: answer right away and let the dispatcher run the hook
+    if dispatcher is not None:
+        if spill:
+            admission.reject(spilled=True)
+        submit = dispatcher.spill if spill else dispatcher.submit
+        delivery = submit(
+            new_delivery_id(request.headers), event, payload, kind, ref,
+            lane, key
+        )
+        return dumps({'msg': 'Accepted', 'delivery': delivery.id}), 202
+
+    # Counted as running by the room reserved for it
+    code, output = run_event(event, payload)
+    if code:
+        raise AbortException(output)
+    return dumps({'msg': output})
+
+
+def forget_delivery(key):
+    '''
+    Let a delivery that could not be processed be run if sent again
+    :param key: Key of the delivery, None when not skipping redeliveries
+    '''
+    if deliveries is not None and key is not None:
+        deliveries.release(key)
+
+
+def has_room():
+    '''
+    :return: If the listener can take another event, to queue the deliveries
+        spilled to the journal
+    :rtype: Bool
+    '''
+    return admission is None or admission.reached() is None
+
+
+def forget_failed(delivery):
+    '''
+    Let a delivery that failed on the dispatcher be run if sent again
+    :param delivery: Delivery run by the dispatcher
+    '''
+    forget_delivery(delivery.key)
+
 
+def push_ref(hook):
+    '''
+    :param hook: Webhook of a delivery
+    :return: Repository and branch of a push, for newer pushes to supersede
+        it, or None for other events
+    :rtype: Tuple<String,String>
+    '''
+    if hook.event != 'push':
+        return None
+    return hook.repo_name, hook.branch_name
+
+
+def run_event(event, payload, cancel=None, priority=None, pending=None):
+    """
+    Run the actions and hooks for the payload of a hook
+    :param event: Event as received in the request headers
+    :param payload: Payload of the hook, already decoded
+    :param cancel: Set to stop waiting for the actions and hooks
+    :param priority: Priority class of the event, to use its own pool
+    :param pending: Gets the actions and hooks still running once answered
+        :type: List<PendingTasks>
+    :return: Return code (0 if all went right) and log of the event
+    :rtype: Tuple<Int,String>
+    """
     # Use HooksHub to run actions
+    config = settings.current
     processes_per_task = config.get('processes', False)
     with HookParser(
-            payload_file=tmpfile,
+            payload=payload,
             event=event,
-            procs=processes_per_task
+            procs=processes_per_task,
+            executor=executors.get(priority, executor),
+            cancel=cancel,
+            usage=action_usage
     ) as parser:
+        if priority is None and executors:
+            # Run by the listener itself, classified as the dispatcher does
+            parser.executor = executors.get(
+                priority_of(config, event, parser.hook.event), executor
+            )
+        config = config.repository(parser.hook.repo_name)
         code_actions, output_actions = parser.run_event_actions(config)
 
         code_hooks, output_hooks = parser.run_event_hooks(config)
+    if pending is not None and len(parser.pending):
+        pending.append(parser.pending)
 
     # Log Header (one for actions and one for hooks)
     log_out = ('Processing: {} '.format(parser.event))
     # Log Actions
-    result = 'Fail' if code_actions else 'Success'
+    result = event_result(code_actions, output_actions)
     output_actions = '{0} actions|{1}'.format(log_out, output_actions)
     output_actions = '{}\n{} with {} on {}'.format(
         output_actions, result, code_actions, event)
     # Log Hooks
-    result = 'Fail' if code_hooks else 'Success'
+    result = event_result(code_hooks, output_hooks)
     output_hooks = '{0} hooks|{1}'.format(log_out, output_hooks)
     output_hooks = '{}\n{} with {} on {}'.format(
         output_hooks, result, code_hooks, event)
     output = output_actions + '\n' + output_hooks
-    if code_actions or code_hooks:
-        raise AbortException(output)
-    return dumps({'msg': output})
+    code = -1 if code_actions or code_hooks else 0
+    return code, output
+
+
+def event_result(code, output):
+    '''
+    :return: Result of the actions or the hooks of an event, for its log:
+        Pending while some of them are still running
+    :rtype: String
+    '''
+    if code:
+        return 'Fail'
+    return 'Pending' if ']:Pending!\n' in output else 'Success'
+
+
+def priority_classes(classes):
+    '''
+    :param classes: Priority classes from the config file, with the names of
+        their events as sent by GitHub or GitLab ('status') or as in
+        GitHubUtil.events and GitLabUtil.events ('EVENT_STATUS')
+        :type: Dict
+    :return: The classes with the names of the events as sent, by GitHub
+        and by GitLab when both send the event ('EVENT_ISSUE' is 'issues'
+        and 'issue')
+    :rtype: Dict
+    '''
+    names = {}
+    for util in (GitHubUtil, GitLabUtil):
+        for key, sent in util.events.items():
+            if sent not in names.setdefault(key, []):
+                names[key].append(sent)
+    result = {}
+    for name, priority in classes.items():
+        priority = dict(priority)
+        events = []
+        for event in priority.get('events', []):
+            for sent in names.get(event, [event]):
+                if sent not in events:
+                    events.append(sent)
+        priority['events'] = events
+        result[name] = priority
+    return result
+
+
+def priority_of(config, event, kind=None):
+    '''
+    :param event: Event as received in the request headers
+    :param kind: Event of the decoded hook
+    :return: Priority class of the event, by its decoded event or the one
+        in the headers, or None if it's in no class
+    :rtype: String
+    '''
+    class_of = {}
+    classes = priority_classes(config.get('priority_classes', {}))
+    for name, priority in classes.items():
+        for sent in priority['events']:
+            class_of[sent] = name
+    return class_of.get(kind, class_of.get(event))
+
+
+def usage():
+    '''
+    :return: Events running and queued on the dispatcher, and actions and
+        hooks in flight on the pools
+    :rtype: Dict
+    '''
+    current = {EVENTS: 0, QUEUED: 0}
+    if dispatcher is not None:
+        load = dispatcher.stats()
+        current = {EVENTS: load['running'], QUEUED: load['queued']}
+    pools = [executor] + executors.values() if executor else []
+    current[ACTIONS] = sum(pool.in_flight() for pool in pools)
+    return current
+
+
+@application.route('/deliveries/<delivery_id>', methods=['GET'])
+def delivery(delivery_id):
+    """
+    Result of a delivery accepted on fast-ack mode.
+    """
+    found = dispatcher.get(delivery_id) if dispatcher else None
+    if found is None:
+        abort(404)
+    return dumps(found.as_dict())
+
+
+@application.route('/stats', methods=['GET'])
+def stats():
+    """
+    Current state of the shared executor used to run actions and hooks, and
+    of the dispatcher when running on fast-ack mode, and the requests made by
+    the API client of the listener.
+    """
+    return dumps({
+        'executor': executor.stats() if executor else None,
+        'executors': dict(
+            (name, pool.stats()) for name, pool in executors.items()
+        ),
+        'dispatcher': dispatcher.stats() if dispatcher else None,
+        'admission': admission.stats() if admission else None,
+        'actions': action_usage.stats(),
+        'api': client_metrics()
+    })
+
+
+def reload_plugins(signum=None, frame=None):
+    '''
+    Scan the installed plugins again, even if no distribution changed.
+    Installed as the SIGUSR1 handler of the listener.
+    '''
+    from hookshub.hook import reload_hooks
+    logging.getLogger(__name__).info('Reloading plugins')
+    reload_hooks(force=True)
+
+
+def stop_listening(signum=None, frame=None):
+    '''
+    Stop serving, so the listener stops its dispatcher and the actions
+    running before exiting. Installed as the SIGTERM handler of the
+    listener.
+    '''
+    raise KeyboardInterrupt()
+
+
+def serve(host_ip, host_port, sock=None):
+    '''
+    Serve the application until stopped, on the event loop server with
+    "server": "async" in the config or on the Flask server otherwise. Unix
+    sockets are always served by the event loop server.
+    :param sock: Socket already listening, inherited from the supervisor
+    '''
+    config = settings.current
+    unix = sock is not None and sock.family == socket.AF_UNIX
+    if config.get('server') == 'async' or unix:
+        AsyncServer(
+            application, sock or bind_tcp(host_ip, host_port),
+            threads=config.get('server_threads', DEFAULT_THREADS),
+            max_body=config.get('max_body', DEFAULT_MAX_BODY)
+        ).serve_forever()
+    elif sock is not None:
+        make_server(
+            host_ip, host_port, application, threaded=True, fd=sock.fileno()
+        ).serve_forever()
+    else:
+        application.run(debug=False, host=host_ip, port=host_port)
+
+
+def listen_address(host_ip, host_port):
+    '''
+    :return: The address the listener is on, for the logs
+    :rtype: String
+    '''
+    if host_port is None:
+        return host_ip
+    return '{}:{}'.format(host_ip, host_port)
+
+
+def worker_path(path, worker=None):
+    '''
+    :return: The path for a worker of the listener, so the workers don't
+        share their files
+    :rtype: String
+    '''
+    if not path or worker is None:
+        return path
+    return '{}.{}'.format(path, worker)
+
+
+def per_worker_options(config):
+    '''
+    :return: The options of the config that each worker applies only to the
+        deliveries it receives, as its dispatcher, journal and limits are
+        its own
+    :rtype: List<String>
+    '''
+    options = [option for option in PER_WORKER_OPTIONS if config.get(option)]
+    if config.get('dedup', False) and not config.get('dedup_path'):
+        # Only the file is shared
+        options.append('dedup')
+    return options
+
+
+def load_config(proc_num=DEFAULT_PROCS):
+    '''
+    Load the config file, with `proc_num` processes if it sets none
+    :rtype: Config
+    '''
+    settings.defaults['processes'] = proc_num
+    return settings.load()
 
 
 def start_listening(host_ip=DEFAULT_IP,
                     host_port=DEFAULT_PORT,
-                    proc_num=DEFAULT_PROCS):
-    global config
-    from os.path import isfile
-    path = normpath(abspath(dirname(__file__)))
-    config_path = join(path, 'config.json')
-    if isfile(config_path):
-        with open(config_path, 'r') as cfg:
-            config = loads(cfg.read())
-    else:
-        config = {}
-    config.update({'processes': config.get('processes', False) or proc_num})
+                    proc_num=DEFAULT_PROCS,
+                    workers=1,
+                    socket_path=None,
+                    socket_mode=None,
+                    backlog=None):
+    '''
+    Serve the listener. With several workers, the config, the plugins and
+    the listening socket are loaded once and shared by the forked workers.
+    With a socket path, it listens on that unix socket instead of the ip and
+    port.
+    :param backlog: Pending connections kept by the socket, DEFAULT_BACKLOG
+        if not given (or the one of the Flask server, with a single worker)
+    '''
+    config = load_config(proc_num)
+    sock = None
+    if socket_path:
+        sock = bind_unix(socket_path, socket_mode, backlog or DEFAULT_BACKLOG)
+        host_ip, host_port = 'unix:{}'.format(socket_path), None
+    elif workers > 1 or backlog is not None:
+        sock = bind_tcp(host_ip, host_port, backlog or DEFAULT_BACKLOG)
+    try:
+        if workers <= 1:
+            return run_listener(host_ip, host_port, proc_num, sock)
+        from hookshub.hook import reload_hooks
+        reload_hooks()
+        logger = logging.getLogger(__name__)
+        logger.info('Start Listening on {} with {} workers'.format(
+            listen_address(host_ip, host_port), workers
+        ))
+        options = per_worker_options(config)
+        if options:
+            logger.warning(
+                'Each worker applies {} to its own deliveries only'.format(
+                    ', '.join(options))
+            )
+        Supervisor(workers, partial(
+            run_listener, host_ip, host_port, proc_num, sock
+        )).run()
+    finally:
+        if sock is not None:
+            sock.close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def run_listener(host_ip, host_port, proc_num, sock=None, worker=None):
+    '''
+    Start the pools and services of the listener and serve it, on this
+    process
+    :param sock: Socket already listening, inherited from the supervisor
+    :param worker: Number of the worker, when running several of them
+    '''
+    global executor
+    global executors
+    global dispatcher
+    global journal
+    global deliveries
+    global admission
+    config = settings.current
+    if executor is not None:
+        executor.stop()
+    executor = Executor(
+        config['processes'],
+        config.get('max_tasks_per_worker', DEFAULT_MAX_TASKS)
+    ).start()
+    for pool in executors.values():
+        pool.stop()
+    classes = priority_classes(config.get('priority_classes', {}))
+    executors = dict(
+        (name, Executor(
+            priority['processes'],
+            config.get('max_tasks_per_worker', DEFAULT_MAX_TASKS)
+        ).start())
+        for name, priority in classes.items() if priority.get('processes')
+    )
+    if dispatcher is not None:
+        dispatcher.stop()
+        dispatcher = None
+    if journal is not None:
+        journal.close()
+        journal = None
+    if config.get('journal_path'):
+        journal = Journal(
+            worker_path(config['journal_path'], worker),
+            segment_size=config.get(
+                'journal_segment_size', DEFAULT_SEGMENT_SIZE),
+            sync_every=config.get('journal_sync_every', DEFAULT_SYNC_EVERY),
+            sync_interval=config.get(
+                'journal_sync_interval', DEFAULT_SYNC_INTERVAL)
+        )
+    if deliveries is not None:
+        deliveries.close()
+        deliveries = None
+    if config.get('dedup', False):
+        deliveries = DeliveryCache(
+            ttl=config.get('dedup_ttl', DEFAULT_TTL),
+            size=config.get('dedup_size', DEFAULT_SIZE),
+            path=config.get('dedup_path')
+        )
+    # The journal is only read by the dispatcher, so it implies fast-ack
+    if config.get('fast_ack', False) or journal is not None:
+        dispatcher = Dispatcher(
+            run_event,
+            workers=config.get('dispatch_workers', DEFAULT_WORKERS),
+            history=config.get('delivery_history', DEFAULT_HISTORY),
+            journal=journal,
+            debounce=config.get('push_debounce', DEFAULT_DEBOUNCE),
+            cancel_superseded=config.get('cancel_superseded', False),
+            classes=classes,
+            failed=forget_failed,
+            capacity=has_room,
+            follow_pending=True
+        ).start()
+    admission = None
+    limits = [config.get(limit) for limit in (
+        'max_events', 'max_queued', 'max_actions'
+    )]
+    if any(limits):
+        admission = AdmissionControl(
+            usage, *limits,
+            retry_after=config.get('retry_after', DEFAULT_RETRY_AFTER)
+        )
     logging.getLogger(__name__).info(
-        'Start Listening on {}:{} with {} procs per task'.format(
-            host_ip, host_port, proc_num
+        'Start Listening on {} with {} procs per task'.format(
+            listen_address(host_ip, host_port), proc_num
         )
     )
+    signal.signal(signal.SIGUSR1, reload_plugins)
+    signal.signal(signal.SIGHUP, settings.reload)
+    signal.signal(signal.SIGTERM, stop_listening)
+    settings.watch(
+        config.get('config_watch_interval', DEFAULT_WATCH_INTERVAL))
     sentry = Sentry(application)
-    application.run(debug=False, host=host_ip, port=host_port)
+    try:
+        serve(host_ip, host_port, sock)
+    except KeyboardInterrupt:
+        logging.getLogger(__name__).info('Stopping the listener')
+    settings.stop()
+    if dispatcher is not None:
+        dispatcher.stop(timeout=STOP_TIMEOUT)
+    if journal is not None:
+        journal.close()
+    stop_actions(grace=STOP_TIMEOUT)
+    for pool in executors.values():
+        pool.stop()
+    executor.stop()
 
 
 logging.basicConfig(format='%(asctime)s %(message)s',
@@ -185,4 +715,4 @@ logging.basicConfig(format='%(asctime)s %(message)s',
 
 if __name__ == '__main__':
     host_ip, host_port, proc_num = get_args()
-    start_listening(host_ip, host_port, proc_num)
+    start_listening(host_ip, host_port, proc_num, **get_options())
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+from os.path import join, isdir, getmtime, getsize, basename
+from os import listdir, walk, utime, makedirs
+from contextlib import contextmanager
+from subprocess import Popen, PIPE
+from hashlib import sha1
+from osconf import config_from_environment
+import shutil
+import fcntl
+import logging
+
+# Disk budget for all the mirrors, in MB
+DEFAULT_BUDGET = 10240
+
+
+def repository_dir(url):
+    """
+    :param url: URL used to clone the repository
+    :return: The directory name git uses when cloning the url
+        ('repo' for 'git@github.com:owner/repo.git')
+    :rtype: String
+    """
+    name = url.rstrip('/')
+    if name.endswith('.git'):
+        name = name[:-len('.git')]
+    return name.replace(':', '/').rsplit('/', 1)[-1]
+
+
+def run_git(args, cwd=None):
+    """
+    :return: Output, return code and error output of the git command
+    :rtype: Tuple<String,Int,String>
+    """
+    proc = Popen(['git'] + args, cwd=cwd, stdout=PIPE, stderr=PIPE)
+    out, err = proc.communicate()
+    return out, proc.returncode, err
+
+
+class MirrorCache(object):
+    """
+    Bare mirrors of the repositories cloned by the actions.
+
+    Each repository is mirrored once and then only fetched, and the clones
+    for the actions are made from the local mirror. Local clones hardlink
+    the objects of the mirror, so they don't depend on it once done and a
+    mirror can be evicted while its clones are still in use.
+
+    The mirrors are locked (with flock, as actions run on several processes)
+    while they are fetched and cloned, so concurrent deliveries of the same
+    repository wait for each other instead of cloning it twice. When the
+    mirrors use more than the budget, the least recently used ones are
+    removed.
+    """
+    def __init__(self, path, budget=DEFAULT_BUDGET):
+        """
+        :param path: Directory to keep the mirrors in
+            :type: String
+        :param budget: Disk space for all the mirrors, in MB
+            :type: Int
+        """
+        self.path = path
+        self.budget = int(budget) * 1024 * 1024
+        self.logger = logging.getLogger(__name__)
+        if not isdir(self.path):
+            makedirs(self.path)
+
+    @staticmethod
+    def from_environment():
+        """
+        :return: The mirror cache configured with $HOOKSHUB_MIRROR_PATH and
+            $HOOKSHUB_MIRROR_BUDGET, or None if there's no mirror path
+        :rtype: MirrorCache
+        """
+        conf = config_from_environment(
+            'HOOKSHUB', mirror_path=None, mirror_budget=DEFAULT_BUDGET
+        )
+        if not conf['mirror_path']:
+            return None
+        return MirrorCache(conf['mirror_path'], conf['mirror_budget'])
+
+    def mirror_path(self, url):
+        """
+        :return: Directory of the mirror for the url
+        :rtype: String
+        """
+        return join(self.path, '{}-{}.git'.format(
+            repository_dir(url), sha1(url).hexdigest()[:12]
+        ))
+
+    @contextmanager
+    def lock(self, mirror, blocking=True):
+        """
+        Lock a mirror for this process. Using the lock also marks the mirror
+        as used, for the LRU eviction.
+        :param mirror: Path of the mirror
+        :param blocking: Wait for the lock or give up if it's taken
+        :return: True if locked. Only False when not blocking.
+        """
+        with open('{}.lock'.format(mirror), 'a') as lock_file:
+            flags = fcntl.LOCK_EX if blocking else \
+                fcntl.LOCK_EX | fcntl.LOCK_NB
+            try:
+                fcntl.flock(lock_file, flags)
+            except IOError:
+                yield False
+                return
+            try:
+                utime(lock_file.name, None)
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def update(self, url):
+        """
+        Create the mirror of the url or fetch it. Must be called while
+        holding the lock of the mirror.
+        :return: Output, return code and error output of git
+        :rtype: Tuple<String,Int,String>
+        """
+        mirror = self.mirror_path(url)
+        if isdir(mirror):
+            return run_git(['--git-dir', mirror, 'fetch', '--prune', 'origin'])
+        out, code, err = run_git(['clone', '--mirror', url, mirror])
+        if code != 0 and isdir(mirror):
+            shutil.rmtree(mirror, ignore_errors=True)
+        return out, code, err
+
+    def clone_on_dir(self, dir, repository, url, branch=None):
+        """
+        Same as GitHubUtil.clone_on_dir and GitLabUtil.clone_on_dir, but
+        cloning from the mirror of the url
+        :rtype: Tuple<String,Int,String>
+        """
+        output = "Clonant el repositori '{}'".format(repository)
+        mirror = self.mirror_path(url)
+        target = join(dir, repository_dir(url))
+        command = ['clone', mirror, target]
+        if branch and branch != 'None':
+            output += ", amb la branca '{}'".format(branch)
+            command += ['--branch', branch]
+            output += ' ... '
+        with self.lock(mirror):
+            out, code, err = self.update(url)
+            if code == 0:
+                out, code, err = run_git(command)
+        if code == 0:
+            out, code, err = run_git(
+                ['remote', 'set-url', 'origin', url], cwd=target
+            )
+        if code != 0:
+            output += 'FAILED TO CLONE: {}: | ' \
+                      'Try to clone from https ...'.format(out)
+            err = ':clone_repository_fail::{}'.format(err)
+        self.evict()
+        return output, code, err
+
+    @staticmethod
+    def size(path):
+        total = 0
+        for root, dirs, files in walk(path):
+            for name in files:
+                try:
+                    total += getsize(join(root, name))
+                except OSError:
+                    pass
+        return total
+
+    def mirrors(self):
+        """
+        :return: Paths of the mirrors, from the least to the most recently
+            used
+        :rtype: List<String>
+        """
+        mirrors = [
+            join(self.path, name) for name in listdir(self.path)
+            if name.endswith('.git') and isdir(join(self.path, name))
+        ]
+
+        def last_used(mirror):
+            try:
+                return getmtime('{}.lock'.format(mirror))
+            except OSError:
+                return 0
+        return sorted(mirrors, key=last_used)
+
+    def evict(self):
+        """
+        Remove the least recently used mirrors until all of them fit in the
+        budget. The most recently used one and the ones locked by other
+        deliveries are never removed.
+        :return: Paths of the mirrors removed
+        :rtype: List<String>
+        """
+        mirrors = self.mirrors()
+        sizes = dict((mirror, self.size(mirror)) for mirror in mirrors)
+        total = sum(sizes.values())
+        evicted = []
+        for mirror in mirrors[:-1]:
+            if total <= self.budget:
+                break
+            with self.lock(mirror, blocking=False) as locked:
+                if not locked:
+                    continue
+                self.logger.info('Evicting mirror {}'.format(
+                    basename(mirror)
+                ))
+                shutil.rmtree(mirror, ignore_errors=True)
+            total -= sizes[mirror]
+            evicted.append(mirror)
+        return evicted
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+from collections import deque
+from threading import Thread, Lock
+import tempfile
+
+# Bytes kept in memory of the output (and of the error output) of an action
+DEFAULT_OUTPUT_CAP = 64 * 1024
+# Longest line read at once, longer ones are read in pieces
+MAX_LINE = 64 * 1024
+
+TRUNCATED_MSG = '[... {} bytes truncated ...]\n'
+TRUNCATED_LOG_MSG = '[... {} bytes truncated, full output on {} ...]\n'
+
+
+class OutputBuffer(object):
+    """
+    The last `cap` bytes of an output, kept line by line as it's read.
+
+    Older lines are dropped once over the cap (the end of a build is where
+    its errors are), and replaced by a truncation marker. With a `log`
+    file, every line is also written to it, so the whole output is there.
+    """
+    def __init__(self, cap=DEFAULT_OUTPUT_CAP, log=None, lock=None):
+        """
+        :param cap: Bytes kept in memory
+        :param log: File the whole output is written to
+            :type: file
+        :param lock: Lock for the log file, when shared with other outputs
+        """
+        self.cap = int(cap)
+        self.log = log
+        self._log_lock = lock or Lock()
+        self._lines = deque()
+        self.size = 0
+        self.dropped = 0
+
+    @property
+    def truncated(self):
+        return self.dropped > 0
+
+    def write(self, data):
+        if self.log is not None:
+            with self._log_lock:
+                self.log.write(data)
+        self._lines.append(data)
+        self.size += len(data)
+        while self.size > self.cap and self._lines:
+            line = self._lines.popleft()
+            self.size -= len(line)
+            self.dropped += len(line)
+
+    def getvalue(self):
+        """
+        :return: The output kept, after a truncation marker if it's not all
+        :rtype: String
+        """
+        output = ''.join(self._lines)
+        if not self.truncated:
+            return output
+        if self.log is not None:
+            marker = TRUNCATED_LOG_MSG.format(self.dropped, self.log.name)
+        else:
+            marker = TRUNCATED_MSG.format(self.dropped)
+        return marker + output
+
+
+def read_lines(pipe, output):
+    """
+    Read a pipe line by line into the output until it's closed
+    """
+    try:
+        for line in iter(lambda: pipe.readline(MAX_LINE), ''):
+            output.write(line)
+    finally:
+        pipe.close()
+
+
+def read_output(name, stdout, stderr, cap=DEFAULT_OUTPUT_CAP, log_dir=None):
+    """
+    Read the output and error output of an action as it writes them,
+    keeping only the last `cap` bytes of each one in memory
+    :param name: Name of the action, for its log file
+    :param stdout: Output of the action
+        :type: file
+    :param stderr: Error output of the action
+        :type: file
+    :param log_dir: Directory for a log file with all the output of the
+        action, None to not write it
+    :return: Output and error output kept, and the path of the log file
+    :rtype: Tuple<String,String,String>
+    """
+    log = None
+    if log_dir:
+        log = tempfile.NamedTemporaryFile(
+            prefix='{}-'.format(name), suffix='.log', dir=log_dir,
+            delete=False
+        )
+    lock = Lock()
+    out = OutputBuffer(cap, log, lock)
+    err = OutputBuffer(cap, log, lock)
+    reader = Thread(target=read_lines, args=(stderr, err))
+    reader.daemon = True
+    reader.start()
+    try:
+        read_lines(stdout, out)
+        reader.join()
+    finally:
+        if log is not None:
+            log.close()
+    return out.getvalue(), err.getvalue(), log.name if log else None
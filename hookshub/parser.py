@@ -2,15 +2,186 @@
 from hookshub.hooks.github import GitHubWebhook as github
 from hookshub.hooks.gitlab import GitLabWebhook as gitlab
 from multiprocessing import Pool
-from osconf import config_from_environment
+from hookshub.config import Config
+from hookshub.zygote import get_zygote, is_python_action
+from hookshub.output import read_output, DEFAULT_OUTPUT_CAP
+from hookshub.deadline import Deadline, ProcessGroups, deadlines
+from hookshub.deadline import EXITED, TERMINATED, KILL_GRACE
+from hookshub.deadline import DEFAULT_SOFT_DEADLINE, DEFAULT_HARD_DEADLINE
+from hookshub.usage import wait_usage, describe
 from hookshub.hooks.webhook import webhook
 from subprocess import Popen, PIPE
-from os.path import join
+from os.path import join, basename
+from functools import partial
+from threading import Thread
+from time import time
 import json
+import signal
 import tempfile
 import shutil
 import logging
 
+# Seconds between checks for a cancelled event while waiting for its tasks
+CANCEL_POLL = 0.1
+SUPERSEDED_MSG = 'Superseded by a newer delivery, not waiting for it.'
+STOPPED_MSG = 'Superseded by a newer delivery, stopping it.'
+PENDING_MSG = 'Still running async, but answering.' \
+              ' Check log for detailed result...'
+# Directory for the payloads shared by the actions, in memory when it exists
+PAYLOAD_DIR = '/dev/shm'
+# Process groups of the events running on this process (see ProcessGroups)
+running_groups = set()
+
+
+def when_done(tasks, callback):
+    """
+    Call the callback once the tasks given are done, right away if they
+    all are
+    :param tasks: Tasks of the pool
+        :type: List<AsyncResult>
+    """
+    pending = [task for task in tasks if not task.ready()]
+    if not pending:
+        return callback()
+
+    def call_when_done():
+        for task in pending:
+            task.wait()
+        callback()
+    thread = Thread(target=call_when_done, name='hookshub-when-done')
+    thread.daemon = True
+    thread.start()
+
+
+def stop_actions(grace=KILL_GRACE):
+    """
+    Stop the actions of all the events running on this process, with what
+    they started: SIGTERM, and SIGKILL after `grace` seconds (when the
+    listener stops)
+    """
+    for groups in list(running_groups):
+        groups.stop(grace)
+
+
+def forget_groups(groups):
+    """
+    Remove the process groups of an event, once its actions are done
+    """
+    running_groups.discard(groups)
+    groups.remove()
+
+
+def payload_dir():
+    """
+    :return: Directory for the payloads of the events: shared memory if
+        there's one, so they never reach the disk, or the temporary directory
+    :rtype: String
+    """
+    from os import access, W_OK
+    from os.path import isdir
+    if isdir(PAYLOAD_DIR) and access(PAYLOAD_DIR, W_OK):
+        return PAYLOAD_DIR
+    return tempfile.gettempdir()
+
+
+class SharedPayload(object):
+    """
+    The payload of an event, serialized once to a read-only file given to
+    all the actions of the event, instead of a temporary directory and a
+    copy of the payload for each action.
+
+    The file is removed when `release`d, once the actions that still use it
+    are done.
+    """
+    def __init__(self, payload, directory=None):
+        """
+        :param payload: Payload of the event, serialized
+            :type: String
+        :param directory: Directory for the file, by default the one of
+            payload_dir
+        """
+        import os
+        fd, self.path = tempfile.mkstemp(
+            prefix='hookshub-', suffix='.json',
+            dir=directory or payload_dir()
+        )
+        try:
+            with os.fdopen(fd, 'w') as shared:
+                shared.write(payload)
+            os.chmod(self.path, 0o400)
+        except Exception:
+            self.remove()
+            raise
+
+    def remove(self):
+        from os import remove
+        try:
+            remove(self.path)
+        except OSError:
+            pass
+
+    def release(self, tasks=()):
+        """
+        Remove the file once the tasks given are done, right away if they
+        all are
+        :param tasks: Tasks still using the file
+            :type: List<AsyncResult>
+        """
+        when_done(tasks, self.remove)
+
+
+class PendingTasks(object):
+    """
+    Tasks of an event still running on the pool when it's answered, to wait
+    for them, stop them and get their final result once done
+    """
+    def __init__(self):
+        self.groups = []
+        self._tasks = []
+
+    def add(self, name, task, describe):
+        """
+        :param name: Name of the action or the hook
+        :param task: Task running it on the pool
+            :type: AsyncResult
+        :param describe: Gives whether it failed and its log, once done
+            :type: Callable(name, task)
+        """
+        self._tasks.append((name, task, describe))
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def ready(self):
+        return all(task.ready() for name, task, describe in self._tasks)
+
+    def wait(self):
+        for name, task, describe in self._tasks:
+            task.wait()
+
+    def terminate(self):
+        """
+        Stop the actions still running, with what they started
+        """
+        for groups in self.groups:
+            groups.stop()
+
+    def result(self):
+        """
+        Wait for the tasks
+        :return: Return code (0 if all went right) and log of the tasks
+        :rtype: Tuple<Int,String>
+        """
+        code = 0
+        log = ''
+        for name, task, describe in self._tasks:
+            task.wait()
+            failed, task_log = describe(name, task)
+            if failed:
+                code = -1
+            log += task_log
+        return code, log
+
 
 class TempDir(object):
     def __init__(self):
@@ -23,47 +194,152 @@ class TempDir(object):
         shutil.rmtree(self.dir)
 
 
-def run_action(action, hook, conf):
+class ActionResult(tuple):
+    """
+    Result of an action, as (stdout, stderr, returncode, pid) of the worker
+    that ran it, with the `state` it ended on (see hookshub.deadline) and
+    the resources it used (see hookshub.usage)
+    """
+    def __new__(cls, stdout, stderr, returncode, pid, state=EXITED,
+                usage=None):
+        result = tuple.__new__(cls, (stdout, stderr, returncode, pid))
+        result.state = state
+        result.usage = usage
+        return result
+
+    def __reduce__(self):
+        return ActionResult, tuple(self) + (self.state, self.usage)
+
+
+def exec_action(action, args, zygote=None, cap=DEFAULT_OUTPUT_CAP,
+                log_dir=None, soft_deadline=DEFAULT_SOFT_DEADLINE,
+                hard_deadline=DEFAULT_HARD_DEADLINE, groups=None):
+    """
+    Run an action on its own process group, stopping it (and whatever it
+    started) when past its deadlines
+    :param zygote: Runs the action if it's a Python script, instead of a
+        new interpreter
+        :type: Zygote
+    :param cap: Bytes kept of the output and of the error output, the rest
+        is truncated
+    :param log_dir: Directory for a log file with the whole output
+    :param soft_deadline: Seconds before sending SIGTERM to the action
+    :param hard_deadline: Seconds before sending SIGKILL to the action
+    :param groups: Records the process group of the action, to stop it
+        with the other actions of the event
+        :type: ProcessGroups
+    :return: Output, error output and return code of the action
+    :rtype: ActionResult
+    """
+    import os
+    logger = logging.getLogger('__main__')
+    name = basename(action)
+    if groups is not None and groups.stopped:
+        logger.error('[{}]:{}'.format(action, STOPPED_MSG))
+        return ActionResult('', STOPPED_MSG, -1, os.getpid(), TERMINATED)
+    started = time()
+    if zygote is not None and is_python_action(args[0]):
+        pid, out, err = zygote.spawn(args)
+        proc = None
+    else:
+        proc = Popen(args, stdout=PIPE, stderr=PIPE, preexec_fn=os.setsid)
+        pid, out, err = proc.pid, proc.stdout, proc.stderr
+    with Deadline(pid, soft_deadline, hard_deadline) as deadline:
+        if groups is not None and groups.started(pid):
+            deadline.expire(signal.SIGTERM, TERMINATED)
+        stdout, stderr, log_path = read_output(name, out, err, cap, log_dir)
+        returncode, usage = wait_usage(pid)
+    if groups is not None:
+        groups.ended(pid)
+    usage['wall'] = time() - started
+    if proc is not None:
+        proc.returncode = returncode
+    logger.error('[{}]:Usage: {}'.format(action, describe(usage)))
+    if deadline.expired:
+        stderr += '\n{}\n'.format(deadline.describe())
+        logger.error('[{}]:{}'.format(action, deadline.describe()))
+    if log_path:
+        logger.error('[{}]:Log: {}'.format(action, log_path))
+    logger.error('[{}]:ProcOut:\n{}'.format(
+        action, stdout.replace('|', '\n')
+    ))
+    logger.error('[{}]:ProcErr:\n{}'.format(
+        action, stderr.replace('|', '\n')
+    ))
+    if returncode != 0 or deadline.expired:
+        logger.error('[{0}]:Failed!\n'.format(
+            action
+        ))
+    else:
+        logger.error('[{0}]:Success!\n'.format(
+            action
+        ))
+    return ActionResult(
+        stdout, stderr, returncode, os.getpid(), deadline.state, usage
+    )
+
+
+def run_action(action, hook, conf, payload_path=None, zygote=False,
+               groups=None):
+    """
+    :param payload_path: File with the payload shared by all the actions of
+        the event (see SharedPayload). Without it, the payload is written to
+        a temporary directory for this action.
+    :param zygote: Run the Python actions forked from the zygote of the
+        worker, with the `zygote_preload` modules of the config imported
+    :param groups: Records the process group of the action (see
+        ProcessGroups)
+    :return: Output, error output and return code of the action, and the pid
+        of the worker that ran it
+    :rtype: ActionResult
+    """
     import os
     logger = logging.getLogger('__main__')
     pid = os.getpid()
     logger.error('[ASYNC({})]Running: {} - {}'.format(pid, action, hook.event))
+    runner = get_zygote(conf.get('zygote_preload')) if zygote else None
+    soft_deadline, hard_deadline = deadlines(conf)
+    options = {
+        'cap': conf.get('action_output_cap', DEFAULT_OUTPUT_CAP),
+        'log_dir': conf.get('action_log_path'),
+        'soft_deadline': soft_deadline,
+        'hard_deadline': hard_deadline,
+        'groups': groups
+    }
+    if payload_path is not None:
+        args = hook.get_exe_action(action, conf, payload_path)
+        return exec_action(action, args, runner, **options)
     args = hook.get_exe_action(action, conf)
     with TempDir() as tmp:
         tmp_path = join(tmp.dir, action)
         with open(tmp_path, 'w') as tmp_json:
             tmp_json.write(args[1])
         args[1] = tmp_path
-        proc = Popen(args, stdout=PIPE, stderr=PIPE)
-        stdout, stderr = proc.communicate()
-        logger.error('[{}]:ProcOut:\n{}'.format(
-            action, stdout.replace('|', '\n')
-        ))
-        logger.error('[{}]:ProcErr:\n{}'.format(
-            action, stderr.replace('|', '\n')
-        ))
-        returncode = proc.returncode
-        if returncode != 0:
-            logger.error('[{0}]:Failed!\n'.format(
-                action
-            ))
-        else:
-            logger.error('[{0}]:Success!\n'.format(
-                action
-            ))
-    return stdout, stderr, returncode, pid
+        return exec_action(action, args, runner, **options)
 
 
 def log_result(res):
     stdout, stderr, returncode, pid = res
     logger = logging.getLogger('__main__')
-    if returncode == 0:
+    if returncode == 0 and getattr(res, 'state', EXITED) == EXITED:
         result = 'Success!'
     else:
         result = 'Failure!'
     logger.error('[ASYNC({})] Result: {}'.format(
         pid, result
     ))
+    usage = getattr(res, 'usage', None)
+    if usage:
+        logger.error('[ASYNC({})] Usage: {}'.format(pid, describe(usage)))
+
+
+def log_completed(completed, name, callback, res):
+    """
+    Callback for the tasks of an event: keeps the order in which they
+    complete and then logs their result with the given callback
+    """
+    completed.append(name)
+    callback(res)
 
 
 def log_hook_result(res):
@@ -79,25 +355,83 @@ def log_hook_result(res):
 
 
 class HookParser(object):
-    def __init__(self, payload_file, event, procs=False):
+    def __init__(self, payload_file=None, event=None, procs=False,
+                 executor=None, payload=None, cancel=None, usage=None):
+        """
+        :param payload_file: File with the JSON payload of the hook. It's
+            removed when leaving the context manager.
+            :type: String
+        :param event: Event as received in the request headers
+            :type: String
+        :param procs: Processes to run the actions when there's no executor
+            :type: Int
+        :param executor: Shared pool to run the actions and hooks on
+            :type: Executor
+        :param payload: The payload of the hook, already decoded (Dictionary)
+            or as received (String). Used instead of the payload_file.
+        :param cancel: Set when the event is superseded by a newer one, to
+            stop waiting for its actions and hooks
+            :type: threading.Event
+        :param usage: Adds up the resources used by the actions
+            :type: UsageStats
+        """
+        if payload is None and payload_file is None:
+            raise ValueError('A payload or a payload file is required')
         self.event = event
         self.payload_file = payload_file
         self.logger = logging.getLogger('__main__')
         self.procs = int(procs)
-        self.hook = self.instancer(self.payload)
+        self.executor = executor
+        self.cancel = cancel
+        self.usage = usage
+        # Actions and hooks still running once answered
+        self.pending = PendingTasks()
+        self._payload = payload
+        self.hook = self.instancer(self.payload, event)
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         from os import remove
-        remove(self.payload_file)
+        if self.payload_file:
+            remove(self.payload_file)
+
+    def log_action(self, action, res):
+        """
+        Callback for the actions: log the result of the action and add up
+        what it used, even if done after answering
+        """
+        log_result(res)
+        usage = getattr(res, 'usage', None)
+        if self.usage is not None and usage:
+            self.usage.add(action, self.hook.repo_name, usage)
+
+    @property
+    def cancelled(self):
+        return self.cancel is not None and self.cancel.is_set()
 
     @property
     def payload(self):
-        with open(self.payload_file, 'r') as jsf:
-            payload = json.loads(jsf.read())
-        return payload
+        """
+        :return: The payload of the hook, decoded only once
+        :rtype: Dictionary
+        """
+        if self._payload is None:
+            with open(self.payload_file, 'r') as jsf:
+                self._payload = jsf.read()
+        if isinstance(self._payload, basestring):
+            self._payload = json.loads(self._payload)
+        return self._payload
+
+    def get_pool(self, procs):
+        """
+        :param procs: Processes for the pool when there's no shared executor
+        :return: The shared executor if any, or a new pool for this parser
+        """
+        if self.executor is not None:
+            return self.executor
+        return Pool(processes=procs)
 
     @staticmethod
     def load_hooks(event=False, repository=False, branch=False):
@@ -112,88 +446,169 @@ class HookParser(object):
         return get_hooks(event, repository, branch)
 
     @staticmethod
-    def instancer(payload):
+    def instancer(payload, event=None):
+        """
+        :param payload: Payload of the hook
+        :param event: Event received on the request headers, if any
+        :return: The webhook for the origin of the payload
+        """
         if 'object_kind' in payload.keys():
             return gitlab(payload)
         elif 'hook' in payload.keys():
             return webhook(payload)
         else:
-            return github(payload)
+            return github(payload, event)
 
     def run_event_actions(self, def_conf):
+        if self.cancelled:
+            return 0, SUPERSEDED_MSG
         log = ''
-        if 'nginx_port' not in def_conf.keys():
-            def_conf.update({'nginx_port': '80'})
-        if 'action_timeout' not in def_conf.keys():
-            def_conf.update({'action_timeout': '30'})
-        conf = config_from_environment('HOOKSHUB', [
-            'github_token', 'gitlab_token', 'vhost_path', 'nginx_port',
-            'action_timeout'
-        ], **def_conf)
+        conf = Config.of(def_conf).actions
         timeout = int(conf.get('action_timeout'))
-        i = 0
         # Do a pool with specified procs OR a proc for each action
-        procs = self.procs or len(self.hook.event_actions)
-        if not procs:
-            # If no tasks to do → do nothing
+        actions = self.hook.event_actions
+        if not actions:
+            # If no tasks to do → do nothing (not even writing the payload)
             return 0, log
+        procs = self.procs or len(actions)
+        pool = self.get_pool(procs)
         if self.logger:
             self.logger.error('Executing {} actions for event: {}\n'.format(
-                len(self.hook.event_actions), self.hook.event
+                len(actions), self.hook.event
             ))
             self.logger.info('Running actions on {} processes'.format(
-                procs
+                self.executor.processes if self.executor else procs
             ))
-        pool = Pool(processes=procs)
-        for action in self.hook.event_actions:
-            i += 1
-            if self.logger:
-                self.logger.error('[Running: <{0}/{1}> - {2}]\n'.format(
-                    i, len(self.hook.event_actions), action)
+        try:
+            return self._run_actions(pool, actions, conf, timeout)
+        finally:
+            pool.close()
+
+    @staticmethod
+    def wait_all(submitted, completed, timeout, cancel=None):
+        """
+        Wait for all the submitted tasks under a single deadline
+        :param submitted: Tasks as (name, AsyncResult) tuples
+        :param completed: Names of the tasks, appended by their callbacks
+            as they complete
+        :param timeout: Seconds to wait for all of them
+        :param cancel: Stop waiting as soon as it's set
+            :type: threading.Event
+        :return: Names of the finished tasks, in the order they completed,
+            and the ones still running
+        :rtype: Tuple<List<String>,List<String>>
+        """
+        deadline = time() + timeout
+        for name, proc in submitted:
+            if cancel is None:
+                proc.wait(timeout=max(deadline - time(), 0))
+                continue
+            while not (proc.ready() or cancel.is_set()) and \
+                    time() < deadline:
+                proc.wait(timeout=min(deadline - time(), CANCEL_POLL))
+        ready = [name for name, proc in submitted if proc.ready()]
+        finished = [name for name in completed if name in ready]
+        finished += [name for name in ready if name not in finished]
+        running = [name for name, proc in submitted if name not in ready]
+        return finished, running
+
+    @staticmethod
+    def action_log(action, proc):
+        """
+        :param action: Name of the action
+        :param proc: Task of the action, done
+            :type: AsyncResult
+        :return: If the action failed, and its log
+        :rtype: Tuple<Bool,String>
+        """
+        state = EXITED
+        usage = None
+        try:
+            result = proc.get()
+            stdout, stderr, returncode, pid = result
+            # Stopped at its deadlines, whatever it returned
+            state = getattr(result, 'state', EXITED)
+            usage = getattr(result, 'usage', None)
+        except Exception as err:
+            stdout = ''
+            stderr = 'Could not run action: {}'.format(err)
+            returncode = -1
+
+        output = ''
+        output += ('[{0}]:ProcOut:\n{1}'.format(
+            action, stdout
+        ))
+        output += ('[{0}]:ProcErr:\n{1}'.format(
+            action, stderr
+        ))
+        if usage:
+            output += '\n[{0}]:Usage: {1}'.format(action, describe(usage))
+        failed = bool(returncode) or state != EXITED
+        return failed, '[{0}]:{1}\n[{0}]:{2}\n'.format(
+            action, output, 'Failed!' if failed else 'Success!'
+        )
+
+    def _run_actions(self, pool, actions, conf, timeout):
+        log = ''
+        code = 0
+        completed = []
+        submitted = []
+        # Written once for all the actions, removed once they are all done
+        payload = SharedPayload(json.dumps(self.hook.json))
+        groups = ProcessGroups.create(payload_dir())
+        self.pending.groups.append(groups)
+        running_groups.add(groups)
+        zygote = bool(conf.get('zygote', False))
+        try:
+            for i, action in enumerate(actions, 1):
+                if self.logger:
+                    self.logger.error('[Running: <{0}/{1}> - {2}]\n'.format(
+                        i, len(actions), action)
+                    )
+                proc = pool.apply_async(
+                    run_action,
+                    args=(
+                        action, self.hook, conf, payload.path, zygote, groups
+                    ),
+                    callback=partial(
+                        log_completed, completed, action,
+                        partial(self.log_action, action)
+                    )
                 )
-            proc = pool.apply_async(
-                run_action, args=(action, self.hook, conf),
-                callback=log_result
+                submitted.append((action, proc))
+            finished, running = self.wait_all(
+                submitted, completed, timeout, self.cancel
             )
-            proc.wait(timeout=timeout)
-            if proc.ready():
-                stdout, stderr, returncode, pid = proc.get()
-            else:
-                stdout = stderr = 'Still running async, but answering.' \
-                                  ' Check log for detailed result...'
-                self.logger.error('[{}]:{}'.format(action, stderr))
-                returncode = 0
-
-            output = ''
-            output += ('[{0}]:ProcOut:\n{1}'.format(
-                action, stdout
-            ))
-            output += ('[{0}]:ProcErr:\n{1}'.format(
-                action, stderr
-            ))
-            if returncode and returncode != 0:
-                log += ('[{0}]:{1}\n[{0}]:Failed!\n'.format(
-                    action, output
-                ))
-                return -1, log
-            log += ('[{0}]:{1}\n[{0}]:Success!\n'.format(
-                action, output
-            ))
+            if running and self.cancelled:
+                groups.stop()
+        finally:
+            tasks = [proc for action, proc in submitted]
+            payload.release(tasks)
+            when_done(tasks, partial(forget_groups, groups))
+        procs = dict(submitted)
+        for action in finished + running:
+            proc = procs[action]
+            if action in running:
+                # Its result is only known once done
+                self.pending.add(action, proc, self.action_log)
+                message = STOPPED_MSG if self.cancelled else PENDING_MSG
+                self.logger.error('[{}]:{}'.format(action, message))
+                log += ('[{0}]:[{0}]:ProcOut:\n{1}[{0}]:ProcErr:\n{1}\n'
+                        '[{0}]:Pending!\n'.format(action, message))
+                continue
+            failed, action_log = self.action_log(action, proc)
+            if failed:
+                code = -1
+            log += action_log
 
-        return 0, log
+        return code, log
 
     def run_event_hooks(self, def_conf):
+        if self.cancelled:
+            return 0, SUPERSEDED_MSG
         log = ''
-        if 'nginx_port' not in def_conf.keys():
-            def_conf.update({'nginx_port': '80'})
-        if 'action_timeout' not in def_conf.keys():
-            def_conf.update({'action_timeout': '10'})
-        conf = config_from_environment('HOOKSHUB', [
-            'github_token', 'gitlab_token', 'vhost_path', 'nginx_port',
-            'action_timeout'
-        ], **def_conf)
+        conf = Config.of(def_conf).hooks
         timeout = int(conf.get('action_timeout'))
-        i = 0
         hooks = self.load_hooks(
             self.hook.event, self.hook.repo_name, self.hook.branch_name
         )
@@ -202,16 +617,46 @@ class HookParser(object):
         if not procs:
             # If no tasks to do → do nothing
             return 0, log
+        pool = self.get_pool(procs)
         if self.logger:
             self.logger.error('Executing {} hooks for event: {}\n'.format(
                 len(hooks), self.hook.event
             ))
             self.logger.info('Running actions on {} processes'.format(
-                procs
+                self.executor.processes if self.executor else procs
             ))
-        pool = Pool(processes=procs)
-        for action_name, action in hooks:
-            i += 1
+        try:
+            return self._run_hooks(pool, hooks, conf, timeout)
+        finally:
+            pool.close()
+
+    @staticmethod
+    def hook_log(action_name, proc):
+        """
+        :param action_name: Name of the hook
+        :param proc: Task of the hook, done
+            :type: AsyncResult
+        :return: If the hook failed, and its log
+        :rtype: Tuple<Bool,String>
+        """
+        try:
+            returncode, hook_name = proc.get()
+        except Exception as err:
+            logging.getLogger('__main__').error(
+                '[{}]:Could not run hook: {}'.format(action_name, err)
+            )
+            returncode = -1
+        failed = bool(returncode)
+        return failed, '[{0}]:{1}\n'.format(
+            action_name, 'Failed!' if failed else 'Success!'
+        )
+
+    def _run_hooks(self, pool, hooks, conf, timeout):
+        log = ''
+        code = 0
+        completed = []
+        submitted = []
+        for i, (action_name, action) in enumerate(hooks, 1):
             if self.logger:
                 self.logger.error('[Running: <{0}/{1}> - {2}]\n'.format(
                     i, len(hooks), action_name)
@@ -219,24 +664,31 @@ class HookParser(object):
             args = action.get_args(self.hook, conf)
             proc = pool.apply_async(
                 action.run_hook, args=(args,),
-                callback=log_hook_result
+                callback=partial(
+                    log_completed, completed, action_name, log_hook_result
+                )
             )
-            proc.wait(timeout=timeout)
-            if proc.ready():
-                returncode, hook_name = proc.get()
-            else:
-                strerr = 'Still running async, but answering.' \
-                                  ' Check log for detailed result...'
-                self.logger.error('[{}]:{}'.format(action.title, strerr))
-                returncode = 0
-
-            if returncode and returncode != 0:
-                log += ('[{0}]:Failed!\n'.format(
-                    action_name
+            submitted.append((action_name, proc))
+        procs = dict(submitted)
+        titles = dict(hooks)
+
+        finished, running = self.wait_all(
+            submitted, completed, timeout, self.cancel
+        )
+        for action_name in finished + running:
+            proc = procs[action_name]
+            if action_name in running:
+                # Its result is only known once done
+                self.pending.add(action_name, proc, self.hook_log)
+                self.logger.error('[{}]:{}'.format(
+                    titles[action_name].title,
+                    SUPERSEDED_MSG if self.cancelled else PENDING_MSG
                 ))
-                return -1, log
-            log += ('[{0}]:Success!\n'.format(
-                action_name
-            ))
+                log += '[{0}]:Pending!\n'.format(action_name)
+                continue
+            failed, hook_log = self.hook_log(action_name, proc)
+            if failed:
+                code = -1
+            log += hook_log
 
-        return 0, log
+        return code, log
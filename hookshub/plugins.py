@@ -5,7 +5,7 @@
 # - InstanceManager: https://github.com/getsentry/sentry/blob/master/src/sentry/utils/managers.py
 #
 from collections import namedtuple
-from copy import deepcopy
+from threading import Lock
 import logging
 
 
@@ -90,6 +90,9 @@ class PluginManager(InstanceManager):
     def __init__(self):
         super(PluginManager, self).__init__()
         self._hooks_list = []
+        self._index_lock = Lock()
+        self._snapshot = None
+        self._index = None
 
     def __iter__(self):
         return iter(self.all())
@@ -111,8 +114,67 @@ class PluginManager(InstanceManager):
                 continue
             yield plugin
 
-    def get_hooks(self):
-        return deepcopy(self._hooks_list)
+    def _build_index(self):
+        """
+        Index the registered hooks as event -> repository -> branch. Hooks
+        that leave a field as False are kept in the False bucket of that
+        field, as they match any value.
+        """
+        snapshot = tuple(self._hooks_list)
+        index = {}
+        for pos, hook in enumerate(snapshot):
+            index.setdefault(
+                hook.event or False, {}
+            ).setdefault(
+                hook.repository or False, {}
+            ).setdefault(
+                hook.branch or False, []
+            ).append((pos, hook))
+        self._snapshot = snapshot
+        self._index = index
+
+    def _invalidate(self):
+        with self._index_lock:
+            self._snapshot = None
+            self._index = None
+
+    @staticmethod
+    def _buckets(levels, value):
+        """
+        :return: The buckets of each level that match the value: all of them
+            if there's no value, or the value's and the wildcard's otherwise
+        """
+        for level in levels:
+            if not value:
+                for bucket in level.values():
+                    yield bucket
+            else:
+                for key in (value, False):
+                    if key in level:
+                        yield level[key]
+
+    def get_hooks(self, event=False, repository=False, branch=False):
+        """
+        :return: The registered hooks that match the event, repository and
+            branch (all of them when none is given), in registration order.
+            It's a snapshot of the registry, so it won't change if hooks
+            are registered or unregistered afterwards.
+        :rtype: Tuple
+        """
+        with self._index_lock:
+            if self._index is None:
+                self._build_index()
+            snapshot, index = self._snapshot, self._index
+        if not (event or repository or branch):
+            return snapshot
+        repositories = self._buckets([index], event)
+        branches = self._buckets(repositories, repository)
+        matches = []
+        for bucket in self._buckets(branches, branch):
+            matches.extend(bucket)
+        return tuple(hook for pos, hook in sorted(
+            matches, key=lambda match: match[0]
+        ))
 
     def get_hook(self, cls):
         cls_name = '%s.%s' % (cls.__module__, cls.__name__)
@@ -151,6 +213,7 @@ class PluginManager(InstanceManager):
         self.add(cls_name)
         hook_data, found = self.get_hook(cls)
         self._hooks_list.append(hook_data)
+        self._invalidate()
         return cls
 
     def unregister(self, cls):
@@ -161,6 +224,7 @@ class PluginManager(InstanceManager):
         hook_data, found = self.get_hook(cls)
         if found:
             self._hooks_list.remove(hook_data)
+            self._invalidate()
         self.remove(cls_name)
         return cls
 
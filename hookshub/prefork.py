@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+from time import sleep
+import signal
+import errno
+import os
+import logging
+
+# Seconds before starting again a worker that died
+DEFAULT_RESTART_DELAY = 1
+# Seconds the workers get to exit before being killed
+DEFAULT_STOP_TIMEOUT = 10
+
+
+class Supervisor(object):
+    """
+    Runs `workers` forked processes of the listener and starts them again
+    when they die.
+
+    Everything loaded before `run` (config, plugins, the listening socket)
+    is inherited by the workers, sharing its memory pages until written.
+    Each worker gets its number, kept when it's started again, so it can
+    use its own files (like the journal). The target handles SIGTERM to
+    stop gracefully within `stop_timeout`.
+    """
+    def __init__(self, workers, target, restart_delay=DEFAULT_RESTART_DELAY,
+                 stop_timeout=DEFAULT_STOP_TIMEOUT):
+        """
+        :param workers: Number of worker processes
+        :param target: Called with the number of the worker on each worker
+            process. The worker exits when it returns.
+            :type: Callable
+        """
+        self.workers = int(workers)
+        self.target = target
+        self.restart_delay = float(restart_delay)
+        self.stop_timeout = float(stop_timeout)
+        self.logger = logging.getLogger(__name__)
+        self.running = False
+        self.restarts = 0
+        # Number of the worker running on each pid
+        self.children = {}
+
+    def spawn(self, num):
+        """
+        Start the worker `num`
+        :return: Pid of the worker
+        :rtype: Int
+        """
+        pid = os.fork()
+        if pid:
+            self.children[pid] = num
+            return pid
+        code = 0
+        try:
+            # Until the worker handles them, the signals of the supervisor
+            # stop it right away and the reloads must not kill it
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+            self.target(num)
+        except BaseException:
+            self.logger.exception('Worker {} failed'.format(num))
+            code = 1
+        finally:
+            os._exit(code)
+
+    def reap(self):
+        """
+        Wait for a worker to exit, and start it again while running
+        :return: Pid of the worker that exited, None if there's none left
+        :rtype: Int
+        """
+        try:
+            pid, status = os.wait()
+        except OSError as err:
+            if err.errno == errno.EINTR:
+                return self.reap() if self.running else None
+            if err.errno == errno.ECHILD:
+                return None
+            raise
+        num = self.children.pop(pid, None)
+        if num is not None and self.running:
+            self.logger.error(
+                'Worker {} ({}) exited with status {}, restarting it'.format(
+                    num, pid, status
+                )
+            )
+            self.restarts += 1
+            sleep(self.restart_delay)
+            if self.running:
+                self.spawn(num)
+        return pid
+
+    def run(self):
+        """
+        Start the workers and keep them running until stopped (with
+        SIGTERM or SIGINT). SIGHUP and SIGUSR1 are sent to the workers.
+        """
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGHUP, self.reload)
+        signal.signal(signal.SIGUSR1, self.reload)
+        for num in range(self.workers):
+            self.spawn(num)
+        self.logger.info('Started {} workers'.format(self.workers))
+        while self.running and self.children:
+            self.reap()
+        self.stop()
+
+    def stop(self, signum=None, frame=None):
+        """
+        Stop the workers: SIGTERM first, SIGKILL after `stop_timeout`
+        """
+        self.running = False
+        self.kill(signal.SIGTERM)
+        waited = 0.0
+        while self.children and waited < self.stop_timeout:
+            for pid in list(self.children):
+                try:
+                    done, status = os.waitpid(pid, os.WNOHANG)
+                except OSError:
+                    done = pid
+                if done:
+                    self.children.pop(pid, None)
+            if self.children:
+                sleep(0.05)
+                waited += 0.05
+        self.kill(signal.SIGKILL)
+        for pid in list(self.children):
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+            self.children.pop(pid, None)
+
+    def reload(self, signum=None, frame=None):
+        """
+        Tell the workers to load their config again (SIGHUP, by default) or
+        to look for new plugins (SIGUSR1)
+        """
+        self.kill(signum or signal.SIGHUP)
+
+    def kill(self, signum):
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signum)
+            except OSError:
+                self.children.pop(pid, None)
@@ -0,0 +1,445 @@
+# -*- coding: utf-8 -*-
+from collections import deque
+from threading import Thread, Lock
+from Queue import Queue
+from StringIO import StringIO
+from urllib import unquote
+import asynchat
+import asyncore
+import socket
+import stat
+import errno
+import fcntl
+import sys
+import os
+import logging
+
+DEFAULT_BACKLOG = 1024
+# Threads running the application, the connections are all on one thread
+DEFAULT_THREADS = 8
+# Largest payload accepted, GitHub caps its payloads at 25MB
+DEFAULT_MAX_BODY = 25 * 1024 * 1024
+
+REASONS = {
+    400: 'Bad Request',
+    411: 'Length Required',
+    413: 'Request Entity Too Large',
+    500: 'Internal Server Error'
+}
+
+
+def bind_tcp(host, port, backlog=DEFAULT_BACKLOG):
+    """
+    :return: A non-blocking socket listening on the address
+    :rtype: socket.socket
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.setblocking(0)
+    return sock
+
+
+def bind_unix(path, mode=None, backlog=DEFAULT_BACKLOG):
+    """
+    :param path: Path of the socket. A socket left there by a previous run
+        is replaced.
+    :param mode: Permissions of the socket file (like 0660)
+    :return: A non-blocking socket listening on the path
+    :rtype: socket.socket
+    """
+    if os.path.exists(path):
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            raise IOError(errno.EEXIST, 'Not a socket', path)
+        os.remove(path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # Only the owner can connect until the socket gets its mode
+    umask = os.umask(0o077)
+    try:
+        sock.bind(path)
+    finally:
+        os.umask(umask)
+    if mode is not None:
+        os.chmod(path, mode)
+    sock.listen(backlog)
+    sock.setblocking(0)
+    return sock
+
+
+class HttpChannel(asynchat.async_chat):
+    """
+    A connection to the server. Reads the requests, hands them to the
+    server and writes back the responses, keeping the connection alive
+    between requests when the client wants it.
+
+    Requests sent before the previous one is answered (pipelined) are kept
+    as read, and parsed once it's answered.
+    """
+    def __init__(self, server, sock, addr):
+        asynchat.async_chat.__init__(self, sock=sock, map=server.map)
+        self.server = server
+        self.addr = addr
+        self.pending = False
+        # Set once answered with an error, nothing else is read
+        self.failed = False
+        # Read after the request being answered
+        self.leftover = ''
+        self.reset()
+
+    def reset(self):
+        self.data = []
+        self.environ = None
+        self.keep_alive = False
+        self.set_terminator('\r\n\r\n')
+
+    def readable(self):
+        # One request at a time: don't read the next one until answered
+        return not self.pending and not self.failed and \
+            asynchat.async_chat.readable(self)
+
+    def collect_incoming_data(self, data):
+        if self.failed:
+            return
+        self.data.append(data)
+        if self.environ is None and \
+                sum(len(d) for d in self.data) > 64 * 1024:
+            self.error(400)
+
+    def found_terminator(self):
+        if self.failed:
+            return
+        data = ''.join(self.data)
+        self.data = []
+        if self.environ is not None:
+            self.environ['wsgi.input'] = StringIO(data)
+            return self.dispatch()
+        try:
+            self.environ = self.parse(data)
+        except ValueError:
+            return self.error(400)
+        length = self.environ.get('CONTENT_LENGTH')
+        if length is None:
+            # Chunked bodies are not supported, hooks always have a length
+            if 'chunked' in self.environ.get('HTTP_TRANSFER_ENCODING', ''):
+                return self.error(411)
+            length = '0'
+        if not length.isdigit():
+            return self.error(400)
+        length = int(length)
+        if length > self.server.max_body:
+            return self.error(413)
+        if length:
+            self.set_terminator(length)
+        else:
+            self.environ['wsgi.input'] = StringIO('')
+            self.dispatch()
+
+    def parse(self, data):
+        """
+        :return: The WSGI environ of the request line and headers
+        :rtype: Dictionary
+        """
+        lines = data.split('\r\n')
+        method, uri, version = lines[0].split(' ', 2)
+        path, _, query = uri.partition('?')
+        environ = self.server.base_environ.copy()
+        environ.update({
+            'REQUEST_METHOD': method,
+            'PATH_INFO': unquote(path),
+            'QUERY_STRING': query,
+            'SERVER_PROTOCOL': version,
+            'REMOTE_ADDR': self.addr[0] if self.addr else ''
+        })
+        for line in lines[1:]:
+            name, sep, value = line.partition(':')
+            if not sep:
+                raise ValueError(line)
+            name = name.strip().upper().replace('-', '_')
+            value = value.strip()
+            if name in ('CONTENT_LENGTH', 'CONTENT_TYPE'):
+                environ[name] = value
+            else:
+                environ['HTTP_{}'.format(name)] = value
+        connection = environ.get('HTTP_CONNECTION', '').lower()
+        self.keep_alive = (
+            connection == 'keep-alive' or
+            (version == 'HTTP/1.1' and connection != 'close')
+        )
+        return environ
+
+    def dispatch(self):
+        self.pending = True
+        # Stops asynchat parsing what it read, until this one is answered
+        self.leftover = self.ac_in_buffer
+        self.ac_in_buffer = ''
+        self.server.submit(self, self.environ)
+
+    def feed(self):
+        """
+        Parse the requests read while answering the previous one, as
+        asynchat parses what it reads
+        """
+        while self.ac_in_buffer and not self.pending and not self.failed:
+            data = self.ac_in_buffer
+            terminator = self.get_terminator()
+            if isinstance(terminator, (int, long)):
+                if len(data) < terminator:
+                    self.ac_in_buffer = ''
+                    self.set_terminator(terminator - len(data))
+                    self.collect_incoming_data(data)
+                    return
+                self.ac_in_buffer = data[terminator:]
+                self.set_terminator(0)
+                self.collect_incoming_data(data[:terminator])
+                self.found_terminator()
+                continue
+            index = data.find(terminator)
+            if index == -1:
+                # Keep what may be the start of the terminator
+                kept = asynchat.find_prefix_at_end(data, terminator)
+                self.ac_in_buffer = data[len(data) - kept:]
+                self.collect_incoming_data(data[:len(data) - kept])
+                return
+            self.ac_in_buffer = data[index + len(terminator):]
+            self.collect_incoming_data(data[:index])
+            self.found_terminator()
+
+    def respond(self, response):
+        """
+        Write the response of the current request. Called from the loop.
+        """
+        self.push(response)
+        self.pending = False
+        if self.keep_alive:
+            self.reset()
+            self.ac_in_buffer, self.leftover = self.leftover, ''
+            self.feed()
+        else:
+            self.leftover = ''
+            self.close_when_done()
+
+    def error(self, code):
+        self.keep_alive = False
+        self.pending = True
+        self.failed = True
+        self.ac_in_buffer = ''
+        self.respond(self.server.response(
+            '{} {}'.format(code, REASONS[code]), [], REASONS[code], False
+        ))
+
+    def handle_error(self):
+        self.server.logger.exception('Error on connection {}'.format(
+            self.addr
+        ))
+        self.close()
+
+
+class Waker(asyncore.file_dispatcher):
+    """
+    Wakes the loop up when the application threads have responses ready
+    """
+    def __init__(self, server):
+        # Other threads wake the loop while it may be closing the waker
+        self._lock = Lock()
+        read_fd, self.write_fd = os.pipe()
+        flags = fcntl.fcntl(self.write_fd, fcntl.F_GETFL)
+        fcntl.fcntl(self.write_fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        # The dispatcher keeps its own copy of the read end
+        asyncore.file_dispatcher.__init__(self, read_fd, map=server.map)
+        os.close(read_fd)
+        self.server = server
+
+    def writable(self):
+        return False
+
+    def wake(self):
+        with self._lock:
+            if self.write_fd is None:
+                return
+            try:
+                os.write(self.write_fd, 'x')
+            except OSError as err:
+                if err.errno != errno.EAGAIN:
+                    raise
+
+    def handle_read(self):
+        try:
+            self.recv(4096)
+        except socket.error:
+            pass
+        self.server.flush()
+
+    def handle_close(self):
+        pass
+
+    def close(self):
+        asyncore.file_dispatcher.close(self)
+        with self._lock:
+            if self.write_fd is not None:
+                os.close(self.write_fd)
+                self.write_fd = None
+
+
+class AsyncServer(asyncore.dispatcher):
+    """
+    HTTP server for a WSGI application on an event loop.
+
+    A single thread accepts the connections and reads the requests, so
+    thousands of deliveries can wait on it without a thread each. Once a
+    request is complete, the application runs on one of `threads`
+    threads (the actions and hooks it starts run on the executor) and its
+    response is written back by the loop.
+    """
+    def __init__(self, app, sock, threads=DEFAULT_THREADS,
+                 max_body=DEFAULT_MAX_BODY):
+        """
+        :param app: WSGI application to serve
+        :param sock: Socket listening for connections
+        :param threads: Threads running the application
+        :param max_body: Largest request body accepted, in bytes
+        """
+        self.map = {}
+        asyncore.dispatcher.__init__(self, sock=sock, map=self.map)
+        # The socket is already listening
+        self.accepting = True
+        self.app = app
+        self.threads = int(threads)
+        self.max_body = int(max_body)
+        self.logger = logging.getLogger(__name__)
+        self.running = False
+        # Set by stop, which may be called before the loop starts
+        self.stopped = False
+        self.requests = Queue()
+        self._lock = Lock()
+        self._responses = deque()
+        self._workers = []
+        self.waker = Waker(self)
+        name = sock.getsockname()
+        self.base_environ = {
+            'SERVER_NAME': name[0] if isinstance(name, tuple) else 'unix',
+            'SERVER_PORT': str(name[1]) if isinstance(name, tuple) else '',
+            'SCRIPT_NAME': '',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False
+        }
+
+    def writable(self):
+        return False
+
+    def handle_accept(self):
+        try:
+            pair = self.accept()
+        except socket.error:
+            return
+        if pair is not None:
+            sock, addr = pair
+            HttpChannel(self, sock, addr)
+
+    def handle_error(self):
+        self.logger.exception('Error on the listening socket')
+
+    def submit(self, channel, environ):
+        self.requests.put((channel, environ))
+
+    def flush(self):
+        """
+        Write the responses ready. Called from the loop.
+        """
+        while True:
+            with self._lock:
+                if not self._responses:
+                    return
+                channel, response = self._responses.popleft()
+            if channel.connected:
+                channel.respond(response)
+
+    @staticmethod
+    def response(status, headers, body, keep_alive):
+        """
+        :return: The HTTP response, ready to be written
+        :rtype: String
+        """
+        names = set(name.lower() for name, value in headers)
+        headers = list(headers)
+        if 'content-length' not in names:
+            headers.append(('Content-Length', str(len(body))))
+        headers.append(('Connection', 'keep-alive' if keep_alive else 'close'))
+        head = ['HTTP/1.1 {}'.format(status)]
+        head += ['{}: {}'.format(name, value) for name, value in headers]
+        return '\r\n'.join(head) + '\r\n\r\n' + body
+
+    def call(self, environ, keep_alive):
+        """
+        Run the application for a request
+        :return: The HTTP response
+        :rtype: String
+        """
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [status, headers]
+            return lambda data: None
+        try:
+            result = self.app(environ, start_response)
+            try:
+                body = ''.join(result)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+            status, headers = started
+        except Exception:
+            self.logger.exception('Error running {} {}'.format(
+                environ.get('REQUEST_METHOD'), environ.get('PATH_INFO')
+            ))
+            status, headers, body = '500 {}'.format(REASONS[500]), [], ''
+        return self.response(status, headers, body, keep_alive)
+
+    def _work(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+            channel, environ = request
+            response = self.call(environ, channel.keep_alive)
+            with self._lock:
+                self._responses.append((channel, response))
+            self.waker.wake()
+
+    def serve_forever(self, poll_interval=1.0):
+        self.running = True
+        for num in range(self.threads):
+            thread = Thread(
+                target=self._work, name='hookshub-server-{}'.format(num)
+            )
+            thread.daemon = True
+            thread.start()
+            self._workers.append(thread)
+        try:
+            while not self.stopped:
+                asyncore.loop(
+                    timeout=poll_interval, use_poll=True, map=self.map,
+                    count=1
+                )
+        finally:
+            self.running = False
+            self.shutdown()
+
+    def stop(self):
+        """
+        Stop serving, from any thread
+        """
+        self.stopped = True
+        self.waker.wake()
+
+    def shutdown(self):
+        for thread in self._workers:
+            self.requests.put(None)
+        for thread in self._workers:
+            thread.join()
+        self._workers = []
+        asyncore.close_all(map=self.map)
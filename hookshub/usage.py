@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+from threading import Lock
+import errno
+import os
+
+# Resources summed over the runs of an action
+TOTALS = ['wall', 'user', 'system', 'in_blocks', 'out_blocks']
+
+
+def wait_usage(pid):
+    """
+    Wait for a child to end, with os.wait4 to get what it used
+    :return: Its return code (negative if killed by a signal, like Popen)
+        and its resource usage (see resource_usage, without the wall time)
+    :rtype: Tuple<Int,Dict>
+    """
+    while True:
+        try:
+            pid, status, rusage = os.wait4(pid, 0)
+            break
+        except OSError as err:
+            if err.errno != errno.EINTR:
+                raise
+    if os.WIFSIGNALED(status):
+        returncode = -os.WTERMSIG(status)
+    else:
+        returncode = os.WEXITSTATUS(status)
+    return returncode, resource_usage(rusage)
+
+
+def resource_usage(rusage, wall=None):
+    """
+    :param rusage: Usage of a process, as given by os.wait4 or resource
+    :param wall: Seconds it ran
+    :return: Wall, user and system time (seconds), largest resident set
+        (KB) and blocks read and written
+    :rtype: Dict
+    """
+    return {
+        'wall': wall,
+        'user': rusage.ru_utime,
+        'system': rusage.ru_stime,
+        'max_rss': rusage.ru_maxrss,
+        'in_blocks': rusage.ru_inblock,
+        'out_blocks': rusage.ru_oublock
+    }
+
+
+def describe(usage):
+    """
+    :return: The usage of an action, for its log
+    :rtype: String
+    """
+    values = dict.fromkeys(TOTALS + ['max_rss'], 0)
+    values.update(
+        (name, value) for name, value in usage.items() if value is not None
+    )
+    return (
+        'wall {wall:.3f}s, user {user:.3f}s, system {system:.3f}s, '
+        'max rss {max_rss}KB, blocks in {in_blocks} out {out_blocks}'
+    ).format(**values)
+
+
+class UsageStats(object):
+    """
+    Resources used by the actions, summed for each action and repository,
+    to tell which ones use the build hosts the most
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._actions = {}
+
+    def add(self, action, repository, usage):
+        """
+        :param action: Name of the action
+        :param repository: Name of the repository of the event
+        :param usage: Usage of one run of the action (see resource_usage)
+        """
+        with self._lock:
+            totals = self._actions.setdefault((repository, action), dict(
+                [('runs', 0), ('max_rss', 0)] +
+                [(name, 0) for name in TOTALS]
+            ))
+            totals['runs'] += 1
+            for name in TOTALS:
+                totals[name] += usage.get(name) or 0
+            totals['max_rss'] = max(totals['max_rss'], usage.get('max_rss', 0))
+
+    def get(self, action, repository):
+        """
+        :return: Totals of the action on the repository, None if it never
+            ran
+        :rtype: Dict
+        """
+        with self._lock:
+            totals = self._actions.get((repository, action))
+            return dict(totals) if totals else None
+
+    def stats(self):
+        """
+        :return: Totals of each action, by repository
+        :rtype: Dict
+        """
+        stats = {}
+        with self._lock:
+            for (repository, action), totals in self._actions.items():
+                stats.setdefault(repository, {})[action] = dict(totals)
+        return stats
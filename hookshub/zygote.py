@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+from os.path import basename, dirname, abspath, realpath, join
+from importlib import import_module
+from hookshub.usage import wait_usage
+import traceback
+import signal
+import runpy
+import sys
+import os
+import logging
+
+# Modules the actions commonly use, imported once before forking them
+DEFAULT_PRELOAD = [
+    'json', 'subprocess', 'tempfile', 'shutil', 'urllib2', 'requests',
+    'hookshub.hooks.github', 'hookshub.hooks.gitlab'
+]
+
+
+def find_executable(name):
+    """
+    :param name: Command to find on the PATH, as env does
+    :return: Its path, None if not found
+    :rtype: String
+    """
+    if os.sep in name:
+        return name
+    for directory in os.environ.get('PATH', os.defpath).split(os.pathsep):
+        path = join(directory, name)
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+    return None
+
+
+def is_python_action(path):
+    """
+    :param path: Executable of the action
+    :return: If the action is a script for the interpreter of the listener:
+        its shebang resolves to this python (directly or through env), or it
+        has none and is a .py. Scripts for any other interpreter or
+        virtualenv are not, as they need their own modules and sys.path.
+    :rtype: Bool
+    """
+    try:
+        with open(path, 'r') as action:
+            first = action.readline(256)
+    except IOError:
+        return False
+    if not first.startswith('#!'):
+        return path.endswith('.py')
+    command = first[2:].split()
+    if not command:
+        return False
+    interpreter = command[0]
+    if basename(interpreter) == 'env' and len(command) > 1:
+        if not basename(command[1]).startswith('python'):
+            return False
+        interpreter = find_executable(command[1])
+        if interpreter is None:
+            return False
+    return realpath(interpreter) == realpath(sys.executable)
+
+
+def exit_code(code):
+    """
+    :param code: Code of a SystemExit
+    :return: The exit status of a script that exits with it
+    :rtype: Int
+    """
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code & 0xff
+    sys.stderr.write('{}\n'.format(code))
+    return 1
+
+
+class Zygote(object):
+    """
+    Runs the Python actions as forked children of this process, with the
+    modules they commonly use already imported, instead of starting a new
+    interpreter for each one.
+
+    The actions get the same arguments, their output and error output are
+    read the same way and they end with the same exit status as when run as
+    a new process, so it's `spawn` and `wait` for a Python action or Popen
+    for any other.
+    Forking only copies the memory pages written afterwards, so preloading
+    big modules costs nothing to each action.
+    """
+    def __init__(self, preload=None):
+        """
+        :param preload: Modules to import before forking the actions
+            :type: List<String>
+        """
+        self.preload = list(DEFAULT_PRELOAD if preload is None else preload)
+        self.logger = logging.getLogger(__name__)
+        self.loaded = []
+        self.pid = None
+
+    @property
+    def started(self):
+        return self.pid == os.getpid()
+
+    def start(self):
+        """
+        Import the modules to preload, skipping the ones not installed
+        """
+        self.loaded = []
+        for name in self.preload:
+            try:
+                import_module(name)
+            except Exception as err:
+                self.logger.warning('Could not preload {}: {}'.format(
+                    name, err
+                ))
+                continue
+            self.loaded.append(name)
+        self.pid = os.getpid()
+        return self
+
+    def spawn(self, args):
+        """
+        Start a Python action on a forked child, leading its own process
+        group (as its pid)
+        :param args: Script of the action and its arguments
+            :type: List<String>
+        :return: Pid of the child, and its output and error output to read
+            them as it writes them
+        :rtype: Tuple<Int,file,file>
+        """
+        if not self.started:
+            self.start()
+        out_read, out_write = os.pipe()
+        err_read, err_write = os.pipe()
+        pid = os.fork()
+        if not pid:
+            os.close(out_read)
+            os.close(err_read)
+            self._child(args, out_write, err_write)
+        os.close(out_write)
+        os.close(err_write)
+        return pid, os.fdopen(out_read, 'r'), os.fdopen(err_read, 'r')
+
+    @staticmethod
+    def wait(pid):
+        """
+        Wait for an action to end
+        :return: Its return code, negative if killed by a signal
+        :rtype: Int
+        """
+        return wait_usage(pid)[0]
+
+    @staticmethod
+    def _child(args, out_fd, err_fd):
+        """
+        Run the script on the forked child, as its main module, and exit
+        """
+        code = 1
+        try:
+            # On its own process group, to stop it with what it started
+            os.setsid()
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            os.dup2(out_fd, 1)
+            os.dup2(err_fd, 2)
+            os.close(out_fd)
+            os.close(err_fd)
+            sys.stdout = os.fdopen(1, 'w')
+            sys.stderr = os.fdopen(2, 'w')
+            sys.argv = list(args)
+            sys.path.insert(0, dirname(abspath(args[0])))
+            try:
+                runpy.run_path(args[0], run_name='__main__')
+                code = 0
+            except SystemExit as err:
+                code = exit_code(err.code)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                os._exit(code)
+
+
+# Zygote of this process, started by the first Python action it runs
+zygote = None
+
+
+def get_zygote(preload=None):
+    """
+    :return: The zygote of this process (each pool worker has its own)
+    :rtype: Zygote
+    """
+    global zygote
+    if zygote is None or not zygote.started:
+        zygote = Zygote(preload).start()
+    return zygote
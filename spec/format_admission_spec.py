@@ -0,0 +1,67 @@
+from hookshub.admission import AdmissionControl, EVENTS, QUEUED, ACTIONS
+from expects import *
+
+
+def usage_of(events=0, queued=0, actions=0):
+    return lambda: {EVENTS: events, QUEUED: queued, ACTIONS: actions}
+
+
+with description('Admission Control'):
+    with context('Checking the limits'):
+        with it('must admit events while under every limit'):
+            admission = AdmissionControl(
+                usage_of(1, 2, 3), max_events=2, max_queued=3, max_actions=4
+            )
+            expect(admission.check()).to(be_none)
+
+        with it('must tell the first limit reached'):
+            admission = AdmissionControl(usage_of(queued=5), max_queued=5)
+            expect(admission.check()).to(equal(QUEUED))
+            admission = AdmissionControl(usage_of(actions=9), max_actions=8)
+            expect(admission.check()).to(equal(ACTIONS))
+
+        with it('must not check the limits not set'):
+            admission = AdmissionControl(usage_of(100, 100, 100))
+            expect(admission.check()).to(be_none)
+            expect(admission.pressure()).to(equal(0.0))
+
+        with it('must count the events run by the listener until released'):
+            admission = AdmissionControl(usage_of(), max_events=1)
+            expect(admission.check()).to(be_none)
+            expect(admission.check()).to(equal(EVENTS))
+            admission.release()
+            expect(admission.check()).to(be_none)
+
+        with it('must reserve the room of an admitted event'):
+            admission = AdmissionControl(usage_of(queued=1), max_queued=2)
+            expect(admission.check(QUEUED)).to(be_none)
+            expect(admission.check(QUEUED)).to(equal(QUEUED))
+            admission.release(QUEUED)
+            expect(admission.check(QUEUED)).to(be_none)
+
+        with it('must admit a single event of concurrent requests'):
+            from threading import Thread
+            admitted = []
+            admission = AdmissionControl(usage_of(), max_events=1)
+            threads = [
+                Thread(target=lambda: admitted.append(admission.check()))
+                for num in range(8)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            expect(admitted.count(None)).to(equal(1))
+
+    with context('Pressure'):
+        with it('must be the usage of the most used limit'):
+            admission = AdmissionControl(
+                usage_of(1, 3, 0), max_events=4, max_queued=4
+            )
+            expect(admission.pressure()).to(equal(0.75))
+            admission.reject()
+            admission.reject(spilled=True)
+            stats = admission.stats()
+            expect(stats['pressure']).to(equal(0.75))
+            expect(stats['rejected']).to(equal(1))
+            expect(stats['spilled']).to(equal(1))
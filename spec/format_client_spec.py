@@ -0,0 +1,57 @@
+from hookshub.client import ApiClient, get_client, log_metrics
+from expects import *
+from mock import patch, Mock
+
+import requests
+
+
+with description('API Client'):
+    with it('must use a session with a pool and retries for each host'):
+        client = ApiClient(retries=5, backoff=1, pool_size=3)
+        adapter = client.session.get_adapter('https://api.github.com')
+        expect(adapter.max_retries.total).to(equal(5))
+        expect(adapter.max_retries.backoff_factor).to(equal(1))
+        expect(adapter._pool_maxsize).to(equal(3))
+
+    with it('must set a timeout on the requests without one'):
+        client = ApiClient(timeout=7)
+        with patch.object(client.session, 'request') as request:
+            client.get('https://api.github.com/repos')
+            client.post('https://api.github.com/repos', timeout=1)
+            expect(request.call_args_list[0][1]['timeout']).to(equal(7))
+            expect(request.call_args_list[1][1]['timeout']).to(equal(1))
+
+    with it('must keep the latency of the requests per method and host'):
+        client = ApiClient()
+        with patch.object(client.session, 'request') as request:
+            client.get('https://api.github.com/repos')
+            client.get('https://api.github.com/users')
+            request.side_effect = requests.ConnectionError('Mocked Error')
+            expect(lambda: client.post('https://gitlab.com/api')).to(
+                raise_error(requests.ConnectionError))
+        metrics = client.metrics()
+        expect(metrics['GET api.github.com']['requests']).to(equal(2))
+        expect(metrics['GET api.github.com']['errors']).to(equal(0))
+        expect(metrics['POST gitlab.com']['errors']).to(equal(1))
+        expect(metrics['GET api.github.com']['max_time']).to(
+            be_above_or_equal(0))
+
+    with it('must share one client per process'):
+        client = get_client()
+        expect(get_client()).to(be(client))
+        with patch('hookshub.client.os.getpid', return_value=-1):
+            forked = get_client()
+        expect(forked).not_to(be(client))
+
+    with it('must log the metrics of the client of this process'):
+        client = get_client()
+        with patch.object(client.session, 'request'):
+            client.get('https://api.github.com/repos')
+        with patch('hookshub.client.logging.getLogger') as get_logger:
+            log_metrics()
+            message = get_logger.return_value.info.call_args[0][0]
+        expect(message).to(start_with('GET api.github.com: 1 requests'))
+        with patch('hookshub.client.os.getpid', return_value=-1):
+            with patch('hookshub.client.logging.getLogger') as get_logger:
+                log_metrics()
+                expect(get_logger.return_value.info.called).to(be_false)
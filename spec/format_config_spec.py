@@ -0,0 +1,103 @@
+from os.path import join
+from json import dumps
+from hookshub.config import Config, ConfigFile
+from hookshub.parser import TempDir
+from osconf import RequiredException
+from expects import *
+from mock import patch
+
+REQUIRED = {
+    'github_token': 'token', 'gitlab_token': 'token', 'vhost_path': '/tmp'
+}
+
+
+with description('Config'):
+    with context('Snapshots'):
+        with it('must resolve the actions and hooks config when made'):
+            config = Config(REQUIRED)
+            expect(config.actions['action_timeout']).to(equal('30'))
+            expect(config.hooks['action_timeout']).to(equal('10'))
+            expect(config.actions['nginx_port']).to(equal('80'))
+            expect(config.actions['vhost_path']).to(equal('/tmp'))
+
+        with it('must read the environment only when made'):
+            with patch.dict('os.environ', {'HOOKSHUB_NGINX_PORT': '8080'}):
+                config = Config(REQUIRED)
+            with patch('hookshub.config.config_from_environment') as env:
+                expect(config.actions['nginx_port']).to(equal(8080))
+                expect(config.hooks['nginx_port']).to(equal(8080))
+                expect(env.called).to(be_false)
+
+        with it('must raise when a required value is missing'):
+            with patch.dict('os.environ', {}, clear=True):
+                config = Config({'github_token': 'token'})
+            expect(lambda: config.actions).to(raise_error(RequiredException))
+            expect(config['github_token']).to(equal('token'))
+
+        with it('must not change with the values it was made from'):
+            values = dict(REQUIRED, nested={'key': 'value'})
+            config = Config(values)
+            values['nested']['key'] = 'changed'
+            values['vhost_path'] = '/var'
+            expect(config['nested']).to(equal({'key': 'value'}))
+            expect(config['vhost_path']).to(equal('/tmp'))
+            expect(hasattr(config, 'update')).to(be_false)
+
+        with it('must merge the overrides of each repository'):
+            config = Config(dict(REQUIRED, action_timeout='60', repositories={
+                'slow_repo': {'action_timeout': '600'}
+            }))
+            repository = config.repository('slow_repo')
+            expect(repository.actions['action_timeout']).to(equal('600'))
+            expect(repository['vhost_path']).to(equal('/tmp'))
+            expect(config.repository('other_repo')).to(be(config))
+            expect(config.actions['action_timeout']).to(equal('60'))
+
+    with context('Config file'):
+        with before.each:
+            self.tmp = TempDir()
+            self.path = join(self.tmp.dir, 'config.json')
+            with open(self.path, 'w') as cfg:
+                cfg.write(dumps({'processes': 2, 'server': 'async'}))
+
+        with after.each:
+            self.tmp.__exit__(None, None, None)
+
+        with it('must load the file once and use the defaults it misses'):
+            settings = ConfigFile(self.path, {'processes': 4, 'dedup': True})
+            config = settings.current
+            expect(config['processes']).to(equal(2))
+            expect(config['dedup']).to(be_true)
+            expect(settings.current).to(be(config))
+
+        with it('must swap the snapshot when reloaded'):
+            settings = ConfigFile(self.path)
+            config = settings.current
+            with open(self.path, 'w') as cfg:
+                cfg.write(dumps({'processes': 8}))
+            settings.reload()
+            expect(settings.current['processes']).to(equal(8))
+            expect(config['processes']).to(equal(2))
+            expect(settings.reloads).to(equal(1))
+
+        with it('must keep the snapshot if the file is broken'):
+            settings = ConfigFile(self.path)
+            config = settings.current
+            with open(self.path, 'w') as cfg:
+                cfg.write('{"processes": ')
+            settings.reload()
+            expect(settings.current).to(be(config))
+
+        with it('must see when the file changed'):
+            from os import utime
+            settings = ConfigFile(self.path)
+            settings.load()
+            expect(settings.changed()).to(be_false)
+            utime(self.path, (0, 0))
+            expect(settings.changed()).to(be_true)
+
+        with it('must have only the defaults without a file'):
+            settings = ConfigFile(join(self.tmp.dir, 'missing.json'), {
+                'processes': 4
+            })
+            expect(dict(settings.current)).to(equal({'processes': 4}))
@@ -0,0 +1,67 @@
+from time import sleep
+from subprocess import Popen
+from hookshub.deadline import Deadline, ProcessGroups, deadlines
+from hookshub.deadline import EXITED, TERMINATED, KILLED
+from expects import *
+from mock import patch
+import signal
+import os
+
+
+with description('Deadline'):
+    with it('must signal the process group past each deadline'):
+        with patch('hookshub.deadline.os.killpg') as killpg:
+            with Deadline(1234, soft=0.05, hard=0.1) as deadline:
+                sleep(0.3)
+        expect(killpg.call_args_list[0][0]).to(equal((1234, signal.SIGTERM)))
+        expect(killpg.call_args_list[1][0]).to(equal((1234, signal.SIGKILL)))
+        expect(deadline.state).to(equal(KILLED))
+        expect(deadline.expired).to(be_true)
+
+    with it('must not signal the action once done'):
+        with patch('hookshub.deadline.os.killpg') as killpg:
+            with Deadline(1234, soft=0.1, hard=0.2) as deadline:
+                pass
+            sleep(0.3)
+        expect(killpg.called).to(be_false)
+        expect(deadline.state).to(equal(EXITED))
+
+    with it('must not enforce a deadline of 0'):
+        with patch('hookshub.deadline.os.killpg') as killpg:
+            with Deadline(1234, soft=0.05, hard=0) as deadline:
+                sleep(0.2)
+        expect(killpg.call_count).to(equal(1))
+        expect(deadline.state).to(equal(TERMINATED))
+
+    with it('must give deadlines relative to the action timeout'):
+        expect(deadlines({'action_timeout': '30'})).to(equal((3600, 3660)))
+        expect(deadlines({'action_timeout': '10'})).to(equal((1200, 1260)))
+        expect(deadlines({
+            'action_timeout': '30', 'action_soft_deadline': 60
+        })).to(equal((60, 120)))
+        expect(deadlines({'action_hard_deadline': 0})).to(equal((3600, 0)))
+
+
+with description('Process Groups'):
+    with it('must stop the actions still running with what they started'):
+        groups = ProcessGroups.create()
+        proc = Popen(['sh', '-c', 'sleep 30 & wait'], preexec_fn=os.setsid)
+        expect(groups.started(proc.pid)).to(be_false)
+        groups.started(1234)
+        groups.ended(1234)
+        expect(groups.running()).to(equal([proc.pid]))
+        expect(groups.stop(grace=0)).to(equal([proc.pid]))
+        expect(proc.wait()).to(equal(-signal.SIGTERM))
+        expect(groups.stopped).to(be_true)
+        groups.remove()
+        expect(groups.running()).to(equal([]))
+
+    with it('must kill the actions still running after the grace'):
+        groups = ProcessGroups.create()
+        proc = Popen(['sh', '-c', 'trap "" TERM; sleep 30'],
+                     preexec_fn=os.setsid)
+        sleep(0.1)
+        groups.started(proc.pid)
+        groups.stop(grace=0.1)
+        expect(proc.wait()).to(equal(-signal.SIGKILL))
+        groups.remove()
@@ -0,0 +1,110 @@
+from os.path import join
+from hookshub.dedup import DeliveryCache, delivery_key
+from hookshub.parser import TempDir
+from expects import *
+from mock import patch
+
+
+with description('Delivery Cache'):
+    with context('Delivery keys'):
+        with it('must use the id sent by GitHub or GitLab'):
+            expect(delivery_key({'X-GitHub-Delivery': 'gh-id'}, '{}')).to(
+                equal('gh-id'))
+            expect(delivery_key({'X-Gitlab-Event-UUID': 'gl-id'}, '{}')).to(
+                equal('gl-id'))
+
+        with it('must hash the payload when there is no id'):
+            key = delivery_key({}, '{"hook": 1}')
+            expect(key).to(start_with('sha1:'))
+            expect(delivery_key({}, '{"hook": 1}')).to(equal(key))
+            expect(delivery_key({}, '{"hook": 2}')).not_to(equal(key))
+
+    with context('Claiming deliveries'):
+        with it('must only claim a delivery once'):
+            cache = DeliveryCache()
+            expect(cache.claim('id')).to(be_true)
+            expect(cache.claim('id')).to(be_false)
+            expect('id' in cache).to(be_true)
+
+        with it('must claim again a released delivery'):
+            cache = DeliveryCache()
+            cache.claim('id')
+            cache.release('id')
+            expect(cache.claim('id')).to(be_true)
+
+        with it('must forget the deliveries after the ttl'):
+            cache = DeliveryCache(ttl=10)
+            with patch('hookshub.dedup.time') as time:
+                time.return_value = 100
+                cache.claim('id')
+                time.return_value = 111
+                expect(cache.claim('id')).to(be_true)
+
+        with it('must forget the least recently seen deliveries'):
+            cache = DeliveryCache(size=2)
+            for key in ('first', 'second'):
+                cache.claim(key)
+            cache.claim('first')
+            cache.claim('third')
+            expect(len(cache)).to(equal(2))
+            expect('second' in cache).to(be_false)
+            expect('first' in cache).to(be_true)
+
+    with context('Persisted deliveries'):
+        with before.each:
+            self.tmp = TempDir()
+            self.path = join(self.tmp.dir, 'deliveries')
+
+        with after.each:
+            self.tmp.__exit__(None, None, None)
+
+        with it('must remember the deliveries after a restart'):
+            cache = DeliveryCache(path=self.path)
+            cache.claim('kept')
+            cache.claim('released')
+            cache.release('released')
+            cache.close()
+            cache = DeliveryCache(path=self.path)
+            expect(cache.claim('kept')).to(be_false)
+            expect(cache.claim('released')).to(be_true)
+            cache.close()
+
+        with it('must write the file again without the deliveries forgotten'):
+            cache = DeliveryCache(ttl=10, path=self.path, compact=5)
+            with patch('hookshub.dedup.time') as time:
+                time.return_value = 100
+                for num in range(5):
+                    cache.claim('old-{}'.format(num))
+                time.return_value = 111
+                cache.claim('new')
+                for num in range(5):
+                    cache.claim('released-{}'.format(num))
+                    cache.release('released-{}'.format(num))
+            with open(self.path, 'r') as saved:
+                lines = saved.read().splitlines()
+            expect(len(lines)).to(be_below(6))
+            expect(lines[0]).to(equal('new 111'))
+            cache.close()
+
+        with it('must share the deliveries with the other processes'):
+            first = DeliveryCache(path=self.path)
+            second = DeliveryCache(path=self.path)
+            expect(first.claim('delivery')).to(be_true)
+            expect(second.claim('delivery')).to(be_false)
+            second.release('delivery')
+            expect(first.claim('delivery')).to(be_true)
+            first.close()
+            second.close()
+
+        with it('must read the file again once written again by another'):
+            first = DeliveryCache(path=self.path, compact=2)
+            second = DeliveryCache(path=self.path)
+            second.claim('kept')
+            for num in range(3):
+                first.claim('released-{}'.format(num))
+                first.release('released-{}'.format(num))
+            expect(second.claim('kept')).to(be_false)
+            expect(second.claim('released-0')).to(be_true)
+            expect(first.claim('kept')).to(be_false)
+            first.close()
+            second.close()
@@ -0,0 +1,296 @@
+from hookshub.dispatcher import Dispatcher, Delivery, new_delivery_id
+from hookshub.dispatcher import QUEUED, DONE, SUPERSEDED, CANCELLED
+from hookshub.dispatcher import PENDING
+from time import sleep
+from expects import *
+from mock import patch, Mock
+
+
+def ok_handler(event, payload):
+    return 0, 'All Ok on {}'.format(event)
+
+
+def bad_handler(event, payload):
+    raise Exception('Mocked Failure')
+
+
+class FakePending(object):
+    """
+    Tasks left running by a handler, done once `done` is set
+    """
+    def __init__(self, code=0, output='[action]:Success!'):
+        from threading import Event
+        self.done = Event()
+        self.terminated = False
+        self.code = code
+        self.output = output
+
+    def ready(self):
+        return self.done.is_set()
+
+    def wait(self):
+        self.done.wait(5)
+
+    def terminate(self):
+        self.terminated = True
+        self.done.set()
+
+    def result(self):
+        self.done.wait(5)
+        return self.code, self.output
+
+
+def pending_handler(tasks):
+    def handler(event, payload, pending, cancel=None):
+        pending.append(tasks[payload['num']])
+        return 0, '[action]:Pending!'
+    return handler
+
+
+with description('Dispatcher'):
+    with context('Delivery ids'):
+        with it('must use the id sent by GitHub or GitLab'):
+            expect(new_delivery_id({'X-GitHub-Delivery': 'gh-id'})).to(
+                equal('gh-id'))
+            expect(new_delivery_id({'X-Gitlab-Event-UUID': 'gl-id'})).to(
+                equal('gl-id'))
+
+        with it('must create a new id when there is none'):
+            first = new_delivery_id({})
+            expect(first).not_to(be_empty)
+            expect(new_delivery_id()).not_to(equal(first))
+
+    with context('Queued deliveries'):
+        with it('must keep the delivery queued until a worker runs it'):
+            dispatcher = Dispatcher(ok_handler)
+            delivery = dispatcher.submit('id', 'push', {'hook': 'webhook'})
+            expect(delivery.state).to(equal(QUEUED))
+            expect(dispatcher.get('id')).to(be(delivery))
+            expect(dispatcher.stats()['queued']).to(equal(1))
+
+        with it('must run the delivery and keep its result'):
+            dispatcher = Dispatcher(ok_handler)
+            delivery = dispatcher.submit('id', 'push', {'hook': 'webhook'})
+            dispatcher.run(dispatcher.queue.get())
+            result = dispatcher.get('id').as_dict()
+            expect(result['state']).to(equal(DONE))
+            expect(result['code']).to(equal(0))
+            expect(result['output']).to(equal('All Ok on push'))
+
+        with it('must record a failure when the handler raises'):
+            with patch('hookshub.dispatcher.logging'):
+                dispatcher = Dispatcher(bad_handler)
+                dispatcher.submit('id', 'push', {'hook': 'webhook'})
+                delivery = dispatcher.run(dispatcher.queue.get())
+                expect(delivery.code).to(equal(-1))
+                expect(delivery.output).to(contain('Mocked Failure'))
+
+        with it('must hand the failed deliveries to be forgotten'):
+            failed = Mock()
+            handler = Mock(side_effect=[(0, 'All Ok'), (-1, 'Failed')])
+            dispatcher = Dispatcher(handler, failed=failed)
+            dispatcher.submit('ok', 'push', {}, key='ok-key')
+            dispatcher.submit('bad', 'push', {}, key='bad-key')
+            dispatcher.run(dispatcher.queue.get())
+            expect(failed.called).to(be_false)
+            delivery = dispatcher.run(dispatcher.queue.get())
+            failed.assert_called_once_with(delivery)
+            expect(delivery.key).to(equal('bad-key'))
+
+        with it('must only keep the last deliveries in the history'):
+            dispatcher = Dispatcher(ok_handler, history=2)
+            for num in range(3):
+                dispatcher.submit(str(num), 'push', {'hook': 'webhook'})
+            expect(dispatcher.get('0')).to(be_none)
+            expect(dispatcher.get('2')).not_to(be_none)
+
+    with context('Worker threads'):
+        with it('must run the queued deliveries in background'):
+            dispatcher = Dispatcher(ok_handler, workers=2).start()
+            deliveries = [
+                dispatcher.submit(str(num), 'push', {'hook': 'webhook'})
+                for num in range(4)
+            ]
+            dispatcher.stop()
+            expect([d.state for d in deliveries]).to(
+                equal([DONE] * 4))
+
+    with context('Superseded pushes'):
+        with it('must skip a queued push superseded by a newer one'):
+            handler = Mock(return_value=(0, 'All Ok'))
+            dispatcher = Dispatcher(handler)
+            old = dispatcher.submit('old', 'push', {}, ref=('repo', 'master'))
+            other = dispatcher.submit('other', 'push', {}, ref=('repo', 'dev'))
+            new = dispatcher.submit('new', 'push', {}, ref=('repo', 'master'))
+            while not dispatcher.queue.empty():
+                dispatcher.run(dispatcher.queue.get())
+            expect(old.state).to(equal(SUPERSEDED))
+            expect(old.as_dict()['superseded_by']).to(equal('new'))
+            expect(other.state).to(equal(DONE))
+            expect(new.state).to(equal(DONE))
+            expect(handler.call_count).to(equal(2))
+
+        with it('must cancel a running push superseded by a newer one'):
+            dispatcher = Dispatcher(None, cancel_superseded=True)
+
+            def handler(event, payload, cancel):
+                dispatcher.submit('new', 'push', {}, ref=('repo', 'master'))
+                expect(cancel.is_set()).to(be_true)
+                return 0, 'Cancelled'
+            dispatcher.handler = handler
+            dispatcher.submit('old', 'push', {}, ref=('repo', 'master'))
+            old = dispatcher.run(dispatcher.queue.get())
+            expect(old.state).to(equal(CANCELLED))
+            new = dispatcher.queue.get()
+            expect(new.id).to(equal('new'))
+            expect(new.superseded_by).to(be_none)
+
+        with it('must stop the actions of a pending push superseded'):
+            tasks = [FakePending(), FakePending()]
+            dispatcher = Dispatcher(
+                pending_handler(tasks), cancel_superseded=True,
+                follow_pending=True
+            )
+            old = dispatcher.submit(
+                'old', 'push', {'num': 0}, ref=('repo', 'master'))
+            dispatcher.run(dispatcher.queue.get())
+            expect(old.state).to(equal(PENDING))
+            dispatcher.submit(
+                'new', 'push', {'num': 1}, ref=('repo', 'master'))
+            expect(tasks[0].terminated).to(be_true)
+            for attempt in range(50):
+                if old.state != PENDING:
+                    break
+                sleep(0.01)
+            expect(old.state).to(equal(CANCELLED))
+
+        with it('must wait the debounce window before queuing a push'):
+            dispatcher = Dispatcher(ok_handler, debounce=0.05)
+            dispatcher.submit('old', 'push', {}, ref=('repo', 'master'))
+            dispatcher.submit('new', 'push', {}, ref=('repo', 'master'))
+            dispatcher.submit('issue', 'issues', {})
+            expect(dispatcher.queue.qsize()).to(equal(1))
+            ids = [dispatcher.queue.get(timeout=1).id for num in range(3)]
+            expect(sorted(ids)).to(equal(['issue', 'new', 'old']))
+            expect(dispatcher.get('old').superseded_by).to(equal('new'))
+
+    with context('Repository lanes'):
+        with it('must queue a delivery after the previous one of its lane'):
+            dispatcher = Dispatcher(ok_handler)
+            lane = ('repo', 'master')
+            dispatcher.submit('first', 'push', {}, lane=lane)
+            dispatcher.submit('other', 'push', {}, lane=('other', 'master'))
+            dispatcher.submit('second', 'status', {}, lane=lane)
+            expect(dispatcher.queue.qsize()).to(equal(2))
+            expect(dispatcher.stats()['lanes']).to(equal(2))
+            expect(dispatcher.queue.get().id).to(equal('first'))
+            dispatcher.run(dispatcher.get('first'))
+            expect(dispatcher.queue.get().id).to(equal('other'))
+            expect(dispatcher.queue.get().id).to(equal('second'))
+
+        with it('must keep the lane until the pending tasks are done'):
+            tasks = [FakePending(-1, '[action]:Failed!'), FakePending()]
+            dispatcher = Dispatcher(
+                pending_handler(tasks), follow_pending=True
+            )
+            lane = ('repo', 'master')
+            first = dispatcher.submit('first', 'push', {'num': 0}, lane=lane)
+            dispatcher.submit('second', 'push', {'num': 1}, lane=lane)
+            dispatcher.run(dispatcher.queue.get())
+            expect(first.state).to(equal(PENDING))
+            expect(dispatcher.stats()['pending']).to(equal(1))
+            expect(dispatcher.queue.empty()).to(be_true)
+            tasks[0].done.set()
+            second = dispatcher.queue.get(timeout=1)
+            expect(second.id).to(equal('second'))
+            expect(first.state).to(equal(DONE))
+            expect(first.code).to(equal(-1))
+            expect(first.output).to(contain('[action]:Failed!'))
+
+        with it('must not wait for the pending tasks longer than the stop'):
+            from time import time
+            tasks = [FakePending(), FakePending()]
+            dispatcher = Dispatcher(
+                pending_handler(tasks), follow_pending=True
+            ).start()
+            lane = ('repo', 'master')
+            first = dispatcher.submit('first', 'push', {'num': 0}, lane=lane)
+            dispatcher.submit('second', 'push', {'num': 1}, lane=lane)
+            for attempt in range(50):
+                if first.state == PENDING:
+                    break
+                sleep(0.01)
+            started = time()
+            dispatcher.stop(timeout=0.2)
+            expect(time() - started).to(be_below(1))
+            expect(dispatcher.get('second').state).to(equal(QUEUED))
+
+        with it('must run each lane in order and lanes in parallel'):
+            from threading import Lock
+            from time import sleep
+            lock = Lock()
+            running = set()
+            order = []
+            overlapped = []
+
+            def handler(event, payload):
+                with lock:
+                    expect(payload['lane'] in running).to(be_false)
+                    running.add(payload['lane'])
+                    overlapped.append(len(running) > 1)
+                sleep(0.01)
+                with lock:
+                    running.remove(payload['lane'])
+                    order.append((payload['lane'], payload['num']))
+                return 0, 'All Ok'
+
+            dispatcher = Dispatcher(handler, workers=4).start()
+            for num in range(3):
+                for lane in ('a', 'b'):
+                    dispatcher.submit(
+                        '{}{}'.format(lane, num), 'push',
+                        {'lane': lane, 'num': num}, lane=(lane, 'master')
+                    )
+            dispatcher.stop()
+            for lane in ('a', 'b'):
+                expect([n for l, n in order if l == lane]).to(
+                    equal([0, 1, 2]))
+            expect(any(overlapped)).to(be_true)
+
+    with context('Priority classes'):
+        with it('must queue each event on the queue of its class'):
+            dispatcher = Dispatcher(ok_handler, classes={
+                'fast': {'events': ['status', 'watch'], 'workers': 1}
+            })
+            status = dispatcher.submit('status', 'status', {}, 'status')
+            push = dispatcher.submit('push', 'push', {}, 'push')
+            expect(status.priority).to(equal('fast'))
+            expect(push.priority).to(equal('default'))
+            classes = dispatcher.stats()['classes']
+            expect(classes['fast']).to(equal({'workers': 1, 'queued': 1}))
+            expect(classes['default']['queued']).to(equal(1))
+            expect(dispatcher.queue.get()).to(be(push))
+
+        with it('must not wait for the events of other classes'):
+            from threading import Event
+            release = Event()
+            done = Event()
+
+            def handler(event, payload, priority):
+                if priority == 'default':
+                    release.wait(1)
+                else:
+                    done.set()
+                return 0, priority
+
+            dispatcher = Dispatcher(handler, workers=1, classes={
+                'fast': {'events': ['status'], 'workers': 1}
+            }).start()
+            dispatcher.submit('push', 'push', {}, 'push')
+            dispatcher.submit('other', 'push', {}, 'push')
+            dispatcher.submit('status', 'status', {}, 'status')
+            expect(done.wait(1)).to(be_true)
+            expect(dispatcher.get('other').state).to(equal(QUEUED))
+            release.set()
+            dispatcher.stop()
+            expect(dispatcher.get('status').output).to(equal('fast'))
@@ -0,0 +1,66 @@
+from hookshub.executor import Executor
+from expects import *
+from mock import patch, Mock
+
+
+with description('Executor'):
+    with context('Shared pool'):
+        with it('must start the pool once and reuse it'):
+            with Executor(1, max_tasks=2) as executor:
+                pool = executor._pool
+                executor.start()
+                expect(executor._pool).to(be(pool))
+                expect(executor.started).to(be_true)
+            expect(executor.started).to(be_false)
+
+        with it('must run tasks on the workers of the pool'):
+            with Executor(2) as executor:
+                results = [
+                    executor.apply_async(abs, args=(-num,))
+                    for num in range(4)
+                ]
+                expect([res.get(timeout=10) for res in results]).to(
+                    equal([0, 1, 2, 3])
+                )
+                stats = executor.stats()
+                expect(stats['submitted']).to(equal(4))
+                expect(stats['queued']).to(equal(0))
+                expect(stats['running']).to(equal(0))
+
+        with it('must not close the shared pool when a parser closes it'):
+            with Executor(1) as executor:
+                executor.close()
+                expect(executor.is_healthy()).to(be_true)
+                expect(executor.apply_async(abs, args=(-1,)).get(
+                    timeout=10)).to(equal(1))
+
+    with context('Health checks'):
+        with it('must restart the pool when it is not healthy'):
+            with Executor(1) as executor:
+                broken = executor._pool
+                broken.terminate()
+                expect(executor.is_healthy()).to(be_false)
+                expect(executor.check_health()).to(be_false)
+                expect(executor._pool).not_to(be(broken))
+                expect(executor.is_healthy()).to(be_true)
+                expect(executor.stats()['restarts']).to(equal(1))
+
+    with context('Stats'):
+        with it('must report pool size, queue depth and utilization'):
+            with patch('hookshub.executor.Pool') as pooler:
+                pending = Mock()
+                pending.ready.return_value = False
+                pool = Mock()
+                pool.apply_async.return_value = pending
+                pool._pool = []
+                pooler.return_value = pool
+                executor = Executor(2)
+                executor.start()
+                executor.is_healthy = lambda: True
+                for num in range(3):
+                    executor.apply_async(abs, args=(num,))
+                stats = executor.stats()
+                expect(stats['processes']).to(equal(2))
+                expect(stats['running']).to(equal(2))
+                expect(stats['queued']).to(equal(1))
+                expect(stats['utilization']).to(equal(1.0))
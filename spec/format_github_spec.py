@@ -807,7 +807,7 @@ with description('GitHub Utils'):
     # get_pr
     with context('Get Pull Request'):
         with it('Must return code with get request (Mocked)'):
-            with patch("hookshub.hooks.github.requests") as req_get:
+            with patch("hookshub.client.ApiClient.get") as req_get:
                 req_get.start()
 
                 class MockedReturn:
@@ -815,7 +815,7 @@ with description('GitHub Utils'):
                         self.status_code = status_code
                         self.text = dumps(text)
 
-                req_get.get.return_value = MockedReturn(
+                req_get.return_value = MockedReturn(
                     200, [
                             {
                                 'id': 1,
@@ -833,7 +833,7 @@ with description('GitHub Utils'):
 
         with it('Must rise an internal error if did not get a 200 status'
                 ' response (Mocked)'):
-            with patch("hookshub.hooks.github.requests") as req_get:
+            with patch("hookshub.client.ApiClient.get") as req_get:
                 req_get.start()
 
                 class MockedReturn:
@@ -841,7 +841,7 @@ with description('GitHub Utils'):
                         self.status_code = status_code
                         self.text = dumps(text)
 
-                req_get.get.return_value = MockedReturn(
+                req_get.return_value = MockedReturn(
                     300, []
                 )
                 code, log = util.get_pr(
@@ -852,7 +852,7 @@ with description('GitHub Utils'):
 
         with it('Must rise an internal error if did not get any matching prs'
                 ' response (Mocked)'):
-            with patch("hookshub.hooks.github.requests") as req_get:
+            with patch("hookshub.client.ApiClient.get") as req_get:
                 req_get.start()
 
 
@@ -862,7 +862,7 @@ with description('GitHub Utils'):
                         self.text = dumps(text)
 
 
-                req_get.get.return_value = MockedReturn(
+                req_get.return_value = MockedReturn(
                     200, []
                 )
                 code, log = util.get_pr(
@@ -873,7 +873,7 @@ with description('GitHub Utils'):
 
         with it('Must rise an internal error if an http exception is thrown'
                 ' (Mocked)'):
-            with patch("hookshub.hooks.github.requests.get") as req_get:
+            with patch("hookshub.client.ApiClient.get") as req_get:
                 req_get.start()
                 req_get.side_effect = requests.HTTPError('Mocked Error')
                 code, log = util.get_pr(
@@ -884,7 +884,7 @@ with description('GitHub Utils'):
 
         with it('Must rise an internal error if a connection exception is'
                 ' thrown (Mocked)'):
-            with patch("hookshub.hooks.github.requests.get") as req_get:
+            with patch("hookshub.client.ApiClient.get") as req_get:
                 req_get.start()
                 req_get.side_effect = requests.ConnectionError('Mocked Error')
                 code, log = util.get_pr(
@@ -895,7 +895,7 @@ with description('GitHub Utils'):
 
         with it('Must rise an internal error if a request exception is'
                 ' thrown (Mocked)'):
-            with patch("hookshub.hooks.github.requests.get") as req_get:
+            with patch("hookshub.client.ApiClient.get") as req_get:
                 req_get.start()
                 req_get.side_effect = requests.RequestException('Mocked Error')
                 code, log = util.get_pr(
@@ -913,7 +913,7 @@ with description('GitHub Utils'):
     # post_comment_pr
     with context('Post Comment On PR'):
         with it('Must return a 201 status code if all OK (Mocked)'):
-            with patch("hookshub.hooks.github.requests.post") as req_get:
+            with patch("hookshub.client.ApiClient.post") as req_get:
                 req_get.start()
 
                 class MockedReturn:
@@ -929,7 +929,7 @@ with description('GitHub Utils'):
                 req_get.stop()
 
         with it('Must return a error code if status code != 201 (Mocked)'):
-            with patch("hookshub.hooks.github.requests.post") as req_get:
+            with patch("hookshub.client.ApiClient.post") as req_get:
                 req_get.start()
 
 
@@ -948,7 +948,7 @@ with description('GitHub Utils'):
 
         with it('Must raise an internal error if a connection exception'
                 ' is thrown (Mocked)'):
-            with patch("hookshub.hooks.github.requests.post") as req_get:
+            with patch("hookshub.client.ApiClient.post") as req_get:
                 req_get.start()
                 req_get.side_effect = requests.ConnectionError('Mocked Error')
                 code, log = util.post_comment_pr(
@@ -959,7 +959,7 @@ with description('GitHub Utils'):
 
         with it('Must raise an internal error if a http exception'
                 ' is thrown (Mocked)'):
-            with patch("hookshub.hooks.github.requests.post") as req_get:
+            with patch("hookshub.client.ApiClient.post") as req_get:
                 req_get.start()
                 req_get.side_effect = requests.HTTPError('Mocked Error')
                 code, log = util.post_comment_pr(
@@ -970,7 +970,7 @@ with description('GitHub Utils'):
 
         with it('Must raise an internal error if a request exception'
                 ' is thrown (Mocked)'):
-            with patch("hookshub.hooks.github.requests.post") as req_get:
+            with patch("hookshub.client.ApiClient.post") as req_get:
                 req_get.start()
                 req_get.side_effect = requests.RequestException('Mocked Error')
                 code, log = util.post_comment_pr(
@@ -981,7 +981,7 @@ with description('GitHub Utils'):
 
         with it('Must raise an internal error if an internal exception'
                 ' is thrown (Mocked)'):
-            with patch("hookshub.hooks.github.requests.post") as req_get:
+            with patch("hookshub.client.ApiClient.post") as req_get:
                 req_get.start()
                 req_get.side_effect = Exception('Mocked Error')
                 code, log = util.post_comment_pr(
@@ -1046,3 +1046,43 @@ with description('GitHub Utils'):
             for key in util.actions.keys():
                 name = actions.get(key, False)
                 expect(name).to(equal(util.actions[key]))
+
+    with context('Event classification'):
+        with it('must use the event sent on the X-GitHub-Event header'):
+            data = open(join(data_path, 'push.json')).read()
+            with patch.object(util, 'decode_event') as decode_event:
+                hook = github(loads(data), 'push')
+                expect(hook.event).to(equal('push'))
+                expect(decode_event.called).to(be_false)
+
+        with it('must decode the event when the header is not known'):
+            data = open(join(data_path, 'push.json')).read()
+            hook = github(loads(data), 'True')
+            expect(hook.event).to(equal('push'))
+
+        with it('must decode the event only once per webhook'):
+            data = open(join(data_path, 'pull_request.json')).read()
+            with patch.object(
+                    util, 'decode_event', return_value='pull_request'
+            ) as decode_event:
+                hook = github(loads(data))
+                hook.branch_name
+                hook.number
+                hook.merged
+                hook.closed
+                expect(hook.event).to(equal('pull_request'))
+                expect(decode_event.call_count).to(equal(1))
+
+        with it('must decode the same event as the payload keys tell'):
+            for file, event in [
+                ('create.json', 'create'),
+                ('delete.json', 'delete'),
+                ('issue_comment.json', 'issue_comment'),
+                ('issues.json', 'issues'),
+                ('pull_request_review.json', 'pull_request_review_comment'),
+                ('commit_comment.json', 'commit_comment'),
+                ('watch.json', 'watch'),
+                ('public.json', 'public'),
+            ]:
+                data = loads(open(join(data_path, file)).read())
+                expect(util.decode_event(data)).to(equal(event))
@@ -517,7 +517,7 @@ with description('GitLab Utils'):
     # post_comment_pr
     with context('Post Comment On PR'):
         with it('Must return a 201 status code if all OK (Mocked)'):
-            with patch("hookshub.hooks.gitlab.requests.post") as req_get:
+            with patch("hookshub.client.ApiClient.post") as req_get:
                 req_get.start()
 
                 class MockedReturn:
@@ -533,7 +533,7 @@ with description('GitLab Utils'):
                 req_get.stop()
                 
         with it('Must return a error code if status code != 201 (Mocked)'):
-            with patch("hookshub.hooks.gitlab.requests.post") as req_get:
+            with patch("hookshub.client.ApiClient.post") as req_get:
                 req_get.start()
 
 
@@ -552,7 +552,7 @@ with description('GitLab Utils'):
 
         with it('Must raise an internal error if a connection exception'
                 ' is thrown (Mocked)'):
-            with patch("hookshub.hooks.gitlab.requests.post") as req_get:
+            with patch("hookshub.client.ApiClient.post") as req_get:
                 req_get.start()
                 req_get.side_effect = requests.ConnectionError('Mocked Error')
                 code, log = util.post_comment_mr(
@@ -563,7 +563,7 @@ with description('GitLab Utils'):
 
         with it('Must raise an internal error if a http exception'
                 ' is thrown (Mocked)'):
-            with patch("hookshub.hooks.gitlab.requests.post") as req_get:
+            with patch("hookshub.client.ApiClient.post") as req_get:
                 req_get.start()
                 req_get.side_effect = requests.HTTPError('Mocked Error')
                 code, log = util.post_comment_mr(
@@ -574,7 +574,7 @@ with description('GitLab Utils'):
 
         with it('Must raise an internal error if a request exception'
                 ' is thrown (Mocked)'):
-            with patch("hookshub.hooks.gitlab.requests.post") as req_get:
+            with patch("hookshub.client.ApiClient.post") as req_get:
                 req_get.start()
                 req_get.side_effect = requests.RequestException('Mocked Error')
                 code, log = util.post_comment_mr(
@@ -585,7 +585,7 @@ with description('GitLab Utils'):
 
         with it('Must raise an internal error if an internal exception'
                 ' is thrown (Mocked)'):
-            with patch("hookshub.hooks.gitlab.requests.post") as req_get:
+            with patch("hookshub.client.ApiClient.post") as req_get:
                 req_get.start()
                 req_get.side_effect = Exception('Mocked Error')
                 code, log = util.post_comment_mr(
@@ -117,3 +117,33 @@ with description('HooksHub/Hook'):
                 expect(get_hooks(event=GitHubUtil.events['EVENT_PULL_REQUEST'],
                                  repository='test_repo', branch='test')).to(
                     equal([(hook_data.name, hook_data.hook)]))
+
+    with context('Reloading Hooks'):
+        with it('must only scan the plugins when the fingerprint changes'):
+            from hookshub import hook
+            with patch('hookshub.hook.scan_plugins') as scan:
+                with patch('hookshub.hook.plugins_fingerprint') as fingerprint:
+                    fingerprint.return_value = 'first'
+                    expect(hook.reload_hooks(force=True)).to(be_true)
+                    expect(hook.reload_hooks()).to(be_false)
+                    expect(scan.call_count).to(equal(1))
+                    fingerprint.return_value = 'second'
+                    expect(hook.reload_hooks()).to(be_true)
+                    expect(scan.call_count).to(equal(2))
+
+        with it('must scan the plugins when forced'):
+            from hookshub import hook
+            with patch('hookshub.hook.scan_plugins') as scan:
+                with patch('hookshub.hook.plugins_fingerprint') as fingerprint:
+                    fingerprint.return_value = 'same'
+                    hook.reload_hooks()
+                    expect(hook.reload_hooks(force=True)).to(be_true)
+                    expect(scan.call_count).to(equal(2))
+
+        with it('must change the fingerprint when sys.path changes'):
+            from hookshub.hook import plugins_fingerprint
+            import sys
+            before = plugins_fingerprint()
+            expect(plugins_fingerprint()).to(equal(before))
+            with patch.object(sys, 'path', sys.path + ['/not/a/path']):
+                expect(plugins_fingerprint()).not_to(equal(before))
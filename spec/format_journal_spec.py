@@ -0,0 +1,210 @@
+from os import listdir
+from os.path import join
+from time import sleep
+from hookshub.journal import Journal
+from hookshub.dispatcher import Dispatcher
+from hookshub.parser import TempDir
+from expects import *
+
+
+def ok_handler(event, payload):
+    return 0, 'All Ok on {}'.format(event)
+
+
+with description('Journal'):
+    with before.each:
+        self.tmp = TempDir()
+        self.path = join(self.tmp.dir, 'journal')
+
+    with after.each:
+        self.tmp.__exit__(None, None, None)
+
+    with context('Appending records'):
+        with it('must give consecutive offsets and read them back in order'):
+            journal = Journal(self.path)
+            offsets = [journal.append({'num': num}) for num in range(3)]
+            expect(offsets).to(equal([0, 1, 2]))
+            expect([r['num'] for o, r in journal.read()]).to(
+                equal([0, 1, 2]))
+            expect([o for o, r in journal.read(1)]).to(equal([1, 2]))
+            journal.close()
+
+        with it('must start a new segment when the current one is full'):
+            journal = Journal(self.path, segment_size=64)
+            for num in range(4):
+                journal.append({'data': 'x' * 40, 'num': num})
+            expect(journal.stats()['segments']).to(equal(4))
+            expect([o for o, r in journal.read(2)]).to(equal([2, 3]))
+            journal.close()
+
+    with context('Acknowledging records'):
+        with it('must only commit up to the first record not acked'):
+            journal = Journal(self.path)
+            for num in range(3):
+                journal.append({'num': num})
+            expect(journal.ack(1)).to(equal(-1))
+            expect(journal.ack(0)).to(equal(1))
+            expect([o for o, r in journal.pending()]).to(equal([2]))
+            journal.close()
+
+        with it('must resume from the committed offset when reopened'):
+            journal = Journal(self.path)
+            for num in range(3):
+                journal.append({'num': num})
+            journal.ack(0)
+            journal.close()
+            journal = Journal(self.path)
+            expect(journal.committed).to(equal(0))
+            expect([r['num'] for o, r in journal.pending()]).to(
+                equal([1, 2]))
+            expect(journal.append({'num': 3})).to(equal(3))
+            journal.close()
+
+        with it('must remove the segments with only committed records'):
+            journal = Journal(self.path, segment_size=64)
+            for num in range(3):
+                journal.append({'data': 'x' * 40, 'num': num})
+            journal.ack(0)
+            journal.ack(1)
+            expect(journal.stats()['segments']).to(equal(1))
+            logs = [n for n in listdir(self.path) if n.endswith('.log')]
+            expect(logs).to(have_length(1))
+            journal.close()
+
+    with context('After a crash'):
+        with it('must drop a record written halfway'):
+            journal = Journal(self.path)
+            journal.append({'num': 0})
+            journal.append({'num': 1})
+            log_path = journal.segments[-1].log_path
+            journal.close()
+            with open(log_path, 'r+b') as log:
+                log.seek(-3, 2)
+                log.truncate()
+            journal = Journal(self.path)
+            expect([r['num'] for o, r in journal.pending()]).to(equal([0]))
+            expect(journal.append({'num': 2})).to(equal(1))
+            journal.close()
+
+        with it('must sync the last records once the interval passes'):
+            from mock import patch
+            from hookshub.journal import Segment
+            journal = Journal(self.path, sync_every=100, sync_interval=0.05)
+            with patch.object(Segment, 'sync') as sync:
+                journal.append({'num': 0})
+                journal.append({'num': 1})
+                for attempt in range(50):
+                    if sync.called:
+                        break
+                    sleep(0.01)
+                expect(sync.call_count).to(equal(1))
+                journal.close()
+                expect(sync.call_count).to(equal(2))
+
+    with context('On a dispatcher'):
+        with it('must run again the deliveries not acknowledged'):
+            journal = Journal(self.path)
+            dispatcher = Dispatcher(ok_handler, journal=journal)
+            dispatcher.submit('first', 'push', {'hook': 'webhook'})
+            dispatcher.submit('second', 'status', {'hook': 'webhook'})
+            dispatcher.run(dispatcher.queue.get())
+            journal.close()
+
+            journal = Journal(self.path)
+            dispatcher = Dispatcher(ok_handler, journal=journal)
+            expect(dispatcher.recover()).to(equal(1))
+            delivery = dispatcher.queue.get()
+            expect(delivery.id).to(equal('second'))
+            expect(delivery.payload).to(equal({'hook': 'webhook'}))
+            dispatcher.run(delivery)
+            expect(journal.committed).to(equal(1))
+            journal.close()
+
+        with it('must leave the queued deliveries to the journal on stop'):
+            from threading import Event
+            release = Event()
+
+            def handler(event, payload):
+                release.wait(1)
+                return 0, 'All Ok'
+            journal = Journal(self.path)
+            dispatcher = Dispatcher(handler, workers=1, journal=journal)
+            dispatcher.start()
+            running = dispatcher.submit('running', 'push', {'num': 0})
+            queued = dispatcher.submit('queued', 'push', {'num': 1})
+            for attempt in range(50):
+                if running.state == 'running':
+                    break
+                sleep(0.01)
+            release.set()
+            dispatcher.stop()
+            expect(running.state).to(equal('done'))
+            expect(queued.state).to(equal('queued'))
+            expect([r['id'] for o, r in journal.pending()]).to(
+                equal(['queued']))
+            journal.close()
+
+        with it('must queue the spilled deliveries as others finish'):
+            journal = Journal(self.path)
+            dispatcher = Dispatcher(ok_handler, journal=journal)
+            dispatcher.submit('queued', 'push', {'hook': 'webhook'})
+            spilled = dispatcher.spill('spilled', 'status', {'num': 1})
+            expect(spilled.state).to(equal('spilled'))
+            expect(spilled.payload).to(be_none)
+            expect(dispatcher.stats()['spilled']).to(equal(1))
+            expect(dispatcher.queue.qsize()).to(equal(1))
+            dispatcher.run(dispatcher.queue.get())
+            delivery = dispatcher.queue.get()
+            expect(delivery).to(be(spilled))
+            expect(delivery.payload).to(equal({'num': 1}))
+            dispatcher.run(delivery)
+            expect(journal.committed).to(equal(1))
+            journal.close()
+
+        with it('must queue the spilled deliveries of a lane before others'):
+            journal = Journal(self.path)
+            dispatcher = Dispatcher(
+                ok_handler, journal=journal, capacity=lambda: False
+            )
+            lane = ('repo', 'master')
+            first = dispatcher.spill('first', 'push', {'num': 0}, lane=lane)
+            other = dispatcher.spill(
+                'other', 'push', {'num': 1}, lane=('other', 'master'))
+            dispatcher.submit('second', 'push', {'num': 2}, lane=lane)
+            expect(dispatcher.queue.get()).to(be(first))
+            expect(dispatcher.queue.empty()).to(be_true)
+            expect(other.state).to(equal('spilled'))
+            dispatcher.run(first)
+            expect(dispatcher.queue.get().id).to(equal('second'))
+            journal.close()
+
+        with it('must run a spilled delivery on an idle dispatcher'):
+            journal = Journal(self.path)
+            dispatcher = Dispatcher(
+                ok_handler, journal=journal, drain_interval=0.05
+            ).start()
+            spilled = dispatcher.spill('spilled', 'status', {'num': 1})
+            for attempt in range(40):
+                if spilled.state == 'done':
+                    break
+                sleep(0.05)
+            dispatcher.stop()
+            expect(spilled.state).to(equal('done'))
+            expect(spilled.output).to(equal('All Ok on status'))
+            journal.close()
+
+        with it('must keep the spilled deliveries until there is room'):
+            journal = Journal(self.path)
+            room = [False]
+            dispatcher = Dispatcher(
+                ok_handler, journal=journal, capacity=lambda: room[0]
+            )
+            dispatcher.submit('queued', 'push', {'hook': 'webhook'})
+            spilled = dispatcher.spill('spilled', 'status', {'num': 1})
+            dispatcher.run(dispatcher.queue.get())
+            expect(spilled.state).to(equal('spilled'))
+            expect(dispatcher.drain()).to(equal(0))
+            room[0] = True
+            expect(dispatcher.drain()).to(equal(1))
+            expect(dispatcher.queue.get()).to(be(spilled))
+            journal.close()
@@ -57,6 +57,25 @@ with description('Application Requests'):
                 expect(data).not_to(equal(ping_data))
                 HookParser.stop()
 
+        with it('Must tell the actions still running as pending'):
+            with patch('hookshub.listener.HookParser') as HookParser:
+                parser = Mock()
+                parser.__enter__ = Mock(return_value=parser)
+                parser.__exit__ = Mock(return_value=False)
+                parser.pending = ['still running']
+                parser.run_event_actions.return_value = (
+                    0, '[build.py]:Pending!\n')
+                parser.run_event_hooks.return_value = (0, '')
+                HookParser.return_value = parser
+                pending = []
+                code, output = listener.run_event(
+                    'push', {}, pending=pending
+                )
+            expect(code).to(equal(0))
+            expect(output).to(contain('Pending with 0 on push'))
+            expect(output).to(contain('Success with 0 on push'))
+            expect(pending).to(equal([parser.pending]))
+
         with it('Must make an abort response with hook parser message'):
             from hookshub.parser import HookParser
             from os.path import join
@@ -116,6 +135,205 @@ with description('Application Requests'):
                 }
                 expect(response.status_code).to(equal(400))
 
+        with it('Must accept the hook and answer 202 on fast-ack mode'):
+            from os.path import join
+            from json import loads, dumps
+            from hookshub.dispatcher import Dispatcher
+
+            data_path = join(
+                self.project_path, 'test_data', 'github', 'gollum.json')
+            with open(data_path, 'r') as f:
+                hook_data = dumps(loads(f.read()))
+            hook_headers = {
+                'X-GitHub-Event': 'gollum',
+                'X-GitHub-Delivery': 'a-delivery-id',
+                'Content-Length': len(hook_data)
+            }
+            handler = Mock(return_value=(0, 'All OK'))
+            dispatcher = Dispatcher(handler)
+            with patch.object(listener, 'dispatcher', dispatcher):
+                response = self.client.post(
+                    '/', data=hook_data, headers=hook_headers
+                )
+                expect(response.status_code).to(equal(202))
+                data = loads(response.data)
+                expect(data['delivery']).to(equal('a-delivery-id'))
+                expect(handler.called).to(be_false)
+
+                delivery = dispatcher.queue.get()
+                expect(delivery.kind).to(equal('gollum'))
+                dispatcher.run(delivery)
+                expect(handler.call_args[0][0]).to(equal('gollum'))
+                expect(handler.call_args[0][1]).to(equal(loads(hook_data)))
+
+                response = self.client.get('/deliveries/a-delivery-id')
+                expect(response.status_code).to(equal(200))
+                data = loads(response.data)
+                expect(data['state']).to(equal('done'))
+                expect(data['output']).to(equal('All OK'))
+
+                response = self.client.get('/deliveries/unknown-id')
+                expect(response.status_code).to(equal(404))
+
+        with it('Must skip a delivery already received'):
+            from os.path import join
+            from json import loads, dumps
+            from hookshub.dedup import DeliveryCache
+
+            data_path = join(
+                self.project_path, 'test_data', 'github', 'gollum.json')
+            with open(data_path, 'r') as f:
+                hook_data = dumps(loads(f.read()))
+            hook_headers = {
+                'X-GitHub-Event': 'gollum',
+                'X-GitHub-Delivery': 'a-redelivered-id',
+                'Content-Length': len(hook_data)
+            }
+            with patch.object(listener, 'deliveries', DeliveryCache()):
+                with patch('hookshub.listener.run_event') as run_event:
+                    run_event.return_value = (0, 'All OK')
+                    response = self.client.post(
+                        '/', data=hook_data, headers=hook_headers
+                    )
+                    expect(loads(response.data)['msg']).to(equal('All OK'))
+                    response = self.client.post(
+                        '/', data=hook_data, headers=hook_headers
+                    )
+                    expect(response.status_code).to(equal(200))
+                    expect(loads(response.data)['msg']).to(
+                        equal('Duplicate'))
+                    expect(run_event.call_count).to(equal(1))
+
+        with it('Must run again a delivery that failed'):
+            from os.path import join
+            from json import loads, dumps
+            from hookshub.dedup import DeliveryCache
+
+            data_path = join(
+                self.project_path, 'test_data', 'github', 'gollum.json')
+            with open(data_path, 'r') as f:
+                hook_data = dumps(loads(f.read()))
+            hook_headers = {
+                'X-GitHub-Event': 'gollum',
+                'Content-Length': len(hook_data)
+            }
+            with patch.object(listener, 'deliveries', DeliveryCache()):
+                with patch('hookshub.listener.run_event') as run_event:
+                    run_event.return_value = (-1, 'Failed')
+                    for attempt in range(2):
+                        response = self.client.post(
+                            '/', data=hook_data, headers=hook_headers
+                        )
+                        expect(response.status_code).to(equal(500))
+                    expect(run_event.call_count).to(equal(2))
+
+        with it('Must run again a delivery that raised'):
+            from os.path import join
+            from json import loads, dumps
+            from hookshub.dedup import DeliveryCache
+
+            data_path = join(
+                self.project_path, 'test_data', 'github', 'gollum.json')
+            with open(data_path, 'r') as f:
+                hook_data = dumps(loads(f.read()))
+            hook_headers = {
+                'X-GitHub-Event': 'gollum',
+                'X-GitHub-Delivery': 'a-raising-id',
+                'Content-Length': len(hook_data)
+            }
+            with patch.object(listener, 'deliveries', DeliveryCache()):
+                with patch('hookshub.listener.run_event') as run_event:
+                    run_event.side_effect = [Exception('Mocked'), (0, 'OK')]
+                    response = self.client.post(
+                        '/', data=hook_data, headers=hook_headers
+                    )
+                    expect(response.status_code).to(equal(500))
+                    response = self.client.post(
+                        '/', data=hook_data, headers=hook_headers
+                    )
+                    expect(loads(response.data)['msg']).to(equal('OK'))
+                    expect(run_event.call_count).to(equal(2))
+
+        with it('Must run again a delivery that failed after the fast-ack'):
+            from os.path import join
+            from json import loads, dumps
+            from hookshub.dispatcher import Dispatcher
+            from hookshub.dedup import DeliveryCache
+
+            data_path = join(
+                self.project_path, 'test_data', 'github', 'gollum.json')
+            with open(data_path, 'r') as f:
+                hook_data = dumps(loads(f.read()))
+            hook_headers = {
+                'X-GitHub-Event': 'gollum',
+                'X-GitHub-Delivery': 'a-failed-id',
+                'Content-Length': len(hook_data)
+            }
+            handler = Mock(return_value=(-1, 'Failed'))
+            dispatcher = Dispatcher(handler, failed=listener.forget_failed)
+            with patch.object(listener, 'deliveries', DeliveryCache()):
+                with patch.object(listener, 'dispatcher', dispatcher):
+                    for attempt in range(2):
+                        response = self.client.post(
+                            '/', data=hook_data, headers=hook_headers
+                        )
+                        expect(response.status_code).to(equal(202))
+                        dispatcher.run(dispatcher.queue.get())
+                    expect(handler.call_count).to(equal(2))
+
+        with it('Must answer busy when a limit is reached'):
+            from json import loads
+            from hookshub.admission import AdmissionControl, QUEUED
+            admission = AdmissionControl(
+                lambda: {QUEUED: 10}, max_queued=10, retry_after=5
+            )
+            with patch.object(listener, 'admission', admission):
+                with patch('hookshub.listener.run_event') as run_event:
+                    response = self.client.post(
+                        '/', data='{}', headers={'X-GitHub-Event': 'push'}
+                    )
+                    expect(response.status_code).to(equal(503))
+                    expect(response.headers['Retry-After']).to(equal('5'))
+                    expect(loads(response.data)['limit']).to(equal(QUEUED))
+                    expect(run_event.called).to(be_false)
+                response = self.client.get('/stats')
+                expect(loads(response.data)['admission']['pressure']).to(
+                    equal(1.0))
+
+        with it('Must return the executor stats'):
+            from json import loads
+            executor = Mock()
+            executor.stats.return_value = {'processes': 4, 'queued': 0}
+            with patch.object(listener, 'executor', executor):
+                response = self.client.get('/stats')
+                data = loads(response.data)
+                expect(response.status_code).to(equal(200))
+                expect(data['executor']).to(equal(
+                    {'processes': 4, 'queued': 0}
+                ))
+
+        with it('Must return the resources used by the actions'):
+            from json import loads
+            from hookshub.usage import UsageStats
+            usage = UsageStats()
+            usage.add('build.py', 'repo', {'wall': 2.0, 'max_rss': 1024})
+            with patch.object(listener, 'action_usage', usage):
+                response = self.client.get('/stats')
+                data = loads(response.data)
+                build = data['actions']['repo']['build.py']
+                expect(build['runs']).to(equal(1))
+                expect(build['wall']).to(equal(2.0))
+                expect(build['max_rss']).to(equal(1024))
+
+        with it('Must return the requests of the API client'):
+            from json import loads
+            metrics = {'GET api.github.com': {'requests': 2, 'errors': 0}}
+            with patch('hookshub.listener.client_metrics',
+                       return_value=metrics):
+                response = self.client.get('/stats')
+                data = loads(response.data)
+                expect(data['api']).to(equal(metrics))
+
 
 with description('Listener Methods'):
     with context('Given a list of arguments'):
@@ -159,6 +377,12 @@ with description('Listener Methods'):
 
                     logging.stop()
 
+        with it('Must return the number of workers as an option'):
+            args = ['listener.py', '--port=1234', '--workers=4']
+            with patch.object(listener, 'argv', args):
+                expect(listener.get_options()).to(equal({'workers': 4}))
+                expect(listener.get_args()[1]).to(equal(1234))
+
         with it('Must log usage and quit with --help'):
             args = [
                 'listener.py',
@@ -230,3 +454,113 @@ with description('Listener Methods'):
                         isfile.stop()
                     sentry.stop()
                 logging.stop()
+
+        with it('Must start the shared executor once'):
+            with patch('hookshub.listener.Sentry') as sentry:
+                with patch('hookshub.listener.Executor') as executor_cls:
+                    executor = Mock()
+                    executor.start.return_value = executor
+                    executor_cls.return_value = executor
+                    app_mock = Mock()
+                    app_mock.run.return_value = True
+                    listener.application = app_mock
+                    listener.start_listening('1.2.3.4', 1234, 3)
+                    expect(executor_cls.call_count).to(equal(1))
+                    expect(executor_cls.call_args[0][0]).to(equal(3))
+                    expect(executor.start.called).to(be_true)
+                    expect(listener.executor).to(be(executor))
+
+        with it('Must stop the deliveries and actions on SIGTERM'):
+            import signal
+            with patch('hookshub.listener.Sentry'):
+                with patch('hookshub.listener.Executor'):
+                    with patch('hookshub.listener.serve') as serve:
+                        with patch('hookshub.listener.stop_actions') as stop:
+                            serve.side_effect = \
+                                lambda *args: listener.stop_listening()
+                            listener.run_listener('1.2.3.4', 1234, 3)
+                            expect(signal.getsignal(signal.SIGTERM)).to(
+                                equal(listener.stop_listening))
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            stop.assert_called_once_with(grace=listener.STOP_TIMEOUT)
+
+        with it('Must map the priority classes to the events sent'):
+            classes = listener.priority_classes({
+                'fast': {'events': ['EVENT_STATUS', 'watch'], 'workers': 4}
+            })
+            expect(classes['fast']['events']).to(equal(['status', 'watch']))
+            expect(classes['fast']['workers']).to(equal(4))
+
+        with it('Must match the events of a class sent by GitLab'):
+            classes = listener.priority_classes({
+                'builds': {'events': ['EVENT_ISSUE', 'EVENT_PUSH_TAG']}
+            })
+            expect(classes['builds']['events']).to(
+                equal(['issues', 'issue', 'tag_push']))
+
+        with it('Must run the events of a class on its pool when not queued'):
+            from hookshub.config import Config
+            config = Config({'priority_classes': {
+                'fast': {'events': ['EVENT_STATUS'], 'processes': 1}
+            }})
+            expect(listener.priority_of(config, 'push', 'status')).to(
+                equal('fast'))
+            expect(listener.priority_of(config, 'push')).to(be_none)
+            fast = Mock()
+            with patch('hookshub.listener.HookParser') as HookParser:
+                parser = Mock()
+                parser.__enter__ = Mock(return_value=parser)
+                parser.__exit__ = Mock(return_value=False)
+                parser.pending = []
+                parser.hook.event = 'status'
+                parser.run_event_actions.return_value = (0, '')
+                parser.run_event_hooks.return_value = (0, '')
+                HookParser.return_value = parser
+                with patch.object(listener.settings, '_current', config):
+                    with patch.object(listener, 'executors', {'fast': fast}):
+                        listener.run_event('status', {})
+            expect(parser.executor).to(be(fast))
+
+        with it('Must keep the backlog given with a single worker'):
+            with patch('hookshub.listener.run_listener') as run_listener:
+                with patch('hookshub.listener.bind_tcp') as bind_tcp:
+                    listener.start_listening('1.2.3.4', 1234, 2, backlog=64)
+            bind_tcp.assert_called_once_with('1.2.3.4', 1234, 64)
+            run_listener.assert_called_once_with(
+                '1.2.3.4', 1234, 2, bind_tcp.return_value)
+
+        with it('Must fork the workers after loading the plugins'):
+            with patch('hookshub.listener.Supervisor') as supervisor_cls:
+                with patch('hookshub.listener.bind_tcp') as bind_tcp:
+                    with patch('hookshub.hook.reload_hooks') as reload_hooks:
+                        listener.start_listening('1.2.3.4', 1234, 2,
+                                                 workers=3)
+                        expect(reload_hooks.called).to(be_true)
+            bind_tcp.assert_called_once_with(
+                '1.2.3.4', 1234, listener.DEFAULT_BACKLOG)
+            expect(supervisor_cls.call_args[0][0]).to(equal(3))
+            expect(supervisor_cls.return_value.run.called).to(be_true)
+            target = supervisor_cls.call_args[0][1]
+            expect(target.args).to(equal(
+                ('1.2.3.4', 1234, 2, bind_tcp.return_value)
+            ))
+
+        with it('Must give each worker its own files'):
+            expect(listener.worker_path('/var/journal', 2)).to(
+                equal('/var/journal.2'))
+            expect(listener.worker_path('/var/journal')).to(
+                equal('/var/journal'))
+            expect(listener.worker_path(None, 2)).to(be_none)
+
+        with it('Must tell the options each worker applies on its own'):
+            expect(listener.per_worker_options({
+                'fast_ack': True, 'max_events': 10, 'dedup': True,
+                'dedup_path': '/var/deliveries', 'coalesce_pushes': False
+            })).to(equal(['fast_ack', 'max_events']))
+            expect(listener.per_worker_options({'dedup': True})).to(
+                equal(['dedup']))
+
+        with it('Must force a plugin reload on SIGUSR1'):
+            with patch('hookshub.hook.reload_hooks') as reload_hooks:
+                listener.reload_plugins()
+                reload_hooks.assert_called_once_with(force=True)
@@ -0,0 +1,131 @@
+from os.path import join, isdir, isfile
+from hookshub.mirrors import MirrorCache, repository_dir, run_git
+from hookshub.parser import TempDir
+from expects import *
+from mock import patch, Mock
+
+
+def make_repository(path, name):
+    repository = join(path, name)
+    run_git(['init', '-q', repository])
+    commit(repository, 'README')
+    return repository
+
+
+def commit(repository, filename):
+    with open(join(repository, filename), 'w') as f:
+        f.write(filename)
+    run_git(['add', filename], cwd=repository)
+    run_git([
+        '-c', 'user.name=HooksHub', '-c', 'user.email=hooks@hub',
+        'commit', '-q', '-m', filename
+    ], cwd=repository)
+
+
+with description('Mirror Cache'):
+    with before.each:
+        self.tmp = TempDir()
+        self.origin = make_repository(self.tmp.dir, 'origin-repo')
+        self.mirrors = MirrorCache(join(self.tmp.dir, 'mirrors'))
+        self.work = join(self.tmp.dir, 'work')
+        run_git(['init', '-q', self.work])
+
+    with after.each:
+        self.tmp.__exit__(None, None, None)
+
+    with it('must name the clone like git does'):
+        expect(repository_dir('git@github.com:gisce/hookshub.git')).to(
+            equal('hookshub'))
+        expect(repository_dir('https://github.com/gisce/hookshub/')).to(
+            equal('hookshub'))
+
+    with it('must clone from a local mirror of the repository'):
+        log, code, err = self.mirrors.clone_on_dir(
+            self.work, 'origin-repo', self.origin
+        )
+        expect(code).to(equal(0))
+        clone = join(self.work, 'origin-repo')
+        expect(isfile(join(clone, 'README'))).to(be_true)
+        expect(isdir(self.mirrors.mirror_path(self.origin))).to(be_true)
+        url, code, err = run_git(
+            ['config', 'remote.origin.url'], cwd=clone
+        )
+        expect(url.strip()).to(equal(self.origin))
+
+    with it('must fetch the mirror instead of cloning it again'):
+        self.mirrors.clone_on_dir(self.work, 'origin-repo', self.origin)
+        commit(self.origin, 'NEW')
+        work = join(self.tmp.dir, 'other-work')
+        run_git(['init', '-q', work])
+        with patch('hookshub.mirrors.run_git', wraps=run_git) as git:
+            log, code, err = self.mirrors.clone_on_dir(
+                work, 'origin-repo', self.origin, 'master'
+            )
+            commands = [call[0][0][:3] for call in git.call_args_list]
+        expect(code).to(equal(0))
+        expect(isfile(join(work, 'origin-repo', 'NEW'))).to(be_true)
+        expect(commands[0]).to(equal(
+            ['--git-dir', self.mirrors.mirror_path(self.origin), 'fetch']
+        ))
+
+    with it('must fail with the clone error log'):
+        log, code, err = self.mirrors.clone_on_dir(
+            self.work, 'missing', join(self.tmp.dir, 'missing')
+        )
+        expect(code).not_to(equal(0))
+        expect(err).to(start_with(':clone_repository_fail::'))
+        expect(isdir(self.mirrors.mirror_path(
+            join(self.tmp.dir, 'missing')))).to(be_false)
+
+    with it('must evict the least recently used mirrors over budget'):
+        other = make_repository(self.tmp.dir, 'other-repo')
+        self.mirrors.clone_on_dir(self.work, 'origin-repo', self.origin)
+        self.mirrors.budget = 0
+        self.mirrors.clone_on_dir(self.work, 'other-repo', other)
+        expect(isdir(self.mirrors.mirror_path(self.origin))).to(be_false)
+        expect(isdir(self.mirrors.mirror_path(other))).to(be_true)
+
+    with it('must not evict the mirrors locked by other deliveries'):
+        other = make_repository(self.tmp.dir, 'other-repo')
+        self.mirrors.clone_on_dir(self.work, 'origin-repo', self.origin)
+        self.mirrors.clone_on_dir(self.work, 'other-repo', other)
+        self.mirrors.budget = 0
+        locked_mirror = self.mirrors.mirror_path(self.origin)
+        with patch.object(self.mirrors, 'mirrors') as mirrors:
+            mirrors.return_value = [
+                locked_mirror, self.mirrors.mirror_path(other)
+            ]
+            with open('{}.lock'.format(locked_mirror), 'a') as lock_file:
+                import fcntl
+                # flock locks are per open file, so this one conflicts with
+                #   the one taken by the cache
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                expect(self.mirrors.evict()).to(equal([]))
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        expect(isdir(locked_mirror)).to(be_true)
+
+    with it('must only be used when a mirror path is configured'):
+        with patch.dict('os.environ', {}, clear=True):
+            expect(MirrorCache.from_environment()).to(be_none)
+        with patch.dict('os.environ', {
+            'HOOKSHUB_MIRROR_PATH': join(self.tmp.dir, 'env-mirrors'),
+            'HOOKSHUB_MIRROR_BUDGET': '100'
+        }):
+            mirrors = MirrorCache.from_environment()
+            expect(mirrors.path).to(equal(join(self.tmp.dir, 'env-mirrors')))
+            expect(mirrors.budget).to(equal(100 * 1024 * 1024))
+
+    with it('must be used by the utils to clone when configured'):
+        from hookshub.hooks.github import GitHubUtil
+        from hookshub.hooks.gitlab import GitLabUtil
+        with patch('hookshub.mirrors.MirrorCache.from_environment') as env:
+            env.return_value = self.mirrors
+            for util in (GitHubUtil, GitLabUtil):
+                work = join(self.tmp.dir, util.__name__)
+                run_git(['init', '-q', work])
+                log, code, err = util.clone_on_dir(
+                    work, 'origin-repo', self.origin
+                )
+                expect(code).to(equal(0))
+                expect(isfile(join(work, 'origin-repo', 'README'))).to(
+                    be_true)
@@ -0,0 +1,74 @@
+from os import listdir
+from os.path import join
+from subprocess import Popen, PIPE
+from StringIO import StringIO
+from hookshub.output import OutputBuffer, read_output
+from hookshub.parser import TempDir
+from expects import *
+
+
+with description('Action Output'):
+    with context('Buffer'):
+        with it('must keep all the output under the cap'):
+            output = OutputBuffer(cap=100)
+            output.write('first\n')
+            output.write('second\n')
+            expect(output.getvalue()).to(equal('first\nsecond\n'))
+            expect(output.truncated).to(be_false)
+
+        with it('must keep the last lines over the cap, after a marker'):
+            output = OutputBuffer(cap=10)
+            for num in range(5):
+                output.write('line {}\n'.format(num))
+            expect(output.getvalue()).to(
+                equal('[... 28 bytes truncated ...]\nline 4\n'))
+            expect(output.dropped).to(equal(28))
+            expect(output.size).to(equal(7))
+
+        with it('must write all the output to the log'):
+            log = StringIO()
+            log.name = 'action.log'
+            output = OutputBuffer(cap=10, log=log)
+            for num in range(5):
+                output.write('line {}\n'.format(num))
+            expect(log.getvalue()).to(equal(''.join(
+                'line {}\n'.format(num) for num in range(5))))
+            expect(output.getvalue()).to(start_with(
+                '[... 28 bytes truncated, full output on action.log ...]'))
+
+    with context('Reading an action'):
+        with before.each:
+            self.tmp = TempDir()
+
+        with after.each:
+            self.tmp.__exit__(None, None, None)
+
+        with it('must read the output and the error output as written'):
+            proc = Popen(
+                ['sh', '-c', 'seq 1 1000; echo failed >&2'],
+                stdout=PIPE, stderr=PIPE
+            )
+            stdout, stderr, log_path = read_output(
+                'action', proc.stdout, proc.stderr, cap=20
+            )
+            expect(proc.wait()).to(equal(0))
+            expect(stdout).to(end_with('\n998\n999\n1000\n'))
+            expect(stdout).to(start_with('[... '))
+            expect(stderr).to(equal('failed\n'))
+            expect(log_path).to(be_none)
+
+        with it('must write the whole output to a log file'):
+            proc = Popen(
+                ['sh', '-c', 'seq 1 1000'], stdout=PIPE, stderr=PIPE
+            )
+            stdout, stderr, log_path = read_output(
+                'action.py', proc.stdout, proc.stderr, cap=20,
+                log_dir=self.tmp.dir
+            )
+            proc.wait()
+            expect(listdir(self.tmp.dir)).to(have_length(1))
+            expect(log_path).to(start_with(join(self.tmp.dir, 'action.py-')))
+            with open(log_path, 'r') as log:
+                expect(log.read().splitlines()).to(
+                    equal([str(num) for num in range(1, 1001)]))
+            expect(stdout).to(contain(log_path))
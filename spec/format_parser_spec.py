@@ -4,6 +4,7 @@ from hookshub.parser import HookParser
 from expects import *
 from mamba import *
 from mock import patch, Mock
+from StringIO import StringIO
 
 my_path = normpath(abspath(dirname(__file__)))
 project_path = dirname(my_path)              # Project Directory
@@ -159,9 +160,8 @@ with description('Hook Parser'):
             webhook_data_path = join(
                 data_path, join('webhook', 'default_event')
             )
-            config = join(
-                data_path, join('webhook', 'conf.json')
-            )
+            with open(join(data_path, 'webhook', 'conf.json'), 'r') as conf:
+                config = loads(conf.read())
             with patch("hookshub.parser.Popen") as popen:
                 with patch('hookshub.parser.logging') as logging:
                     logging.start()
@@ -180,12 +180,14 @@ with description('Hook Parser'):
                     res_code = 0
                     popen.start()
                     popen_mock = Mock()
-                    popen_mock.communicate.return_value = [res_out, res_err]
-                    popen_mock.returncode = res_code
+                    popen_mock.stdout = StringIO(res_out)
+                    popen_mock.stderr = StringIO(res_err)
                     popen.return_value = popen_mock
-                    stdout, stderr, returncode, pid = run_action(
-                        parser.event, hook, config
-                    )
+                    with patch('hookshub.parser.wait_usage') as wait_usage:
+                        wait_usage.return_value = (res_code, {})
+                        stdout, stderr, returncode, pid = run_action(
+                            parser.event, hook, config
+                        )
                     expect(stdout).to(equal(res_out))
                     expect(stderr).to(equal(res_err))
                     expect(returncode).to(equal(res_code))
@@ -198,9 +200,8 @@ with description('Hook Parser'):
             webhook_data_path = join(
                 data_path, join('webhook', 'default_event')
             )
-            config = join(
-                data_path, join('webhook', 'conf.json')
-            )
+            with open(join(data_path, 'webhook', 'conf.json'), 'r') as conf:
+                config = loads(conf.read())
             with patch("hookshub.parser.Popen") as popen:
                 with patch('hookshub.parser.logging') as logging:
                     logging.start()
@@ -219,12 +220,14 @@ with description('Hook Parser'):
                     res_code = -1
                     popen.start()
                     popen_mock = Mock()
-                    popen_mock.communicate.return_value = [res_out, res_err]
-                    popen_mock.returncode = res_code
+                    popen_mock.stdout = StringIO(res_out)
+                    popen_mock.stderr = StringIO(res_err)
                     popen.return_value = popen_mock
-                    stdout, stderr, returncode, pid = run_action(
-                        parser.event, hook, config
-                    )
+                    with patch('hookshub.parser.wait_usage') as wait_usage:
+                        wait_usage.return_value = (res_code, {})
+                        stdout, stderr, returncode, pid = run_action(
+                            parser.event, hook, config
+                        )
                     expect(stdout).to(equal(res_out))
                     expect(stderr).to(equal(res_err))
                     expect(returncode).to(equal(res_code))
@@ -370,7 +373,7 @@ with description('Hook Parser'):
                                             procs=1)
                         res = parser.run_event_hooks(def_conf=default_conf)
                         expected_code = 0
-                        expected_log = '[hook_name]:Success!\n'
+                        expected_log = '[hook_name]:Pending!\n'
                         expect(res).to(equal((expected_code, expected_log)))
 
         with it('must run successfully all hooks'):
@@ -480,3 +483,471 @@ with description('Hook Parser'):
             webhook_data = loads(open(webhook_data_path, 'r').read())
             hook = HookParser.instancer(webhook_data)
             expect(hook.origin).to(equal('github'))
+
+    with context('Shared executor'):
+        with it('must run the actions on the executor instead of a new pool'):
+            webhook_data_path = join(
+                data_path, join('webhook', 'default_event')
+            )
+            config_file = join(data_path, 'webhook', 'conf.json')
+            with open(config_file, 'r') as conf:
+                config = loads(conf.read())
+            with patch('hookshub.parser.Pool') as pooler:
+                proc = Mock()
+                proc.ready.return_value = True
+                proc.get.return_value = ('All Ok\n', '', 0, 0)
+                executor = Mock()
+                executor.processes = 2
+                executor.apply_async.return_value = proc
+                parser = HookParser(webhook_data_path, 'default_event',
+                                    executor=executor)
+                result, log = parser.run_event_actions(config)
+                expect(result).to(equal(0))
+                expect(pooler.called).to(be_false)
+                expect(executor.apply_async.called).to(be_true)
+
+        with it('must close the pool created when there is no executor'):
+            webhook_data_path = join(
+                data_path, join('webhook', 'default_event')
+            )
+            config_file = join(data_path, 'webhook', 'conf.json')
+            with open(config_file, 'r') as conf:
+                config = loads(conf.read())
+            with patch('hookshub.parser.Pool') as pooler:
+                proc = Mock()
+                proc.ready.return_value = True
+                proc.get.return_value = ('All Ok\n', '', 0, 0)
+                pool = Mock()
+                pool.apply_async.return_value = proc
+                pooler.return_value = pool
+                parser = HookParser(webhook_data_path, 'default_event')
+                parser.run_event_actions(config)
+                expect(pool.close.called).to(be_true)
+
+    with context('Concurrent actions'):
+        with it('must submit all actions before waiting for any of them'):
+            webhook_data_path = join(
+                data_path, join('webhook', 'default_event')
+            )
+            submitted_on_wait = []
+            results = {
+                'first.py': ('', 'Bad\n', -1, 0),
+                'second.py': ('Ok\n', '', 0, 0),
+            }
+            pool = Mock()
+
+            def apply_async(func, args, callback):
+                action = args[0]
+                proc = Mock()
+                proc.wait.side_effect = lambda timeout: \
+                    submitted_on_wait.append(pool.apply_async.call_count)
+                proc.ready.return_value = True
+                proc.get.return_value = results[action]
+                # Second action completes before the first one
+                if action == 'second.py':
+                    callback(results[action])
+                return proc
+            pool.apply_async.side_effect = apply_async
+
+            with patch('hookshub.parser.logging'):
+                parser = HookParser(webhook_data_path, 'default_event',
+                                    executor=pool)
+                code, log = parser._run_actions(
+                    pool, ['first.py', 'second.py'], {}, timeout=1
+                )
+                callback = pool.apply_async.call_args_list[0][1]['callback']
+                callback(results['first.py'])
+            expect(submitted_on_wait).to(equal([2, 2]))
+            # The failure of the first action does not stop the second one
+            expect(code).to(equal(-1))
+            expect(log).to(contain('[first.py]:Failed!'))
+            expect(log).to(contain('[second.py]:Success!'))
+            # Results are reported as they complete
+            expect(log.index('[second.py]')).to(
+                be_below(log.index('[first.py]')))
+
+        with it('must report the actions that failed to run'):
+            webhook_data_path = join(
+                data_path, join('webhook', 'default_event')
+            )
+            proc = Mock()
+            proc.ready.return_value = True
+            proc.get.side_effect = Exception('Mocked Failure')
+            pool = Mock()
+            pool.apply_async.return_value = proc
+            with patch('hookshub.parser.logging'):
+                parser = HookParser(webhook_data_path, 'default_event')
+                code, log = parser._run_actions(
+                    pool, ['default_event.py'], {}, timeout=1
+                )
+            expect(code).to(equal(-1))
+            expect(log).to(contain('Mocked Failure'))
+
+        with it('must wait for all the actions under a single deadline'):
+            slow = Mock()
+            slow.ready.return_value = False
+            fast = Mock()
+            fast.ready.return_value = True
+            finished, running = HookParser.wait_all(
+                [('slow', slow), ('fast', fast)], [], 0
+            )
+            expect(finished).to(equal(['fast']))
+            expect(running).to(equal(['slow']))
+            expect(slow.wait.call_args[1]['timeout']).to(equal(0))
+            expect(fast.wait.call_args[1]['timeout']).to(equal(0))
+
+        with it('must stop waiting for the actions once cancelled'):
+            from threading import Event
+            cancel = Event()
+            slow = Mock()
+            slow.ready.return_value = False
+            slow.wait.side_effect = lambda timeout: cancel.set()
+            finished, running = HookParser.wait_all(
+                [('slow', slow)], [], 60, cancel
+            )
+            expect(running).to(equal(['slow']))
+            expect(slow.wait.call_count).to(equal(1))
+
+        with it('must not run the actions of a cancelled event'):
+            from threading import Event
+            cancel = Event()
+            cancel.set()
+            payload = {'hook': 'webhook', 'event': 'default_event'}
+            pool = Mock()
+            with patch('hookshub.parser.logging'):
+                parser = HookParser(payload=payload, event='default_event',
+                                    executor=pool, cancel=cancel)
+                code, log = parser.run_event_actions({})
+            expect(code).to(equal(0))
+            expect(log).to(contain('Superseded'))
+            expect(pool.apply_async.called).to(be_false)
+
+    with context('Payload'):
+        with it('must decode the payload only once'):
+            webhook_data_path = join(
+                data_path, join('webhook', 'default_event')
+            )
+            with open(webhook_data_path, 'r') as f:
+                raw_payload = f.read()
+            with patch('hookshub.parser.json') as json_mock:
+                json_mock.loads.return_value = loads(raw_payload)
+                parser = HookParser(payload=raw_payload, event='default_event')
+                expect(parser.payload).to(equal(loads(raw_payload)))
+                expect(parser.payload).to(be(parser.payload))
+                expect(json_mock.loads.call_count).to(equal(1))
+
+        with it('must use a decoded payload without any file'):
+            payload = {'hook': 'webhook', 'event': 'default_event'}
+            with HookParser(payload=payload, event='default_event') as parser:
+                expect(parser.payload).to(be(payload))
+                expect(parser.payload_file).to(be_none)
+                expect(parser.hook.event).to(equal('default_event'))
+
+        with it('must read the payload file only once'):
+            webhook_data_path = join(
+                data_path, join('webhook', 'default_event')
+            )
+            parser = HookParser(webhook_data_path, 'default_event')
+            with patch('hookshub.parser.open', create=True) as open_mock:
+                parser.payload
+                expect(open_mock.called).to(be_false)
+
+        with it('must need a payload or a payload file'):
+            expect(lambda: HookParser(event='default_event')).to(
+                raise_error(ValueError))
+
+    with context('Shared payload'):
+        with it('must write the payload once to a read-only file'):
+            from os import stat
+            from os.path import isfile
+            from hookshub.parser import SharedPayload
+            payload = SharedPayload('{"hook": "webhook"}')
+            expect(open(payload.path).read()).to(
+                equal('{"hook": "webhook"}'))
+            expect(stat(payload.path).st_mode & 0o777).to(equal(0o400))
+            payload.release()
+            expect(isfile(payload.path)).to(be_false)
+
+        with it('must remove the file once the actions are done'):
+            from os.path import isfile
+            from threading import Event
+            from time import sleep
+            from hookshub.parser import SharedPayload
+            done = Event()
+            task = Mock()
+            task.ready.return_value = False
+            task.wait.side_effect = lambda: done.wait(5)
+            payload = SharedPayload('{}')
+            payload.release([task])
+            expect(isfile(payload.path)).to(be_true)
+            done.set()
+            for attempt in range(50):
+                if not isfile(payload.path):
+                    break
+                sleep(0.01)
+            expect(isfile(payload.path)).to(be_false)
+
+        with it('must give the same file to all the actions of an event'):
+            from os.path import isfile
+            webhook_data_path = join(
+                data_path, join('webhook', 'default_event')
+            )
+            proc = Mock()
+            proc.ready.return_value = True
+            proc.get.return_value = ('', '', 0, 1)
+            pool = Mock()
+            pool.apply_async.return_value = proc
+            with patch('hookshub.parser.logging'):
+                parser = HookParser(webhook_data_path, 'default_event')
+                paths = []
+                pool.apply_async.side_effect = lambda func, args, callback: \
+                    paths.append(open(args[3]).read()) or proc
+                parser._run_actions(pool, ['first.py', 'second.py'], {}, 1)
+            calls = pool.apply_async.call_args_list
+            path = calls[0][1]['args'][3]
+            expect(calls[1][1]['args'][3]).to(equal(path))
+            expect(loads(paths[0])).to(equal(parser.payload))
+            expect(paths[1]).to(equal(paths[0]))
+            expect(isfile(path)).to(be_false)
+
+        with it('must run an action on the shared file without a temp dir'):
+            from hookshub.parser import run_action
+            hook = Mock()
+            hook.get_exe_action.return_value = ['action', '/shm/p', 'push']
+            with patch('hookshub.parser.Popen') as popen:
+                with patch('hookshub.parser.TempDir') as tmp_dir:
+                    with patch('hookshub.parser.logging'):
+                        popen.return_value.stdout = StringIO('All Ok')
+                        popen.return_value.stderr = StringIO('')
+                        with patch('hookshub.parser.wait_usage') as wait:
+                            wait.return_value = (0, {})
+                            stdout, stderr, code, pid = run_action(
+                                'action', hook, {}, '/shm/p')
+            expect(code).to(equal(0))
+            expect(tmp_dir.called).to(be_false)
+            hook.get_exe_action.assert_called_with('action', {}, '/shm/p')
+            expect(popen.call_args[0][0]).to(
+                equal(['action', '/shm/p', 'push']))
+
+    with context('Zygote'):
+        with it('must run the Python actions on the zygote'):
+            from hookshub.parser import exec_action, TempDir
+            from hookshub.zygote import Zygote
+            with TempDir() as tmp:
+                path = join(tmp.dir, 'action.py')
+                with open(path, 'w') as action:
+                    action.write('print "zygote"\n')
+                with patch('hookshub.parser.Popen') as popen:
+                    with patch('hookshub.parser.logging'):
+                        result = exec_action(
+                            'action.py', [path], Zygote(preload=[]))
+            expect(result[:3]).to(equal(('zygote\n', '', 0)))
+            expect(popen.called).to(be_false)
+
+        with it('must run the other actions on a new process'):
+            from hookshub.parser import exec_action
+            zygote = Mock()
+            with patch('hookshub.parser.logging'):
+                result = exec_action('true', ['true'], zygote)
+            expect(result[:3]).to(equal(('', '', 0)))
+            expect(zygote.spawn.called).to(be_false)
+
+    with context('Action output'):
+        with it('must keep only the end of a long output'):
+            from hookshub.parser import exec_action
+            with patch('hookshub.parser.logging'):
+                stdout, stderr, code, pid = exec_action(
+                    'seq', ['seq', '1', '1000'], cap=20)
+            expect(code).to(equal(0))
+            expect(stdout).to(start_with('[... '))
+            expect(stdout).to(end_with('\n1000\n'))
+
+        with it('must use the cap and the log directory of the config'):
+            from hookshub.parser import run_action
+            hook = Mock()
+            hook.get_exe_action.return_value = ['action', '/shm/p', 'push']
+            with patch('hookshub.parser.exec_action') as exec_action:
+                exec_action.return_value = ('', '', 0, 1)
+                with patch('hookshub.parser.logging'):
+                    run_action('action', hook, {
+                        'action_output_cap': 10, 'action_log_path': '/logs',
+                        'action_timeout': '10'
+                    }, '/shm/p')
+            exec_action.assert_called_with(
+                'action', ['action', '/shm/p', 'push'], None,
+                cap=10, log_dir='/logs', soft_deadline=1200,
+                hard_deadline=1260, groups=None
+            )
+
+    with context('Action deadlines'):
+        with it('must terminate an action at its soft deadline'):
+            from hookshub.parser import exec_action
+            with patch('hookshub.parser.logging'):
+                result = exec_action(
+                    'sleep', ['sleep', '30'], soft_deadline=0.2)
+            expect(result.state).to(equal('terminated'))
+            expect(result[2]).to(equal(-15))
+            expect(result[1]).to(contain('soft deadline'))
+
+        with it('must kill an action ignoring SIGTERM with what it started'):
+            from time import time
+            from hookshub.parser import exec_action
+            script = 'trap "" TERM; sleep 30 & sleep 30'
+            started = time()
+            with patch('hookshub.parser.logging'):
+                result = exec_action(
+                    'sh', ['sh', '-c', script], soft_deadline=0.1,
+                    hard_deadline=0.3)
+            expect(result.state).to(equal('killed'))
+            expect(result[2]).to(equal(-9))
+            # The output is closed once the background sleep is gone too
+            expect(time() - started).to(be_below(5))
+
+        with it('must fail an action stopped at its deadline'):
+            from hookshub.parser import ActionResult
+            webhook_data_path = join(
+                data_path, join('webhook', 'default_event')
+            )
+            proc = Mock()
+            proc.ready.return_value = True
+            proc.get.return_value = ActionResult('', '', 0, 1, 'terminated')
+            pool = Mock()
+            pool.apply_async.return_value = proc
+            with patch('hookshub.parser.logging'):
+                parser = HookParser(webhook_data_path, 'default_event')
+                code, log = parser._run_actions(
+                    pool, ['default_event.py'], {}, timeout=1
+                )
+            expect(code).to(equal(-1))
+            expect(log).to(contain('[default_event.py]:Failed!'))
+
+        with it('must report the actions still running as pending'):
+            from hookshub.parser import ActionResult
+            webhook_data_path = join(
+                data_path, join('webhook', 'default_event')
+            )
+            proc = Mock()
+            proc.ready.return_value = False
+            pool = Mock()
+            pool.apply_async.return_value = proc
+            with patch('hookshub.parser.logging'):
+                parser = HookParser(webhook_data_path, 'default_event')
+                code, log = parser._run_actions(
+                    pool, ['default_event.py'], {}, timeout=0
+                )
+                expect(code).to(equal(0))
+                expect(log).to(contain('[default_event.py]:Pending!'))
+                expect(log).not_to(contain('Success!'))
+                expect(len(parser.pending)).to(equal(1))
+                proc.ready.return_value = True
+                proc.get.return_value = ActionResult(
+                    '', 'Killed', -9, 1, 'killed')
+                code, log = parser.pending.result()
+            expect(code).to(equal(-1))
+            expect(log).to(contain('[default_event.py]:Failed!'))
+
+        with it('must stop the running actions of a cancelled event'):
+            from threading import Event
+            webhook_data_path = join(
+                data_path, join('webhook', 'default_event')
+            )
+            cancel = Event()
+            proc = Mock()
+            proc.ready.return_value = False
+            proc.wait.side_effect = lambda timeout=None: cancel.set()
+            pool = Mock()
+            pool.apply_async.return_value = proc
+            with patch('hookshub.parser.logging'):
+                with patch('hookshub.parser.ProcessGroups') as groups_cls:
+                    parser = HookParser(
+                        webhook_data_path, 'default_event', cancel=cancel
+                    )
+                    code, log = parser._run_actions(
+                        pool, ['default_event.py'], {}, timeout=60
+                    )
+            groups = groups_cls.create.return_value
+            expect(groups.stop.called).to(be_true)
+            expect(pool.apply_async.call_args[1]['args'][5]).to(be(groups))
+            expect(log).to(contain('stopping it'))
+            expect(len(parser.pending)).to(equal(1))
+
+        with it('must not write anything for an event without actions'):
+            webhook_data_path = join(
+                data_path, join('webhook', 'default_event')
+            )
+            with patch('hookshub.parser.logging'):
+                parser = HookParser(webhook_data_path, 'default_event', procs=2)
+                parser.hook = Mock(event_actions=[])
+                with patch('hookshub.parser.SharedPayload') as payload:
+                    with patch('hookshub.parser.ProcessGroups') as groups:
+                        result = parser.run_event_actions({
+                            'github_token': 'GHT', 'gitlab_token': 'GLT',
+                            'vhost_path': 'VHP'
+                        })
+            expect(result).to(equal((0, '')))
+            expect(payload.called).to(be_false)
+            expect(groups.create.called).to(be_false)
+
+        with it('must stop the actions of the events still running'):
+            from hookshub.parser import running_groups, stop_actions
+            groups = Mock()
+            running_groups.add(groups)
+            stop_actions(grace=1)
+            running_groups.discard(groups)
+            groups.stop.assert_called_once_with(1)
+
+        with it('must not start an action once the event is stopped'):
+            from hookshub.parser import exec_action
+            from hookshub.deadline import ProcessGroups
+            groups = ProcessGroups.create()
+            groups.stop()
+            with patch('hookshub.parser.Popen') as popen:
+                with patch('hookshub.parser.logging'):
+                    result = exec_action(
+                        'action', ['action'], groups=groups)
+            groups.remove()
+            expect(popen.called).to(be_false)
+            expect(result.state).to(equal('terminated'))
+
+        with it('must keep the state of a result sent from a worker'):
+            from pickle import loads, dumps
+            from hookshub.parser import ActionResult
+            result = loads(dumps(ActionResult('out', 'err', -9, 1, 'killed')))
+            expect(result).to(equal(('out', 'err', -9, 1)))
+            expect(result.state).to(equal('killed'))
+
+    with context('Action usage'):
+        with it('must give the resources used by the action'):
+            from hookshub.parser import exec_action
+            with patch('hookshub.parser.logging'):
+                result = exec_action('sh', ['sh', '-c', 'sleep 0.1'])
+            expect(result.usage['wall']).to(be_above(0.09))
+            expect(result.usage).to(have_keys(
+                'user', 'system', 'max_rss', 'in_blocks', 'out_blocks'))
+
+        with it('must add up the usage of the actions by repository'):
+            from hookshub.parser import ActionResult
+            from hookshub.usage import UsageStats
+            webhook_data_path = join(
+                data_path, join('webhook', 'default_event')
+            )
+            usage = {'wall': 1.0, 'user': 0.5, 'max_rss': 64}
+            result = ActionResult('', '', 0, 1, 'exited', usage)
+            proc = Mock()
+            proc.ready.return_value = True
+            proc.get.return_value = result
+            pool = Mock()
+            pool.apply_async.return_value = proc
+            stats = UsageStats()
+            with patch('hookshub.parser.logging'):
+                parser = HookParser(webhook_data_path, 'default_event',
+                                    usage=stats)
+                code, log = parser._run_actions(
+                    pool, ['default_event.py'], {}, timeout=1
+                )
+                callback = pool.apply_async.call_args[1]['callback']
+                callback(result)
+            expect(log).to(contain('[default_event.py]:Usage: wall 1.000s'))
+            totals = stats.get('default_event.py', 'default_repository')
+            expect(totals['runs']).to(equal(1))
+            expect(totals['max_rss']).to(equal(64))
@@ -270,3 +270,53 @@ with description('PluginManager'):
                     hooks_cache = [h for h in gen_hooks]
                     expect(hooks_cache).to(equal(hooks))
                     import_method.stop()
+
+    with context('Hooks index'):
+        with before.each:
+            from collections import namedtuple
+            self.hook_data = namedtuple(
+                'HookData', 'name, hook, event, repository, branch'
+            )
+            self.manager = PluginManager()
+            self.manager._hooks_list = [
+                self.hook_data('any', None, False, False, False),
+                self.hook_data('push', None, 'push', False, False),
+                self.hook_data('push_repo', None, 'push', 'repo', False),
+                self.hook_data('push_master', None, 'push', 'repo', 'master'),
+                self.hook_data('repo', None, False, 'repo', False),
+                self.hook_data('status', None, 'status', False, False),
+            ]
+            self.manager._invalidate()
+
+        with it('must return all hooks when there is no context'):
+            names = [h.name for h in self.manager.get_hooks()]
+            expect(names).to(equal(
+                ['any', 'push', 'push_repo', 'push_master', 'repo', 'status']
+            ))
+
+        with it('must match hooks by event, repository and branch,'
+                ' with the hooks that leave a field empty as wildcards'):
+            names = [h.name for h in self.manager.get_hooks(
+                'push', 'repo', 'master')]
+            expect(names).to(equal(
+                ['any', 'push', 'push_repo', 'push_master', 'repo']
+            ))
+            names = [h.name for h in self.manager.get_hooks(
+                'push', 'other', 'master')]
+            expect(names).to(equal(['any', 'push']))
+            names = [h.name for h in self.manager.get_hooks(
+                'status', 'repo', False)]
+            expect(names).to(equal(['any', 'repo', 'status']))
+            names = [h.name for h in self.manager.get_hooks(
+                'push', False, 'dev')]
+            expect(names).to(equal(['any', 'push', 'push_repo', 'repo']))
+
+        with it('must return snapshots that do not change on register'):
+            snapshot = self.manager.get_hooks()
+            expect(snapshot).to(be_a(tuple))
+            expect(self.manager.get_hooks()).to(be(snapshot))
+            self.manager._hooks_list.append(
+                self.hook_data('new', None, False, False, False))
+            self.manager._invalidate()
+            expect(len(snapshot)).to(equal(6))
+            expect(len(self.manager.get_hooks())).to(equal(7))
@@ -0,0 +1,63 @@
+from hookshub.prefork import Supervisor
+from expects import *
+import os
+
+
+def exit_worker(num):
+    os._exit(3)
+
+
+def sleep_worker(num):
+    from time import sleep
+    sleep(30)
+
+
+with description('Supervisor'):
+    with it('must start again the workers that die'):
+        supervisor = Supervisor(2, exit_worker, restart_delay=0)
+        supervisor.running = True
+        for num in range(2):
+            supervisor.spawn(num)
+        supervisor.reap()
+        supervisor.reap()
+        expect(supervisor.restarts).to(equal(2))
+        expect(sorted(supervisor.children.values())).to(equal([0, 1]))
+        supervisor.stop()
+        expect(supervisor.children).to(be_empty)
+
+    with it('must not start the workers again once stopped'):
+        supervisor = Supervisor(1, exit_worker, restart_delay=0)
+        supervisor.spawn(0)
+        supervisor.reap()
+        expect(supervisor.restarts).to(equal(0))
+        expect(supervisor.children).to(be_empty)
+
+    with it('must kill the workers that do not stop'):
+        supervisor = Supervisor(1, sleep_worker, stop_timeout=0.1)
+        supervisor.running = True
+        pid = supervisor.spawn(0)
+        supervisor.stop()
+        expect(supervisor.children).to(be_empty)
+        expect(lambda: os.kill(pid, 0)).to(raise_error(OSError))
+
+    with it('must not kill the workers when reloading their config'):
+        from time import sleep
+        supervisor = Supervisor(1, sleep_worker, stop_timeout=0.1)
+        supervisor.running = True
+        pid = supervisor.spawn(0)
+        sleep(0.2)
+        supervisor.reload()
+        sleep(0.2)
+        expect(os.waitpid(pid, os.WNOHANG)).to(equal((0, 0)))
+        supervisor.stop()
+
+    with it('must send the plugin rescans to the workers'):
+        import signal
+        from mock import patch
+        supervisor = Supervisor(1, sleep_worker)
+        supervisor.children = {1234: 0}
+        with patch('hookshub.prefork.os.kill') as kill:
+            supervisor.reload(signal.SIGUSR1)
+            supervisor.reload()
+        expect(kill.call_args_list[0][0]).to(equal((1234, signal.SIGUSR1)))
+        expect(kill.call_args_list[1][0]).to(equal((1234, signal.SIGHUP)))
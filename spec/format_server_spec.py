@@ -0,0 +1,153 @@
+from threading import Thread
+from hookshub.server import AsyncServer, bind_tcp
+from expects import *
+from mock import patch
+import httplib
+import socket
+
+
+def echo_app(environ, start_response):
+    body = environ['wsgi.input'].read()
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return ['{} {} {} {}'.format(
+        environ['REQUEST_METHOD'], environ['PATH_INFO'],
+        environ.get('HTTP_X_GITHUB_EVENT'), body
+    )]
+
+
+def failing_app(environ, start_response):
+    raise Exception('Mocked Failure')
+
+
+def read_all(sock):
+    data = ''
+    while True:
+        chunk = sock.recv(4096)
+        if not chunk:
+            return data
+        data += chunk
+
+
+with description('Async Server'):
+    with before.each:
+        self.sock = bind_tcp('127.0.0.1', 0)
+        self.port = self.sock.getsockname()[1]
+
+    with after.each:
+        self.server.stop()
+        self.thread.join()
+
+    def serve(self, app):
+        self.server = AsyncServer(app, self.sock, threads=2)
+        self.thread = Thread(
+            target=self.server.serve_forever, kwargs={'poll_interval': 0.1}
+        )
+        self.thread.start()
+
+    with it('must answer several requests on the same connection'):
+        self.serve(echo_app)
+        conn = httplib.HTTPConnection('127.0.0.1', self.port)
+        for num in range(3):
+            conn.request('POST', '/', body='payload{}'.format(num),
+                         headers={'X-GitHub-Event': 'push'})
+            response = conn.getresponse()
+            expect(response.status).to(equal(200))
+            expect(response.read()).to(
+                equal('POST / push payload{}'.format(num)))
+        conn.close()
+
+    with it('must answer many concurrent connections'):
+        self.serve(echo_app)
+        conns = [
+            socket.create_connection(('127.0.0.1', self.port))
+            for num in range(200)
+        ]
+        for conn in conns:
+            conn.sendall('GET /stats HTTP/1.0\r\n\r\n')
+        answers = [read_all(conn) for conn in conns]
+        expect(all(a.startswith('HTTP/1.1 200 OK') for a in answers)).to(
+            be_true)
+        expect(answers[0]).to(end_with('GET /stats None '))
+
+    with it('must refuse chunked posts'):
+        self.serve(echo_app)
+        conn = socket.create_connection(('127.0.0.1', self.port))
+        conn.sendall(
+            'POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n')
+        expect(read_all(conn)).to(start_with('HTTP/1.1 411'))
+
+    with it('must answer pipelined requests in order'):
+        self.serve(echo_app)
+        conn = socket.create_connection(('127.0.0.1', self.port))
+        conn.sendall(
+            'GET /first HTTP/1.1\r\n\r\n'
+            'POST /second HTTP/1.1\r\nContent-Length: 4\r\n\r\nbody'
+            'GET /third HTTP/1.1\r\nConnection: close\r\n\r\n'
+        )
+        answers = read_all(conn).split('HTTP/1.1 200 OK')[1:]
+        expect(len(answers)).to(equal(3))
+        expect(answers[0]).to(end_with('GET /first None '))
+        expect(answers[1]).to(end_with('POST /second None body'))
+        expect(answers[2]).to(contain('Connection: close'))
+        expect(answers[2]).to(end_with('GET /third None '))
+
+    with it('must answer a bad request only once'):
+        from hookshub.server import HttpChannel
+        self.serve(echo_app)
+        left, right = socket.socketpair()
+        with patch.object(HttpChannel, 'respond') as respond:
+            channel = HttpChannel(self.server, left, None)
+            for chunk in range(4):
+                channel.collect_incoming_data('x' * 30 * 1024)
+            channel.found_terminator()
+        expect(respond.call_count).to(equal(1))
+        expect(channel.readable()).to(be_false)
+        left.close()
+        right.close()
+
+    with it('must answer 500 when the application fails'):
+        self.serve(failing_app)
+        conn = httplib.HTTPConnection('127.0.0.1', self.port)
+        conn.request('GET', '/')
+        expect(conn.getresponse().status).to(equal(500))
+
+    with it('must serve on a unix socket'):
+        from os.path import join
+        from os import stat
+        from hookshub.parser import TempDir
+        from hookshub.server import bind_unix
+        tmp = TempDir()
+        path = join(tmp.dir, 'hookshub.sock')
+        self.sock.close()
+        self.sock = bind_unix(path, mode=0o660)
+        expect(stat(path).st_mode & 0o777).to(equal(0o660))
+        self.serve(echo_app)
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.connect(path)
+        conn.sendall('POST /unix HTTP/1.0\r\n\r\n')
+        expect(read_all(conn)).to(end_with('POST /unix None '))
+        tmp.__exit__(None, None, None)
+
+    with it('must bind a unix socket only its owner can use'):
+        from os.path import join
+        from os import stat
+        from hookshub.parser import TempDir
+        from hookshub.server import bind_unix
+        tmp = TempDir()
+        path = join(tmp.dir, 'hookshub.sock')
+        with patch('hookshub.server.os.chmod'):
+            bind_unix(path, mode=0o666).close()
+        expect(stat(path).st_mode & 0o077).to(equal(0))
+        tmp.__exit__(None, None, None)
+
+    with it('must replace a socket left by a previous run'):
+        from os.path import join
+        from hookshub.parser import TempDir
+        from hookshub.server import bind_unix
+        tmp = TempDir()
+        path = join(tmp.dir, 'hookshub.sock')
+        bind_unix(path).close()
+        self.sock.close()
+        self.sock = bind_unix(path)
+        self.serve(echo_app)
+        tmp.__exit__(None, None, None)
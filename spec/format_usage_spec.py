@@ -0,0 +1,44 @@
+from subprocess import Popen
+from hookshub.usage import UsageStats, wait_usage, describe
+from expects import *
+
+
+with description('Action Usage'):
+    with context('Waiting for an action'):
+        with it('must give its return code and the resources it used'):
+            proc = Popen(['sh', '-c', 'i=0; while [ $i -lt 20000 ]; do '
+                          'i=$((i+1)); done; exit 3'])
+            returncode, usage = wait_usage(proc.pid)
+            expect(returncode).to(equal(3))
+            expect(usage['user'] + usage['system']).to(be_above(0))
+            expect(usage['max_rss']).to(be_above(0))
+            expect(usage).to(have_keys('in_blocks', 'out_blocks'))
+
+        with it('must give the signal that killed it'):
+            proc = Popen(['sh', '-c', 'kill -9 $$'])
+            expect(wait_usage(proc.pid)[0]).to(equal(-9))
+
+        with it('must describe the usage for the logs'):
+            expect(describe({'wall': 1.5, 'user': 1, 'max_rss': 2048})).to(
+                equal('wall 1.500s, user 1.000s, system 0.000s, '
+                      'max rss 2048KB, blocks in 0 out 0'))
+
+    with context('Adding up the usage'):
+        with it('must add up each action of each repository'):
+            stats = UsageStats()
+            stats.add('build.py', 'repo', {
+                'wall': 2.0, 'user': 1.0, 'system': 0.5, 'max_rss': 100,
+                'in_blocks': 8, 'out_blocks': 16
+            })
+            stats.add('build.py', 'repo', {
+                'wall': 1.0, 'user': 0.5, 'system': 0.5, 'max_rss': 300,
+                'in_blocks': 0, 'out_blocks': 8
+            })
+            stats.add('build.py', 'other', {'wall': 1.0})
+            expect(stats.get('build.py', 'repo')).to(equal({
+                'runs': 2, 'wall': 3.0, 'user': 1.5, 'system': 1.0,
+                'max_rss': 300, 'in_blocks': 8, 'out_blocks': 24
+            }))
+            expect(stats.stats()).to(have_keys('repo', 'other'))
+            expect(stats.stats()['other']['build.py']['runs']).to(equal(1))
+            expect(stats.get('deploy.py', 'repo')).to(be_none)
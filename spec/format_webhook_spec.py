@@ -67,3 +67,53 @@ with description('Generic hook (webhook) - '):
         expect(hook.get_exe_action(event, config)[0]).to(equal(exe_path))
         expect(hook.get_exe_action(event, config)[1]).to(equal(json_data))
         expect(hook.get_exe_action(event, config)[2]).to(equal(event))
+
+with description('Action index - '):
+    with before.each:
+        from hookshub.parser import TempDir
+        self.tmp = TempDir()
+        for action in ['push.py', 'push_notify', 'push-repo.py',
+                       'push-repo_build', 'push-repo-master.py',
+                       'push-other.py', 'pushed.py', 'status.py']:
+            with open(join(self.tmp.dir, action), 'w') as f:
+                f.write('')
+
+    with after.each:
+        self.tmp.__exit__(None, None, None)
+
+    with it('must match the actions named after event, repository and'
+            ' branch'):
+        from hookshub.hooks.webhook import ActionIndex
+        index = ActionIndex(self.tmp.dir)
+        expect(sorted(index.match('push', 'repo', 'master'))).to(equal(
+            sorted(['push.py', 'push_notify', 'push-repo.py',
+                    'push-repo_build', 'push-repo-master.py'])
+        ))
+        expect(sorted(index.match('push', 'repo', 'dev'))).to(equal(
+            sorted(['push.py', 'push_notify', 'push-repo.py',
+                    'push-repo_build'])
+        ))
+        expect(index.match('status', 'repo', 'None')).to(
+            equal(['status.py']))
+        expect(index.match('watch', 'repo', 'None')).to(equal([]))
+
+    with it('must only list the directory again when it changes'):
+        from os import utime, stat
+        from hookshub.hooks.webhook import ActionIndex
+        index = ActionIndex(self.tmp.dir)
+        expect(index.match('watch', 'repo', 'None')).to(equal([]))
+        with patch('hookshub.hooks.webhook.listdir') as listdir_mock:
+            expect(index.match('push', 'repo', 'master')).not_to(be_empty)
+            expect(listdir_mock.called).to(be_false)
+
+        with open(join(self.tmp.dir, 'watch.py'), 'w') as f:
+            f.write('')
+        mtime = stat(self.tmp.dir).st_mtime + 1
+        utime(self.tmp.dir, (mtime, mtime))
+        expect(index.match('watch', 'repo', 'None')).to(equal(['watch.py']))
+        expect(index.actions).to(contain('watch.py'))
+
+    with it('must share one index per actions directory'):
+        from hookshub.hooks.webhook import get_action_index
+        expect(get_action_index(self.tmp.dir)).to(
+            be(get_action_index(self.tmp.dir)))
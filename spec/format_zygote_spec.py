@@ -0,0 +1,123 @@
+from os.path import join, basename, dirname
+from os import chmod, makedirs, symlink
+from hookshub.zygote import Zygote, is_python_action, get_zygote
+from hookshub.parser import TempDir
+from hookshub.output import read_output
+from expects import *
+from mock import patch
+import sys
+
+
+def script(tmp, name, code, shebang='#!/usr/bin/env python'):
+    path = join(tmp.dir, name)
+    with open(path, 'w') as action:
+        action.write('{}\n{}\n'.format(shebang, code))
+    chmod(path, 0o755)
+    return path
+
+
+def run(zygote, args):
+    pid, out, err = zygote.spawn(args)
+    stdout, stderr, _ = read_output(args[0], out, err, cap=1024)
+    return stdout, stderr, zygote.wait(pid)
+
+
+with description('Zygote'):
+    with before.each:
+        self.tmp = TempDir()
+        self.zygote = Zygote(preload=['json'])
+
+    with after.each:
+        self.tmp.__exit__(None, None, None)
+
+    with context('Python actions'):
+        with it('must tell the scripts it can run'):
+            direct = script(self.tmp, 'action', 'pass',
+                            '#!{}'.format(sys.executable))
+            shell = script(self.tmp, 'shell_action', 'true', '#!/bin/sh')
+            no_shebang = join(self.tmp.dir, 'action.py')
+            with open(no_shebang, 'w') as action:
+                action.write('pass\n')
+            expect(is_python_action(direct)).to(be_true)
+            expect(is_python_action(no_shebang)).to(be_true)
+            expect(is_python_action(shell)).to(be_false)
+            expect(is_python_action(join(self.tmp.dir, 'missing'))).to(
+                be_false)
+
+        with it('must find the python of env on the path'):
+            path = script(self.tmp, 'python_action', 'pass')
+            python = basename(sys.executable)
+            env_python = script(self.tmp, 'env_action', 'pass',
+                                '#!/usr/bin/env {}'.format(python))
+            with patch.dict('os.environ', {'PATH': dirname(sys.executable)}):
+                expect(is_python_action(env_python)).to(be_true)
+            with patch.dict('os.environ', {'PATH': self.tmp.dir}):
+                expect(is_python_action(path)).to(be_false)
+
+        with it('must not run the scripts of another interpreter'):
+            venv = join(self.tmp.dir, 'venv', 'bin')
+            makedirs(venv)
+            symlink('/bin/sh', join(venv, 'python'))
+            other = script(self.tmp, 'venv_action', 'pass',
+                           '#!{}'.format(join(venv, 'python')))
+            expect(is_python_action(other)).to(be_false)
+            env_action = script(self.tmp, 'env_action', 'pass')
+            with patch.dict('os.environ', {'PATH': venv}):
+                expect(is_python_action(env_action)).to(be_false)
+            linked = join(self.tmp.dir, 'python')
+            symlink(sys.executable, linked)
+            expect(is_python_action(script(
+                self.tmp, 'linked_action', 'pass', '#!{}'.format(linked)
+            ))).to(be_true)
+
+    with context('Running actions'):
+        with it('must give the output, error output and exit status'):
+            path = script(self.tmp, 'action.py', '\n'.join([
+                'import sys',
+                'print sys.argv[1], sys.argv[2]',
+                'sys.stderr.write("warning")',
+                'sys.exit(3)'
+            ]))
+            stdout, stderr, code = run(self.zygote, [path, 'payload', 'push'])
+            expect(stdout).to(equal('payload push\n'))
+            expect(stderr).to(equal('warning'))
+            expect(code).to(equal(3))
+
+        with it('must run the script as its main module'):
+            path = script(self.tmp, 'action.py', '\n'.join([
+                'if __name__ == "__main__":',
+                '    print "main"'
+            ]))
+            expect(run(self.zygote, [path])).to(equal(('main\n', '', 0)))
+
+        with it('must fail with the traceback of an exception'):
+            path = script(self.tmp, 'action.py', 'raise ValueError("bad")')
+            stdout, stderr, code = run(self.zygote, [path])
+            expect(code).to(equal(1))
+            expect(stderr).to(contain('ValueError: bad'))
+
+        with it('must give the signal that killed the action'):
+            path = script(self.tmp, 'action.py', '\n'.join([
+                'import os, signal',
+                'os.kill(os.getpid(), signal.SIGKILL)'
+            ]))
+            expect(run(self.zygote, [path])[2]).to(equal(-9))
+
+        with it('must not change the zygote'):
+            argv = list(sys.argv)
+            path = script(self.tmp, 'action.py', '\n'.join([
+                'import sys',
+                'sys.argv = []',
+                'sys.modules.clear()'
+            ]))
+            run(self.zygote, [path])
+            expect(sys.argv).to(equal(argv))
+            expect(self.zygote.loaded).to(equal(['json']))
+
+    with context('Preloading'):
+        with it('must skip the modules not installed'):
+            zygote = Zygote(preload=['json', 'not_a_module']).start()
+            expect(zygote.loaded).to(equal(['json']))
+
+        with it('must keep a zygote per process'):
+            expect(get_zygote(['json'])).to(be(get_zygote(['json'])))